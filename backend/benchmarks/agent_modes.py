@@ -0,0 +1,80 @@
+"""
+Compare the agent modes (ReAct, parallel ReAct, native tool calling) on the same
+conversations.
+
+Runs onboarding journeys (identities cloned from app/mock_data.json) through
+each mode against a real Ollama model and reports, per mode, LLM calls per
+turn, parse failures (unparseable ReAct output or invalid typed tool
+arguments) per LLM call and turn latency.
+
+Run from backend/ (needs Ollama with a tool-calling capable model):
+    OLLAMA_MODEL=gpt-oss:20b python -m benchmarks.agent_modes --customers 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.llm_pool import start_pools  # noqa: E402
+
+
+def run_mode(mode: str, agent, journeys) -> Dict:
+    from app.metrics import MetricsCallbackHandler
+
+    llm_calls, parse_errors, latencies, failed_turns = [], [], [], 0
+    for idx, messages in enumerate(journeys):
+        session_id = f"{mode}-{idx}"
+        for message in messages:
+            handler = MetricsCallbackHandler(mode=mode)
+            t0 = time.perf_counter()
+            try:
+                agent.invoke({"input": message}, config={
+                    "configurable": {"session_id": session_id}, "callbacks": [handler]})
+            except Exception:
+                failed_turns += 1
+            latencies.append(time.perf_counter() - t0)
+            llm_calls.append(handler.llm_calls)
+            parse_errors.append(handler.parse_errors)
+
+    total_calls = sum(llm_calls)
+    return {
+        "turns": len(llm_calls),
+        "failed_turns": failed_turns,
+        "llm_calls_per_turn": round(statistics.fmean(llm_calls), 2) if llm_calls else 0.0,
+        "parse_failures": sum(parse_errors),
+        "parse_failure_rate": round(sum(parse_errors) / total_calls, 3) if total_calls else 0.0,
+        "mean_turn_s": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ReAct vs native tool-calling agent mode")
+    parser.add_argument("--customers", type=int, default=10)
+    parser.add_argument("--modes", default="react,react_parallel,tool_calling")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="agent_modes_"))  # customers.db is relative to cwd
+    from app.agent import get_conversational_agent
+    from benchmarks.chat_load import build_journeys
+
+    modes = args.modes.split(",")
+    agents = {mode: get_conversational_agent(verbose=False, mode=mode) for mode in modes}
+    start_pools()  # the pools of all agents, once; no-op unless OLLAMA_BACKENDS is set
+    results = {}
+    for i, mode in enumerate(modes):
+        # Fresh identities per mode so every mode runs full journeys
+        results[mode] = run_mode(mode, agents[mode], build_journeys(args.customers, start=i * args.customers))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+End-to-end /chat load test with a scripted LLM.
+
+Runs the real FastAPI app (uvicorn, real tools, FAISS and SQLite) with the
+Ollama model swapped for devtools.scripted_llm.ScriptedOnboardingLLM, and
+drives N simulated customers through full onboarding journeys built from the
+identities in app/mock_data.json. The load generator runs in a separate
+process, so its threads do not compete for the server's GIL and RSS is the
+server's alone. A journey stops at the first terminal answer (account
+created, under 18, permit verification failed, ...).
+
+Run from backend/:
+    python -m benchmarks.chat_load --customers 200 --concurrency 20
+    python -m benchmarks.chat_load --save-baseline
+    python -m benchmarks.chat_load --compare
+"""
+
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import tempfile
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+sys.path.insert(0, BACKEND_DIR)
+
+BASELINE_PATH = os.path.join(BACKEND_DIR, "benchmarks", "results", "chat_load_baseline.json")
+
+
+# ---------------------------
+# HELPERS
+# ---------------------------
+def rss_mb() -> float:
+    """Resident set size of this process in MB (Linux)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def build_journeys(n: int, start: int = 0) -> List[List[str]]:
+    """
+    One journey per simulated customer. Each customer clones a mock_data.json
+    identity under a fresh national ID so every journey runs to completion.
+    """
+    from app.registry_api import MOCK_DATA
+    templates = [(c, nid, rec) for c, records in MOCK_DATA.items() for nid, rec in records.items()]
+    journeys = []
+    for i in range(start, start + n):
+        country, nid, record = templates[i % len(templates)]
+        new_id = f"9{i:08d}{nid[-3:]}"
+        MOCK_DATA[country][new_id] = copy.deepcopy(record)
+        messages = ["Hi, I want to become a customer", f"{country} {new_id}"]
+        if record.get("residencePermitNumber"):
+            messages.append(record["residencePermitNumber"])
+        messages.append("Yes")
+        journeys.append(messages)
+    return journeys
+
+
+def start_server(port: int):
+    import uvicorn
+    import main
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    return server
+
+
+# ---------------------------
+# CLIENT (separate process)
+# ---------------------------
+def drive_load(url: str, journeys: List[List[str]], concurrency: int) -> Dict:
+    """Run every journey against `url` with `concurrency` client threads."""
+    from devtools.scripted_llm import is_terminal
+
+    latencies: List[float] = []
+    errors = completed = rejected = 0
+    lock = threading.Lock()
+
+    def run_journey(idx: int):
+        nonlocal errors, completed, rejected
+        session_id = f"load-{idx}"
+        session = requests.Session()
+        answer = ""
+        for message in journeys[idx]:
+            t0 = time.perf_counter()
+            try:
+                resp = session.post(url, json={"session_id": session_id, "message": message}, timeout=120)
+                ok = resp.status_code == 200
+                body = resp.json() if ok else {}
+                answer = body.get("response", "")
+                if body.get("session_token"):
+                    session.headers["X-Session-Token"] = body["session_token"]
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed)
+                errors += 0 if ok else 1
+            if is_terminal(answer):
+                break
+        with lock:
+            if answer.startswith("Account created"):
+                completed += 1
+            elif is_terminal(answer):
+                rejected += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run_journey, range(len(journeys))))
+    return {"latencies": latencies, "errors": errors, "completed": completed, "rejected": rejected,
+            "duration": time.perf_counter() - started}
+
+
+# ---------------------------
+# LOAD TEST
+# ---------------------------
+def run(customers: int, concurrency: int, llm_latency: float, port: int) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="chat_load_")
+    os.chdir(workdir)  # customers.db is created relative to cwd
+
+    import main
+    from app.admission import AdmissionScheduler
+    from app.agent import get_conversational_agent
+    from devtools.scripted_llm import ScriptedOnboardingLLM
+
+    # verbose=False: the executor's stdout tracing would dominate the measurement
+    main.conv_agent = get_conversational_agent(llm=ScriptedOnboardingLLM(latency=llm_latency), verbose=False)
+    # Every simulated customer connects from 127.0.0.1; keep the scheduler, drop the rate limits
+    main.admission = AdmissionScheduler(session_rate=0, ip_rate=0)
+
+    journeys = build_journeys(customers)
+    server = start_server(port)
+    url = f"http://127.0.0.1:{port}/chat"
+
+    # Warm-up request so model/index loading is not counted
+    requests.post(url, json={"session_id": "warmup", "message": "hi"}, timeout=120)
+
+    rss_start = rss_mb()
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as client:
+        load = client.submit(drive_load, url, journeys, concurrency).result()
+    rss_end = rss_mb()
+    latencies, duration = load["latencies"], load["duration"]
+    server.should_exit = True
+
+    return {
+        "customers": customers,
+        "concurrency": concurrency,
+        "llm_latency_s": llm_latency,
+        "requests": len(latencies),
+        "errors": load["errors"],
+        "completed_journeys": load["completed"],
+        "rejected_journeys": load["rejected"],
+        "duration_s": round(duration, 3),
+        "req_per_s": round(len(latencies) / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "rss_start_mb": round(rss_start, 1),
+        "rss_end_mb": round(rss_end, 1),
+        "rss_growth_mb": round(rss_end - rss_start, 1),
+        "rss_growth_kb_per_customer": round((rss_end - rss_start) * 1024 / customers, 2) if customers else 0.0,
+    }
+
+
+def compare(result: Dict, baseline: Dict, tolerance: float) -> bool:
+    """Print deltas against the baseline; return False if a metric regressed beyond tolerance."""
+    ok = True
+    checks = [("req_per_s", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("rss_growth_mb", False)]
+    for key, higher_is_better in checks:
+        base, cur = baseline.get(key), result.get(key)
+        if not base:
+            continue
+        delta = (cur - base) / base
+        regressed = delta < -tolerance if higher_is_better else delta > tolerance
+        ok = ok and not regressed
+        print(f"  {key:<16} baseline={base:<10} current={cur:<10} delta={delta:+.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end /chat load test with a scripted LLM")
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the scripted LLM sleeps per call")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write results to {BASELINE_PATH}")
+    parser.add_argument("--compare", action="store_true", help="Compare against the saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--out", help="Also write results JSON to this path")
+    args = parser.parse_args()
+
+    result = run(args.customers, args.concurrency, args.llm_latency, args.port)
+    print(json.dumps(result, indent=2))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {BASELINE_PATH}")
+    if args.compare:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        print("Comparison against baseline:")
+        if not compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Time-to-first-token with the stable-prefix prompt layout vs. the legacy layout.
+
+The legacy layout baked the date into the rules header, so every prompt that
+crosses a date boundary (day rollover, workers started on different days,
+restarts) diverges from the cached prefix early and the whole prompt is
+re-evaluated. The current layout (app.prompts) keeps rules + tool
+descriptions byte-stable and moves TODAY/HISTORY/USER/THOUGHTS to the end.
+
+Both layouts are sent to an Ollama endpoint with the same request mix, and
+TTFT is measured from the streamed /api/generate response.
+
+By default the date changes once per `--dates` block of consecutive requests,
+like a day rollover, so the two layouts differ only on the few requests right
+after a change. `--interleave` alternates the date on every request instead;
+with a single KV slot that is a synthetic upper bound on the gain, not a
+production estimate.
+
+Run from backend/ against a real model:
+    python -m benchmarks.prompt_prefix_ttft --base-url http://localhost:11434 --model gpt-oss:20b
+or offline against the fake server's prefix-cache simulation:
+    python -m devtools.fake_ollama --port 11500 --latency 0.05 --prefill-per-token 0.0005
+    python -m benchmarks.prompt_prefix_ttft --base-url http://127.0.0.1:11500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+sys.path.insert(0, BACKEND_DIR)
+
+USER_MESSAGES = [
+    "Hi, I want to become a customer",
+    "DK 0101901234",
+    "What documents do I need in Sweden?",
+    "I live in Norway and my ID is 05029012345",
+    "Yes",
+]
+
+
+def render_tools() -> str:
+    from langchain_core.tools import render_text_description
+    from app.tools import get_tools
+    return render_text_description(get_tools())
+
+
+def tool_names() -> str:
+    from app.tools import get_tools
+    return ", ".join(t.name for t in get_tools())
+
+
+def current_prompt(tools: str, names: str, today: str, history: str, user: str) -> str:
+    from app.prompts import get_agent_prompt_template
+    return get_agent_prompt_template().format(
+        tools=tools, tool_names=names, today=today, messages=history, input=user, agent_scratchpad="")
+
+
+def legacy_prompt(tools: str, names: str, today: str, history: str, user: str) -> str:
+    """The pre-change layout: date inside the rules, tools/history/input at the end."""
+    from app.prompts import REACT_FORMAT_RULES, ONBOARDING_WORKFLOW
+    workflow = ONBOARDING_WORKFLOW.replace(
+        "Age: Must be 18+ (today's date is given as TODAY at the end of this prompt)",
+        f"Age: Must be 18+ (today: {today})")
+    template = REACT_FORMAT_RULES + workflow + (
+        "--------------------------------------------------------\n"
+        "TOOLS: {tools}\nHISTORY: {messages}\nUSER: {input}\nTHOUGHTS: {agent_scratchpad}\n")
+    return template.format(tools=tools, tool_names=names, messages=history, input=user, agent_scratchpad="")
+
+
+def build_workload(n: int, dates: int, interleave: bool = False) -> List[Dict[str, str]]:
+    """
+    Requests spread over `dates` distinct dates: in consecutive blocks (the date
+    rolls over dates-1 times during the run) or, with `interleave`, alternating
+    on every request.
+    """
+    base = date.today()
+    block = max(1, -(-n // dates))
+    workload = []
+    for i in range(n):
+        user = USER_MESSAGES[i % len(USER_MESSAGES)]
+        history = f"[HumanMessage(content='session {i}')]"
+        day = i % dates if interleave else i // block
+        workload.append({"today": (base + timedelta(days=day)).isoformat(), "history": history, "user": user})
+    return workload
+
+
+def ttft(base_url: str, model: str, prompt: str) -> float:
+    t0 = time.perf_counter()
+    with requests.post(f"{base_url}/api/generate", stream=True, timeout=300, json={
+        "model": model, "prompt": prompt, "stream": True, "options": {"num_predict": 8, "temperature": 0},
+    }) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if line and json.loads(line).get("response"):
+                return time.perf_counter() - t0
+    return time.perf_counter() - t0
+
+
+def measure(layout, base_url: str, model: str, workload, tools: str, names: str) -> Dict:
+    prompts = [layout(tools, names, w["today"], w["history"], w["user"]) for w in workload]
+    ttft(base_url, model, prompts[0])  # warm the model and cache
+    timings = [ttft(base_url, model, p) for p in prompts]
+    timings.sort()
+    return {
+        "requests": len(timings),
+        "mean_ttft_ms": round(statistics.fmean(timings) * 1000, 1),
+        "p50_ttft_ms": round(timings[len(timings) // 2] * 1000, 1),
+        "p95_ttft_ms": round(timings[int(0.95 * (len(timings) - 1))] * 1000, 1),
+    }
+
+
+def shared_prefix_chars(prompts: List[str]) -> int:
+    return len(os.path.commonprefix(prompts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTFT: stable-prefix vs legacy prompt layout")
+    parser.add_argument("--base-url", default="http://127.0.0.1:11500")
+    parser.add_argument("--model", default="gpt-oss:120b-cloud")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--dates", type=int, default=2, help="Distinct dates in the request mix")
+    parser.add_argument("--interleave", action="store_true",
+                        help="Change the date on every request (synthetic upper bound, not a production mix)")
+    args = parser.parse_args()
+
+    tools, names = render_tools(), tool_names()
+    workload = build_workload(args.requests, args.dates, args.interleave)
+
+    results = {"workload": "interleaved dates (synthetic upper bound)" if args.interleave
+               else f"{args.dates - 1} date change(s) over {args.requests} requests"}
+    for name, layout in [("legacy", legacy_prompt), ("stable_prefix", current_prompt)]:
+        prompts = [layout(tools, names, w["today"], w["history"], w["user"]) for w in workload]
+        results[name] = measure(layout, args.base_url, args.model, workload, tools, names)
+        results[name]["shared_prefix_chars"] = shared_prefix_chars(prompts)
+        results[name]["prompt_chars"] = len(prompts[0])
+
+    legacy, stable = results["legacy"]["mean_ttft_ms"], results["stable_prefix"]["mean_ttft_ms"]
+    results["mean_ttft_improvement"] = f"{(legacy - stable) / legacy:.1%}" if legacy else "n/a"
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Microbenchmarks for the tool hot paths at production data sizes.
+
+Generates synthetic data in a temporary directory:
+  * N customers in database/customers.db          (default 1,000,000)
+  * N registry entries in registry_api.MOCK_DATA  (default 100,000)
+  * N-chunk FAISS index + metadata                (default 100,000)
+and times registry_lookup, customer_create, get_customer_by_external_key,
+semantic_search / top_matches_from_metadata and resolve_branch_email,
+reporting ops/s, latency and allocations per op (tracemalloc).
+
+Run from backend/:
+    python -m benchmarks.tool_hotpaths
+    python -m benchmarks.tool_hotpaths --scale 0.1 --iterations 20
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+sys.path.insert(0, BACKEND_DIR)
+
+COUNTRIES = ["DK", "SE", "NO", "FI"]
+KEY_TYPES = {"DK": "DanishNationalId", "SE": "SwedishNationalId", "NO": "NorwegianNationalId", "FI": "FinnishNationalId"}
+CITIES = {"DK": ["2730 Herlev", "1000 Copenhagen", "8000 Aarhus"], "SE": ["Stockholm", "Malmo"],
+          "NO": ["Oslo", "Bergen"], "FI": ["Helsinki", "Espoo"]}
+
+
+# ---------------------------
+# SYNTHETIC DATA
+# ---------------------------
+def national_id(i: int) -> str:
+    return f"{i:010d}"
+
+
+def registry_record(i: int, country: str) -> dict:
+    return {
+        "firstName": f"First{i}",
+        "lastName": f"Last{i}",
+        "dateOfBirth": f"19{50 + i % 50}-0{1 + i % 9}-1{i % 9}",
+        "gender": "Female" if i % 2 else "Male",
+        "address": f"Street {i % 500}, {random.choice(CITIES[country])}",
+        "maritalStatus": "Single",
+        "citizenship": ["Denmark"],
+        "residencePermitNumber": False,
+    }
+
+
+def generate_customers(n: int, batch: int = 50_000):
+    """Fill customers.db with rows shaped like create_personal_customer's output."""
+    from app.customer_api import init_db
+    init_db()
+    conn = sqlite3.connect("database/customers.db")
+    insert = "INSERT INTO customers (id, data, country, national_id, created_at) VALUES (?, ?, ?, ?, ?)"
+    created = time.time() - n
+    rows = []
+    for i in range(n):
+        country = COUNTRIES[i % 4]
+        data = {
+            "identity": {"country": country, "nationalId": national_id(i), "externalKeyType": KEY_TYPES[country],
+                         "firstName": f"First{i}", "lastName": f"Last{i}", "dateOfBirth": None, "gender": None,
+                         "address": None, "maritalStatus": None, "citizenship": None, "residencePermitNumber": False},
+            "contactInformation": None,
+        }
+        rows.append((str(uuid.uuid4()), json.dumps(data, separators=(",", ":")), country, national_id(i), created + i))
+        if len(rows) >= batch:
+            conn.executemany(insert, rows)
+            rows.clear()
+    if rows:
+        conn.executemany(insert, rows)
+    conn.commit()
+    conn.close()
+
+
+def generate_registry(n: int):
+    from app.registry_api import MOCK_DATA
+    for i in range(n):
+        country = COUNTRIES[i % 4]
+        MOCK_DATA.setdefault(country, {})[national_id(i)] = registry_record(i, country)
+
+
+def generate_index(n: int):
+    """
+    Build an n-chunk IndexFlatIP. Vectors are noisy copies of real embeddings of
+    branch/requirement texts, so real queries still clear SIMILARITY_THRESHOLD.
+    """
+    import faiss
+    from app import helpers
+
+    templates = []
+    for country, cities in CITIES.items():
+        for city in cities:
+            templates.append(f"{country} branch {city} contact branch-{city.split()[-1].lower()}@cloudaibank.com")
+        templates.append(f"{country} identification documents requirements passport photo ID")
+    base = helpers.EMBED_MODEL.encode(templates).astype("float32")
+    faiss.normalize_L2(base)
+
+    rng = np.random.default_rng(0)
+    dim = base.shape[1]
+    index = faiss.IndexFlatIP(dim)
+    metadata = []
+    step = 50_000
+    for start in range(0, n, step):
+        count = min(step, n - start)
+        which = np.arange(start, start + count) % len(templates)
+        vecs = base[which] + rng.normal(0, 0.02, size=(count, dim)).astype("float32")
+        faiss.normalize_L2(vecs)
+        index.add(vecs)
+        for offset, t in enumerate(which):
+            i = start + offset
+            metadata.append({"chunk_id": f"synthetic_{i}", "chunk_index": i, "source": "synthetic", "text": templates[t]})
+
+    helpers.FAISS_INDEX = index
+    helpers.METADATA = metadata
+
+
+# ---------------------------
+# TIMING
+# ---------------------------
+def bench(name: str, fn: Callable[[int], object], iterations: int) -> Dict:
+    fn(0)  # warm-up
+    timings = []
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i + 1)
+        timings.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn(iterations + 1)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    allocated = sum(s.size_diff for s in stats if s.size_diff > 0)
+    blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+
+    total = sum(timings)
+    timings.sort()
+    return {
+        "name": name,
+        "iterations": iterations,
+        "ops_per_s": round(iterations / total, 2) if total else float("inf"),
+        "mean_ms": round(total / iterations * 1000, 3),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))] * 1000, 3),
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "retained_alloc_kb": round(allocated / 1024, 1),
+        "retained_blocks": blocks,
+    }
+
+
+def run(customers: int, registry: int, chunks: int, iterations: int) -> List[Dict]:
+    os.chdir(tempfile.mkdtemp(prefix="tool_bench_"))  # customers.db is relative to cwd
+
+    from app import helpers
+    from app.customer_api import get_customer_by_external_key
+    from app.tools import registry_lookup, customer_create
+
+    for label, fn, size in [("customers", generate_customers, customers),
+                            ("registry entries", generate_registry, registry),
+                            ("index chunks", generate_index, chunks)]:
+        t0 = time.perf_counter()
+        fn(size)
+        print(f"generated {size:,} {label} in {time.perf_counter() - t0:.1f}s")
+
+    rng = random.Random(1)
+
+    def existing() -> Tuple[str, str]:
+        i = rng.randrange(customers) if customers else 0
+        return COUNTRIES[i % 4], national_id(i)
+
+    def registered_dk() -> str:
+        return national_id(rng.randrange(0, max(registry, 1), 4))
+
+    new_ids = iter(range(10 ** 9, 10 ** 9 + 10 ** 6))
+
+    def create(_):
+        nid = str(next(new_ids))
+        payload = {"identity": {"country": "DK", "nationalId": nid, "externalKeyType": "DanishNationalId",
+                                "firstName": "Bench", "lastName": "Mark"},
+                   "contactInformation": {"address": ["Tokkerupvej 35, 2730 Herlev"]}}
+        return customer_create.invoke(json.dumps(payload))
+
+    def search(_):
+        d, i = helpers.semantic_search("DK branch 2730 Herlev", k=5)
+        return helpers.top_matches_from_metadata(d, i, k=5)
+
+    distances, indices = helpers.semantic_search("DK branch 2730 Herlev", k=5)
+
+    cases = [
+        ("registry_lookup", lambda i: registry_lookup.invoke(f"DK {registered_dk()}")),
+        ("get_customer_by_external_key (hit)", lambda i: get_customer_by_external_key(*existing())),
+        ("get_customer_by_external_key (miss)", lambda i: get_customer_by_external_key("DK", "does-not-exist")),
+        ("customer_create", create),
+        ("semantic_search + top_matches", search),
+        ("top_matches_from_metadata", lambda i: helpers.top_matches_from_metadata(distances, indices, k=5)),
+        ("resolve_branch_email", lambda i: helpers.resolve_branch_email("Tokkerupvej 35, 2730 Herlev", "DK")),
+    ]
+    return [bench(name, fn, iterations) for name, fn in cases]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tool hot-path microbenchmarks")
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    parser.add_argument("--registry", type=int, default=100_000)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply all dataset sizes")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--out", help="Write results JSON to this path")
+    args = parser.parse_args()
+
+    results = run(int(args.customers * args.scale), int(args.registry * args.scale),
+                  int(args.chunks * args.scale), args.iterations)
+
+    print(f"\n{'benchmark':<38}{'ops/s':>10}{'mean ms':>11}{'p95 ms':>10}{'peak KB':>11}{'retained KB':>13}")
+    for r in results:
+        print(f"{r['name']:<38}{r['ops_per_s']:>10}{r['mean_ms']:>11}{r['p95_ms']:>10}"
+              f"{r['peak_alloc_kb']:>11}{r['retained_alloc_kb']:>13}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Fake Ollama HTTP server for offline testing of the LLM pool.
+
+Implements the subset of the Ollama API used by the backend (/api/generate,
+/api/chat, /api/tags, /api/ps, /api/version) with configurable latency,
+model load time and failure rate. Optionally simulates prompt prefill cost
+with a per-slot KV prefix cache, like Ollama's: only the part of a prompt
+not shared with a cached earlier prompt is "evaluated" before the first token.
+
+Run with: python -m devtools.fake_ollama --port 11500 --latency 0.3
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Thought: The user greeted me.\nFinal Answer: Hello! How can I assist you today?"
+
+
+class FakeOllamaState:
+    """Shared server state: configuration plus which models are currently loaded."""
+
+    def __init__(self, models, latency=0.2, jitter=0.0, load_time=2.0,
+                 fail_rate=0.0, token_delay=0.0, reply=DEFAULT_REPLY,
+                 prefill_per_token=0.0, kv_slots=4):
+        self.models = models
+        self.latency = latency
+        self.jitter = jitter
+        self.load_time = load_time
+        self.fail_rate = fail_rate
+        self.token_delay = token_delay
+        self.reply = reply
+        self.prefill_per_token = prefill_per_token
+        self.kv_slots = kv_slots
+        self.kv_cache = {}  # model -> list of recently evaluated prompts (one per slot)
+        self.loaded = {}  # model -> expires_at (epoch seconds)
+        self.in_flight = 0
+        self.requests_total = 0
+        self.lock = threading.Lock()
+
+    def ensure_loaded(self, model: str, keep_alive) -> float:
+        """Return the cold-start delay for `model` and mark it loaded."""
+        now = time.time()
+        with self.lock:
+            expires = self.loaded.get(model, 0)
+            delay = 0.0 if expires > now else self.load_time
+            self.loaded[model] = now + parse_keep_alive(keep_alive)
+        return delay
+
+    def evaluate_prompt(self, model: str, prompt: str) -> int:
+        """
+        Return the number of prompt tokens that must be evaluated, reusing the
+        slot with the longest common prefix (~4 chars per token).
+        """
+        with self.lock:
+            slots = self.kv_cache.setdefault(model, [])
+            best, best_len = None, 0
+            for i, cached in enumerate(slots):
+                n = _common_prefix_len(cached, prompt)
+                if n > best_len:
+                    best, best_len = i, n
+            if best is not None:
+                slots.pop(best)
+            elif len(slots) >= self.kv_slots:
+                slots.pop(0)  # evict least recently used slot
+            slots.append(prompt)
+        return max(1, (len(prompt) - best_len) // 4)
+
+
+def _common_prefix_len(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def parse_keep_alive(value) -> float:
+    """Ollama accepts seconds or duration strings like "5m"/"1h"; negative means forever."""
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    units = {"s": 1, "m": 60, "h": 3600}
+    value = str(value).strip()
+    if value and value[-1] in units:
+        number = float(value[:-1])
+        return float("inf") if number < 0 else number * units[value[-1]]
+    number = float(value)
+    return float("inf") if number < 0 else number
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    state: FakeOllamaState = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- helpers ---
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    # --- routes ---
+    def do_GET(self):
+        state = self.state
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": m, "model": m} for m in state.models]})
+        elif self.path == "/api/ps":
+            now = time.time()
+            with state.lock:
+                loaded = [m for m, exp in state.loaded.items() if exp > now]
+            self._send_json(200, {"models": [{"name": m, "model": m} for m in loaded]})
+        elif self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-fake"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path not in ("/api/generate", "/api/chat"):
+            self._send_json(404, {"error": "not found"})
+            return
+        state = self.state
+        req = self._read_json()
+        model = req.get("model", "")
+        if model not in state.models:
+            self._send_json(404, {"error": f"model '{model}' not found"})
+            return
+
+        with state.lock:
+            state.in_flight += 1
+            state.requests_total += 1
+        try:
+            started = time.perf_counter()
+            time.sleep(state.ensure_loaded(model, req.get("keep_alive")))
+
+            # An empty prompt only loads the model (this is how keep-alive warm-up works)
+            prompt = req.get("prompt", "")
+            if self.path == "/api/generate" and not prompt:
+                self._send_json(200, {"model": model, "created_at": _now_iso(), "response": "",
+                                      "done": True, "done_reason": "load"})
+                return
+
+            if random.random() < state.fail_rate:
+                self._send_json(500, {"error": "injected failure"})
+                return
+
+            if self.path == "/api/chat":
+                prompt = "".join(f"{m.get('role')}:{m.get('content', '')}\n" for m in req.get("messages", []))
+            prompt_tokens = state.evaluate_prompt(model, prompt)
+            delay = state.latency + random.uniform(-state.jitter, state.jitter) + prompt_tokens * state.prefill_per_token
+            time.sleep(max(0.0, delay))
+            self._respond(req, model, prompt_tokens, started)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client stopped reading (e.g. measured time-to-first-token only)
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def _respond(self, req: dict, model: str, prompt_tokens: int, started: float):
+        state = self.state
+        tokens = state.reply.split(" ")
+        is_chat = self.path == "/api/chat"
+
+        def chunk(text: str, done: bool) -> dict:
+            out = {"model": model, "created_at": _now_iso(), "done": done}
+            if is_chat:
+                out["message"] = {"role": "assistant", "content": text}
+            else:
+                out["response"] = text
+            if done:
+                out.update({
+                    "done_reason": "stop",
+                    "total_duration": int((time.perf_counter() - started) * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": len(tokens),
+                })
+            return out
+
+        if not req.get("stream", True):
+            self._send_json(200, chunk(state.reply, True))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, tok in enumerate(tokens):
+            self._write_chunk(chunk(tok if i == 0 else " " + tok, False))
+            if state.token_delay:
+                time.sleep(state.token_delay)
+        self._write_chunk(chunk("", True))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, payload: dict):
+        data = (json.dumps(payload) + "\n").encode()
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def make_server(host: str = "127.0.0.1", port: int = 11500, **state_kwargs) -> ThreadingHTTPServer:
+    """Build (but do not start) a fake Ollama server; use server.serve_forever() in a thread."""
+    state = FakeOllamaState(**state_kwargs)
+    handler = type("BoundFakeOllamaHandler", (FakeOllamaHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--models", default="gpt-oss:120b-cloud,gpt-oss:20b", help="Comma separated model names")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per generation")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to latency")
+    parser.add_argument("--load-time", type=float, default=2.0, help="Cold start seconds for an unloaded model")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed tokens")
+    parser.add_argument("--prefill-per-token", type=float, default=0.0,
+                        help="Seconds per uncached prompt token before the first token (prefix cache simulation)")
+    parser.add_argument("--kv-slots", type=int, default=4, help="Prompts kept in the simulated prefix cache")
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host, args.port,
+        models=[m.strip() for m in args.models.split(",") if m.strip()],
+        latency=args.latency, jitter=args.jitter, load_time=args.load_time,
+        fail_rate=args.fail_rate, token_delay=args.token_delay, reply=args.reply,
+        prefill_per_token=args.prefill_per_token, kv_slots=args.kv_slots,
+    )
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
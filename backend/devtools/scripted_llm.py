@@ -0,0 +1,201 @@
+"""
+Deterministic scripted LLM that plays the onboarding agent's side of the ReAct loop.
+
+It reads the rendered agent prompt (user input, history and scratchpad) and emits
+the Thought/Action/Final Answer text a well-behaved model would produce, so the
+full /chat stack can be exercised without Ollama. Identities are resolved through
+app.registry_api.MOCK_DATA, so synthetic identities added there are understood too.
+"""
+
+import json
+import random
+import re
+import time
+from datetime import date
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import BaseLLM
+from langchain_core.outputs import Generation, LLMResult
+
+from app.prompts import ASK_CONFIRMATION, ASK_NATIONAL_ID, ASK_RESIDENCE_PERMIT
+
+# FI IDs carry letters (century sign, check character), e.g. "020589A000X"
+ID_PATTERN = re.compile(r"\b(DK|SE|NO|FI)\s+([0-9A-Z]{6,})\b")
+# Answers that end an onboarding journey; later messages start over
+TERMINAL_ANSWERS = (
+    "Sorry, applicants must be 18 or older",
+    "Residence permit verification failed",
+    "You already have an account",
+    "Account created successfully",
+    "Thank you for reaching out!",
+    "Registry lookup failed",
+    "Registration failed",
+)
+KEY_TYPES = {"DK": "DanishNationalId", "SE": "SwedishNationalId", "NO": "NorwegianNationalId", "FI": "FinnishNationalId"}
+
+
+def _section(prompt: str, start: str, end: Optional[str]) -> str:
+    i = prompt.rfind(start)
+    if i < 0:
+        return ""
+    i += len(start)
+    j = prompt.find(end, i) if end else -1
+    return prompt[i:j if j >= 0 else len(prompt)].strip()
+
+
+def _steps(scratchpad: str) -> List[tuple]:
+    """Return [(tool, observation_dict)] parsed from the ReAct scratchpad."""
+    steps = []
+    for m in re.finditer(r"Action:\s*(\w+).*?Observation:\s*(.*?)(?=\nThought:|\Z)", scratchpad, re.S):
+        try:
+            obs = json.loads(m.group(2).strip())
+        except Exception:
+            obs = {"raw": m.group(2).strip()}
+        steps.append((m.group(1), obs))
+    return steps
+
+
+def is_terminal(answer: str) -> bool:
+    return any(t in (answer or "") for t in TERMINAL_ANSWERS)
+
+
+def _open_history(history: str) -> str:
+    """History after the last terminal answer: an identity from a finished journey is not reused."""
+    end = max((history.rfind(t) + len(t) for t in TERMINAL_ANSWERS if t in history), default=0)
+    return history[end:]
+
+
+def _age(dob: str) -> int:
+    born = date.fromisoformat(dob)
+    today = date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+class ScriptedOnboardingLLM(BaseLLM):
+    """Scripted stand-in for the Ollama model, for load tests and offline runs."""
+
+    latency: float = 0.0
+    parse_error_rate: float = 0.0
+    seed: int = 0
+    _rng: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-onboarding"
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> LLMResult:
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        generations = []
+        for prompt in prompts:
+            if self.latency:
+                time.sleep(self.latency)
+            text = self.respond(prompt)
+            if self.parse_error_rate and self._rng.random() < self.parse_error_rate:
+                text = text.replace("Action:", "Next:").replace("Final Answer:", "Answer:")
+            generations.append([Generation(
+                text=text,
+                generation_info={"prompt_eval_count": len(prompt) // 4, "eval_count": len(text) // 4},
+            )])
+        return LLMResult(generations=generations)
+
+    # --- script ---
+    def respond(self, prompt: str) -> str:
+        user = _section(prompt, "USER:", "THOUGHTS:")
+        history = _section(prompt, "HISTORY:", "USER:")
+        steps = _steps(_section(prompt, "THOUGHTS:", None))
+        identity = self._identity(user) or self._identity(_open_history(history))
+
+        if steps:
+            return self._after_tool(steps, identity)
+
+        lowered = user.lower().strip()
+        if ID_PATTERN.search(user):
+            country, national_id = ID_PATTERN.search(user).groups()
+            return self._action("I have the country and national ID.", "registry_lookup", f"{country} {national_id}")
+        if re.match(r"^[A-Z]{2}\d+$", user.strip()) and identity:
+            record = identity[2]
+            payload = {"user_input": user.strip(), "expected_rp": record.get("residencePermitNumber") or ""}
+            return self._action("The user sent a residence permit number.", "verify_residence_permit", json.dumps(payload))
+        if lowered in ("yes", "y", "yes please") and identity:
+            return self._action("The user confirmed registration.", "customer_create", json.dumps(self._create_payload(identity)))
+        if lowered in ("no", "n"):
+            return self._final("Thank you for reaching out!")
+        if any(w in lowered for w in ("document", "require", "policy", "need")):
+            return self._action("This is a policy question.", "vector_rag", user)
+        if any(w in lowered for w in ("customer", "register", "account", "open")):
+            return self._final(ASK_NATIONAL_ID)
+        return self._final("Hello! How can I assist you today?")
+
+    def _after_tool(self, steps: List[tuple], identity) -> str:
+        tool, obs = steps[-1]
+        if tool == "registry_lookup":
+            if obs.get("status") != "ok":
+                return self._final(f"Registry lookup failed: {obs.get('message', '')}")
+            if obs.get("customer_status") == "existing":
+                return self._final(f"You already have an account (Customer ID: {obs.get('customerKey')})")
+            reg = obs["registry"]
+            if _age(reg["dateOfBirth"]) < 18:
+                return self._final("Sorry, applicants must be 18 or older")
+            if reg.get("residencePermitNumber"):
+                return self._final(ASK_RESIDENCE_PERMIT)
+            return self._final(self._confirmation(reg))
+        if tool == "verify_residence_permit":
+            if not obs.get("verified"):
+                return self._final("Residence permit verification failed")
+            return self._final(self._confirmation(identity[2]) if identity else "Residence permit verified.")
+        if tool == "customer_create":
+            if obs.get("status") == "created":
+                branch = (f"Your assigned branch  has been notified at {obs['branchEmail']}" if obs.get("branchEmail")
+                          else "Your branch will be assigned shortly.")
+                return self._final(f"Account created successfully (Customer ID: {obs.get('customerKey')})\n{branch}")
+            if obs.get("status") == "conflict":
+                return self._final("You already have an account.")
+            return self._final(f"Registration failed: {obs.get('message', obs.get('missing', ''))}")
+        if tool == "vector_rag":
+            hits = obs.get("hits") or []
+            return self._final(hits[0]["text"] if hits else "No relevant rules found.")
+        return self._final("I can only assist with banking onboarding.")
+
+    # --- helpers ---
+    @staticmethod
+    def _identity(text: str):
+        from app.registry_api import MOCK_DATA
+        matches = ID_PATTERN.findall(text or "")
+        for country, national_id in reversed(matches):
+            record = MOCK_DATA.get(country, {}).get(national_id)
+            if record:
+                return country, national_id, record
+        return None
+
+    @staticmethod
+    def _create_payload(identity) -> dict:
+        country, national_id, record = identity
+        return {
+            "identity": {
+                "country": country,
+                "nationalId": national_id,
+                "externalKeyType": KEY_TYPES[country],
+                "firstName": record["firstName"],
+                "lastName": record["lastName"],
+            },
+            "contactInformation": {"address": [record["address"]]},
+        }
+
+    @staticmethod
+    def _confirmation(reg: dict) -> str:
+        return (f"Identity verified: {reg['firstName']} {reg['lastName']}\n"
+                f"Citizenship: {', '.join(reg.get('citizenship', []))}\n"
+                f"Address: {reg['address']}\n"
+                f"{ASK_CONFIRMATION}")
+
+    @staticmethod
+    def _action(thought: str, tool: str, tool_input: str) -> str:
+        return f"Thought: {thought}\nAction: {tool}\nAction Input: {tool_input}"
+
+    @staticmethod
+    def _final(answer: str) -> str:
+        return f"Thought: I can answer now.\nFinal Answer: {answer}"
+
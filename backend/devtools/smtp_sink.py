@@ -0,0 +1,104 @@
+"""
+Local SMTP stand-in that accepts and records mail, for testing the notification outbox.
+
+Speaks just enough SMTP for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT).
+A fraction of messages can be rejected to exercise retries.
+
+Run with: python -m devtools.smtp_sink --port 8025 --fail-rate 0.2
+then start the API with OUTBOX_SMTP_HOST=127.0.0.1 OUTBOX_SMTP_PORT=8025
+"""
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    server: "SmtpSinkServer"
+
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self._reply("220 smtp-sink ready")
+        mail_from, rcpt_to = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            verb = line[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self._reply("250 smtp-sink")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = line[10:].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_to.append(line[8:].strip())
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    body.append(data.decode(errors="replace"))
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                if random.random() < self.server.fail_rate:
+                    self._reply("451 Temporary failure (injected)")
+                else:
+                    self.server.record(mail_from, rcpt_to, "".join(body))
+                    self._reply("250 OK queued")
+            elif verb == "RSET":
+                mail_from, rcpt_to = None, []
+                self._reply("250 OK")
+            elif verb == "NOOP":
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class SmtpSinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, fail_rate: float = 0.0, latency: float = 0.0, verbose: bool = False):
+        super().__init__(address, SmtpSinkHandler)
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.verbose = verbose
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def record(self, mail_from, rcpt_to, body):
+        with self._lock:
+            self.messages.append({"from": mail_from, "to": rcpt_to, "body": body})
+        if self.verbose:
+            print(f"[SMTP-SINK] {mail_from} -> {', '.join(rcpt_to)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of messages answered with 451")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before accepting a message")
+    args = parser.parse_args()
+
+    server = SmtpSinkServer((args.host, args.port), fail_rate=args.fail_rate, latency=args.latency, verbose=True)
+    print(f"SMTP sink listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Admission control for agent turns: token-bucket rate limits and a weighted
+fair queue across priority classes derived from session progress
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Sequence
+
+from app.prompts import ASK_CONFIRMATION, ASK_NATIONAL_ID, ASK_RESIDENCE_PERMIT
+from app.metrics import ADMISSION_QUEUE_WAIT_SECONDS, ADMISSION_QUEUED, ADMISSION_REJECTED
+from app.profiling import record_span
+
+# ---------------------------
+# CONFIG
+# ---------------------------
+# Requests per second and burst size; a rate of 0 disables the limit
+SESSION_RATE = float(os.getenv("SESSION_RATE", "1"))
+SESSION_BURST = float(os.getenv("SESSION_BURST", "5"))
+IP_RATE = float(os.getenv("IP_RATE", "5"))
+IP_BURST = float(os.getenv("IP_BURST", "30"))
+
+# Agent turns executing at once (align with the LLM capacity, e.g. the sum of
+# max_concurrency over OLLAMA_BACKENDS) and how long a turn may wait for a slot
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "60"))
+
+# Share of execution slots per class when all classes are backlogged
+PRIORITY_WEIGHTS = {
+    "confirmation": 6,  # identity verified, waiting for the Yes that creates the customer
+    "in_progress": 3,   # asked for the national ID or the residence permit
+    "new": 1,           # no onboarding progress yet (greetings, policy questions)
+}
+
+# Questions from the onboarding workflow (app.prompts) that mark session progress
+PROGRESS_MARKERS = (
+    (ASK_CONFIRMATION, "confirmation"),
+    (ASK_RESIDENCE_PERMIT, "in_progress"),
+    (ASK_NATIONAL_ID, "in_progress"),
+)
+
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded ({scope}), retry in {retry_after:.1f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class AdmissionTimeout(Exception):
+    """No execution slot became free within the queue timeout."""
+
+
+# ---------------------------
+# PRIORITY
+# ---------------------------
+def classify_session(messages: Sequence) -> str:
+    """Priority class from the agent's last reply in the session history."""
+    last_ai = next((m.content for m in reversed(messages) if getattr(m, "type", "") == "ai"), "")
+    for marker, priority in PROGRESS_MARKERS:
+        if marker.lower() in str(last_ai).lower():
+            return priority
+    return "new"
+
+
+# ---------------------------
+# RATE LIMITS
+# ---------------------------
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token bucket per key; buckets idle longer than `idle_ttl` are dropped."""
+
+    def __init__(self, rate: float, burst: float, idle_ttl: float = 600.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.idle_ttl = idle_ttl
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def check(self, key: str) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None) or TokenBucket(self.rate, self.burst, now)
+        self._buckets[key] = bucket  # most recently used last
+        while self._buckets:
+            oldest = next(iter(self._buckets.values()))
+            if now - oldest.updated < self.idle_ttl:
+                break
+            self._buckets.popitem(last=False)
+        return bucket.take(now)
+
+
+# ---------------------------
+# SCHEDULER
+# ---------------------------
+class AdmissionScheduler:
+    """
+    At most `max_concurrency` agent turns execute at once. When all slots are
+    busy, waiting turns are queued per priority class and a freed slot goes to
+    the class with the smallest virtual time, which advances by 1/weight per
+    admitted turn (start-time fair queuing). Under saturation each backlogged
+    class gets slots in proportion to its weight and no class is starved.
+
+    Must be used from a single event loop (one per worker process).
+    """
+
+    def __init__(self, max_concurrency: int = AGENT_MAX_CONCURRENCY,
+                 weights: Optional[Dict[str, float]] = None,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+                 session_rate: float = SESSION_RATE, session_burst: float = SESSION_BURST,
+                 ip_rate: float = IP_RATE, ip_burst: float = IP_BURST):
+        self.max_concurrency = max_concurrency
+        self.weights = dict(weights or PRIORITY_WEIGHTS)
+        self.queue_timeout = queue_timeout
+        self.session_limiter = RateLimiter(session_rate, session_burst)
+        self.ip_limiter = RateLimiter(ip_rate, ip_burst)
+        self.active = 0
+        self._queues: Dict[str, Deque[asyncio.Future]] = {c: deque() for c in self.weights}
+        self._vtime = {c: 0.0 for c in self.weights}
+        self._clock = 0.0
+
+    def check_rate(self, session_id: str, client_ip: Optional[str]):
+        """Raise RateLimited if the session or the client IP is over its limit."""
+        for scope, limiter, key in (("session", self.session_limiter, session_id),
+                                    ("ip", self.ip_limiter, client_ip)):
+            if key is None:
+                continue
+            retry_after = limiter.check(key)
+            if retry_after:
+                ADMISSION_REJECTED.inc(reason=f"rate_{scope}")
+                raise RateLimited(scope, retry_after)
+
+    @asynccontextmanager
+    async def slot(self, priority: str):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: str):
+        if priority not in self._queues:
+            priority = "new"
+        started = time.perf_counter()
+        if self.active < self.max_concurrency and not any(self._queues.values()):
+            self.active += 1
+            ADMISSION_QUEUE_WAIT_SECONDS.observe(0.0, priority=priority)
+            return
+
+        queue = self._queues[priority]
+        if not queue:
+            # A class that was idle does not bank credit for the time it had nothing queued
+            self._vtime[priority] = max(self._vtime[priority], self._clock)
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        ADMISSION_QUEUED.inc(priority=priority)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return  # the slot was handed over just as the timeout fired
+            self._dequeue(priority, waiter)
+            ADMISSION_REJECTED.inc(reason="queue_timeout")
+            raise AdmissionTimeout(f"No agent capacity within {self.queue_timeout:.0f}s") from None
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release()
+            else:
+                self._dequeue(priority, waiter)
+            raise
+        finally:
+            ADMISSION_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started, priority=priority)
+            record_span("admission.wait", "queue", started, priority=priority)
+
+    def _dequeue(self, priority: str, waiter: asyncio.Future):
+        waiter.cancel()
+        self._queues[priority].remove(waiter)
+        ADMISSION_QUEUED.dec(priority=priority)
+
+    def release(self):
+        """Hand the slot to the next queued turn, or free it."""
+        backlogged = [c for c, q in self._queues.items() if q]
+        if not backlogged:
+            self.active -= 1
+            return
+        priority = min(backlogged, key=lambda c: (self._vtime[c], -self.weights[c]))
+        waiter = self._queues[priority].popleft()
+        ADMISSION_QUEUED.dec(priority=priority)
+        self._clock = self._vtime[priority]
+        self._vtime[priority] += 1.0 / self.weights[priority]
+        waiter.set_result(None)
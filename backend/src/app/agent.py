@@ -2,30 +2,71 @@
 Banking Onboarding Agent (ReAct + Tools + Memory)
 """
 
-from langchain_classic.agents import create_react_agent, AgentExecutor
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import PromptTemplate
+import os
+from langchain_classic.agents import create_tool_calling_agent
+from langchain_classic.agents.output_parsers import ReActSingleInputOutputParser
+from langchain_core.runnables import RunnablePassthrough
+from langchain_core.tools import render_text_description
 from langchain_core.chat_history import InMemoryChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langsmith import uuid7
-from app.prompts import get_agent_prompt_template
-from app.tools import get_tools
+from app.llm_pool import get_llm, get_chat_llm
+from app.parallel_agent import ParallelAgentExecutor, ReActMultiInputOutputParser
+from app.prompts import REACT_PARALLEL_FORMAT_RULES, build_agent_prompt, build_tool_calling_prompt
+from app.token_budget import format_scratchpad
+from app.tools import get_tools, get_structured_tools
 
-def get_agent():
-    llm = OllamaLLM(model="gpt-oss:120b-cloud", temperature=0) #gpt-oss-safeguard:20b, gpt-oss:20b-cloud, gpt-oss:120b-cloud
-    tools = get_tools()
+# "react": text Thought/Action/Action Input parsing (default)
+# "react_parallel": ReAct, but independent actions of one step run concurrently
+# "tool_calling": the model's native structured tool calls with typed arguments
+AGENT_MODES = ("react", "react_parallel", "tool_calling")
+AGENT_MODE = os.getenv("AGENT_MODE", "react")
 
-    template_str = get_agent_prompt_template()
-    prompt = PromptTemplate(
-        input_variables=["input", "agent_scratchpad", "tools", "tool_names", "messages"],
-        template=template_str
+
+def build_react_agent(llm, tools, prompt, output_parser=None):
+    """
+    Equivalent of langchain's create_react_agent, but the scratchpad goes
+    through the token budget (older observations are compressed).
+    """
+    prompt = prompt.partial(
+        tools=render_text_description(list(tools)),
+        tool_names=", ".join([t.name for t in tools]),
+    )
+    return (
+        RunnablePassthrough.assign(
+            agent_scratchpad=lambda x: format_scratchpad(x["intermediate_steps"]),
+        )
+        | prompt
+        | llm.bind(stop=["\nObservation"])
+        | (output_parser or ReActSingleInputOutputParser())
     )
 
-    react_agent = create_react_agent(llm=llm, tools=tools, prompt=prompt)
-    return AgentExecutor(
-        agent=react_agent,
+
+def get_agent(llm=None, verbose=True, mode=None):
+    mode = mode or AGENT_MODE
+    if mode not in AGENT_MODES:
+        raise ValueError(f"Unknown AGENT_MODE '{mode}'. Allowed: {', '.join(AGENT_MODES)}")
+
+    if mode == "tool_calling":
+        llm = llm or get_chat_llm()
+        tools = get_structured_tools()
+        agent = create_tool_calling_agent(llm=llm, tools=tools, prompt=build_tool_calling_prompt())
+    elif mode == "react_parallel":
+        llm = llm or get_llm()
+        tools = get_tools()
+        agent = build_react_agent(llm=llm, tools=tools, prompt=build_agent_prompt(REACT_PARALLEL_FORMAT_RULES),
+                                  output_parser=ReActMultiInputOutputParser())
+    else:
+        llm = llm or get_llm() # single Ollama model, or a pool of backends when OLLAMA_BACKENDS is set
+        tools = get_tools()
+        agent = build_react_agent(llm=llm, tools=tools, prompt=build_agent_prompt())
+
+    # Runs the actions of one step concurrently (AGENT_MAX_PARALLEL_TOOLS); same as
+    # AgentExecutor when a step has a single action
+    return ParallelAgentExecutor(
+        agent=agent,
         tools=tools,
-        verbose=True,
+        verbose=verbose,
         max_iterations=10,
         handle_parsing_errors=True,
         return_intermediate_steps=False
@@ -43,8 +84,8 @@ def get_history(session_id: str):
     return store[session_id]
 
 
-def get_conversational_agent():
-    base_agent = get_agent()
+def get_conversational_agent(llm=None, verbose=True, mode=None):
+    base_agent = get_agent(llm, verbose, mode)
     return RunnableWithMessageHistory(
         base_agent,
         lambda session_id: get_history(session_id),
@@ -0,0 +1,443 @@
+"""
+Batch onboarding of applicant files (CSV or JSONL) without the LLM
+
+Each row (country, national ID, residence permit, confirmation) goes through
+the same steps the agent follows in the chat workflow: registry_lookup, the
+age and residence-permit rules and customer_create, which also queues the
+branch notification (resolve_branch_email routing, via the outbox). Rows run
+on a bounded thread pool and every result is appended to the output JSONL as
+soon as it is known, so an interrupted run is resumed by running it again
+with the same output file: rows that already have a result are skipped.
+
+Run from backend/:
+    python -m app.batch_onboarding applicants.csv --out results.jsonl --workers 8
+"""
+
+import argparse
+import csv
+import fcntl
+import json
+import math
+import os
+import re
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import date
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from app.metrics import BATCH_ROW_SECONDS, BATCH_ROWS
+
+# Rows onboarded at the same time (registry, branch routing and the DB insert are I/O or short CPU bursts)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+
+# Accepted column names per field (CSV header or JSONL keys)
+FIELDS = {
+    "country": ("country",),
+    "national_id": ("national_id", "nationalId", "id"),
+    "residence_permit": ("residence_permit", "residencePermit", "residencePermitNumber"),
+    "confirmation": ("confirmation", "confirmed", "confirm"),
+}
+CONFIRM_VALUES = {"yes", "y", "true", "1", "ja"}
+MINIMUM_AGE = 18
+
+# Outcomes that are retried with --retry-errors; everything else is final
+RETRYABLE = {"error"}
+# Outcomes after which a later row for the same applicant is a duplicate
+ONBOARDED = {"created", "existing"}
+
+
+def _tools():
+    # app.tools loads the embedding model; reading, resuming and reporting batches do not need it
+    from app import tools
+    return tools
+
+
+# ---------------------------
+# INPUT
+# ---------------------------
+def _field(record: Dict, name: str) -> str:
+    for key in FIELDS[name]:
+        value = record.get(key)
+        if value is not None:
+            return str(value).strip()
+    return ""
+
+
+def _json_record(line: str) -> Dict:
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return {}  # reported as an error row (no country / national_id)
+    return record if isinstance(record, dict) else {}
+
+
+def read_applicants(path: str) -> Iterator[Dict]:
+    """Applicants in file order, numbered from 1; `.csv` needs a header row, anything else is JSONL."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (_json_record(line) for line in f if line.strip())
+        for row, record in enumerate(records, start=1):
+            yield {"row": row, **{name: _field(record, name) for name in FIELDS}}
+
+
+def load_checkpoint(out_path: str) -> Dict[int, Dict]:
+    """Last result per row from an earlier run's output file."""
+    done = {}
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                done[int(result["row"])] = result
+            except (ValueError, KeyError, TypeError):
+                continue  # a line cut short by a crash; that row runs again
+    return done
+
+
+# ---------------------------
+# RULES
+# ---------------------------
+def normalize_id(national_id: str) -> str:
+    """Like registry_lookup: spaces and dashes removed (FI IDs keep their letters)."""
+    return re.sub(r"[\s-]", "", national_id).upper()
+
+
+def applicant_age(date_of_birth: str, today: date) -> int:
+    born = date.fromisoformat(date_of_birth)
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+def onboard_applicant(applicant: Dict, today: Optional[date] = None) -> Dict:
+    """
+    Onboard one applicant. Returns its result with `status`: created,
+    existing, rejected (underage, residence permit), declined (not confirmed)
+    or error.
+    """
+    today = today or date.today()
+    tools = _tools()
+    result = {"row": applicant["row"], "country": applicant["country"].upper(),
+              "nationalId": normalize_id(applicant["national_id"])}
+    if not result["country"] or not result["nationalId"]:
+        return {**result, "status": "error", "message": "country and national_id are required"}
+
+    lookup = json.loads(tools._registry_lookup(result["country"], result["nationalId"]))
+    if lookup.get("status") != "ok":
+        return {**result, "status": "error", "message": lookup.get("message")}
+    if lookup["customer_status"] == "existing":
+        return {**result, "status": "existing", "customerKey": lookup.get("customerKey")}
+    registry = lookup["registry"]
+
+    try:
+        if applicant_age(registry["dateOfBirth"], today) < MINIMUM_AGE:
+            return {**result, "status": "rejected", "reason": f"applicants must be {MINIMUM_AGE} or older"}
+    except (TypeError, ValueError):
+        return {**result, "status": "error", "message": f"invalid dateOfBirth {registry.get('dateOfBirth')!r}"}
+
+    expected_rp = registry.get("residencePermitNumber")
+    if expected_rp:
+        if not applicant["residence_permit"]:
+            return {**result, "status": "rejected", "reason": "residence permit required"}
+        if not json.loads(tools._verify_residence_permit(applicant["residence_permit"], expected_rp))["verified"]:
+            return {**result, "status": "rejected", "reason": "residence permit verification failed"}
+
+    if applicant["confirmation"].lower() not in CONFIRM_VALUES:
+        return {**result, "status": "declined", "reason": "registration not confirmed"}
+
+    created = json.loads(tools._create_customer({
+        "identity": {k: registry.get(k) for k in
+                     ("country", "nationalId", "externalKeyType", "firstName", "lastName")},
+        "contactInformation": {"address": [registry["address"]]},
+    }))
+    if created.get("status") == "created":
+        return {**result, "status": "created", "customerKey": created["customerKey"],
+                "branchEmail": created.get("branchEmail")}
+    if created.get("status") == "conflict":
+        return {**result, "status": "existing", "message": created.get("message")}
+    return {**result, "status": "error", "message": created.get("message") or created.get("missing")}
+
+
+# ---------------------------
+# RUN
+# ---------------------------
+def run_batch(in_path: str, out_path: str, workers: int = BATCH_WORKERS, retry_errors: bool = False,
+              on_result: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Onboard every applicant in `in_path` that has no result in `out_path` yet
+    (or whose result was an error, with `retry_errors`), appending results to
+    `out_path`. A row for an applicant already created or found existing
+    earlier in the file is a `duplicate`. Returns the throughput summary.
+    """
+    done = load_checkpoint(out_path)
+    skip = {row for row, r in done.items() if not (retry_errors and r.get("status") in RETRYABLE)}
+    results = dict(done)
+    latest: Dict[Tuple[str, str], Future] = {}  # last row onboarded (not marked duplicate) per applicant
+    latencies = []
+
+    def process(applicant: Dict, duplicate: bool) -> Dict:
+        started = time.perf_counter()
+        if duplicate:
+            result = {"row": applicant["row"], "country": applicant["country"].upper(),
+                      "nationalId": normalize_id(applicant["national_id"]), "status": "duplicate", "message": "same applicant appears earlier in the file"}
+        else:
+            try:
+                result = onboard_applicant(applicant)
+            except Exception as e:
+                result = {"row": applicant["row"], "status": "error", "message": str(e)}
+        result["seconds"] = round(time.perf_counter() - started, 4)
+        return result
+
+    t0 = time.perf_counter()
+    with open(out_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        if _ends_mid_line(out_path):
+            out.write("\n")  # a line cut short by a crash; the next result must not be appended to it
+        def record(future):
+            result = future.result()
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()  # each result is a checkpoint
+            results[result["row"]] = result
+            latencies.append(result["seconds"])
+            BATCH_ROWS.inc(status=result["status"])
+            BATCH_ROW_SECONDS.observe(result["seconds"])
+            if on_result:
+                on_result(result)
+
+        pending = set()
+
+        def record_next():
+            nonlocal pending
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in finished:
+                record(f)
+
+        # At most 2x workers rows in flight, so memory does not grow with the file
+        for applicant in read_applicants(in_path):
+            if applicant["row"] in skip:
+                continue
+            if len(pending) >= 2 * workers:
+                record_next()
+            key = (applicant["country"].upper(), normalize_id(applicant["national_id"]))
+            earlier = latest.get(key) if all(key) else None
+            # Two rows for one person must not race each other into customer_create:
+            # a later row waits for the earlier one and is onboarded only if that one was not
+            while earlier is not None and earlier in pending:
+                record_next()
+            duplicate = earlier is not None and earlier.result()["status"] in ONBOARDED
+            future = pool.submit(process, applicant, duplicate)
+            pending.add(future)
+            if all(key) and not duplicate:
+                latest[key] = future
+        for f in wait(pending).done:
+            record(f)
+    return summarize(results, latencies, time.perf_counter() - t0, len(skip), workers)
+
+
+def _ends_mid_line(path: str) -> bool:
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def summarize(results: Dict[int, Dict], latencies, elapsed: float, skipped: int, workers: int) -> Dict:
+    processed = len(latencies)
+    ordered = sorted(latencies)
+    return {
+        "rows": len(results),
+        "processed": processed,
+        "skipped": skipped,
+        "by_status": dict(Counter(r.get("status") for r in results.values())),
+        "workers": workers,
+        "elapsed_s": round(elapsed, 2),
+        "rows_per_s": round(processed / elapsed, 1) if elapsed else 0.0,
+        "p50_row_ms": round(statistics.median(ordered) * 1000, 1) if ordered else 0.0,
+        "p95_row_ms": round(ordered[math.ceil(0.95 * len(ordered)) - 1] * 1000, 1) if ordered else 0.0,
+    }
+
+
+# ---------------------------
+# API JOBS
+# ---------------------------
+# Uploaded files and their results live here, one directory per batch, so a
+# batch interrupted by a restart can be resumed from its results file
+BATCH_DIR = os.getenv("BATCH_DIR", "database/batches")
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Batches running at the same time in one API process; later ones wait
+BATCH_MAX_CONCURRENT = int(os.getenv("BATCH_MAX_CONCURRENT", "1"))
+
+BATCH_ID = re.compile(r"[0-9a-f]{12}")
+
+
+class BatchJob:
+    """One uploaded applicant file and the progress of its run."""
+
+    def __init__(self, batch_id: str, input_path: str, status: str = "queued"):
+        self.id = batch_id
+        self.input_path = input_path
+        self.out_path = os.path.join(os.path.dirname(input_path), "results.jsonl")
+        self.status = status
+        self.processed = 0
+        self.summary: Optional[Dict] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {"batch_id": self.id, "status": self.status, "processed": self.processed,
+                "summary": self.summary, "error": self.error}
+
+
+class BatchJobs:
+    """
+    Runs uploaded batches on background threads, at most `max_concurrent` at
+    a time. A running batch holds an flock on `running` in its directory and
+    a finished one has `summary.json`, so every process sharing `base_dir`
+    (other workers, or this one after a restart) sees the same status: a
+    batch that is neither locked nor finished is `interrupted` until resumed.
+    """
+
+    def __init__(self, base_dir: str = BATCH_DIR, max_concurrent: int = BATCH_MAX_CONCURRENT,
+                 workers: int = BATCH_WORKERS):
+        self.base_dir = base_dir
+        self.workers = workers
+        self._jobs: Dict[str, BatchJob] = {}  # batches queued or run by this process
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def submit(self, filename: str, data: bytes) -> BatchJob:
+        """Store an uploaded CSV/JSONL file and start onboarding it."""
+        ext = os.path.splitext(filename.lower())[1]
+        if ext not in (".csv", ".jsonl", ".ndjson"):
+            raise ValueError("Applicant file must be .csv or .jsonl")
+        batch_id = uuid.uuid4().hex[:12]
+        batch_dir = os.path.join(self.base_dir, batch_id)
+        os.makedirs(batch_dir, exist_ok=True)
+        input_path = os.path.join(batch_dir, "applicants" + (".csv" if ext == ".csv" else ".jsonl"))
+        with open(input_path, "wb") as f:
+            f.write(data)
+        job = BatchJob(batch_id, input_path)
+        with self._lock:
+            self._jobs[batch_id] = job
+        self._start(job)
+        return job
+
+    def get(self, batch_id: str) -> Optional[BatchJob]:
+        if not BATCH_ID.fullmatch(batch_id):
+            return None
+        with self._lock:
+            return self._get(batch_id)
+
+    def _get(self, batch_id: str) -> Optional[BatchJob]:
+        job = self._jobs.get(batch_id)
+        if job is not None and job.status in ("queued", "running"):
+            return job
+        on_disk = self._from_disk(batch_id)
+        if on_disk is not None and job is not None and job.status == "failed" and on_disk.status == "interrupted":
+            return job  # keep the error message of a run that failed here
+        return on_disk
+
+    def resume(self, batch_id: str, retry_errors: bool = False) -> Optional[BatchJob]:
+        """
+        Run a stopped batch again; rows that already have a result are skipped.
+        A batch that is queued or running, here or in another process, is
+        returned as it is instead.
+        """
+        if not BATCH_ID.fullmatch(batch_id):
+            return None
+        with self._lock:
+            job = self._get(batch_id)
+            if job is None or job.status in ("queued", "running"):
+                return job
+            job.status, job.error = "queued", None
+            self._jobs[batch_id] = job
+        self._start(job, retry_errors)
+        return job
+
+    def _from_disk(self, batch_id: str) -> Optional[BatchJob]:
+        batch_dir = os.path.join(self.base_dir, batch_id)
+        for name in ("applicants.csv", "applicants.jsonl"):
+            path = os.path.join(batch_dir, name)
+            if os.path.exists(path):
+                job = BatchJob(batch_id, path, status="interrupted")
+                job.processed = len(load_checkpoint(job.out_path))
+                summary_path = os.path.join(batch_dir, "summary.json")
+                if _is_locked(os.path.join(batch_dir, "running")):
+                    job.status = "running"
+                elif os.path.exists(summary_path):
+                    with open(summary_path, encoding="utf-8") as f:
+                        job.status, job.summary = "done", json.load(f)
+                return job
+        return None
+
+    def _start(self, job: BatchJob, retry_errors: bool = False):
+        threading.Thread(target=self._run, args=(job, retry_errors), name=f"batch-{job.id}", daemon=True).start()
+
+    def _run(self, job: BatchJob, retry_errors: bool):
+        batch_dir = os.path.dirname(job.input_path)
+        with self._slots, open(os.path.join(batch_dir, "running"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Resumed by another process while this one was waiting for a slot
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+                job.status = "running"
+                return
+            job.status = "running"
+            summary_path = os.path.join(batch_dir, "summary.json")
+            if os.path.exists(summary_path):
+                os.remove(summary_path)  # from an earlier run; rewritten when this one finishes
+            rows_done = set(load_checkpoint(job.out_path))
+            job.processed = len(rows_done)
+
+            def progress(result: Dict):
+                rows_done.add(result["row"])
+                job.processed = len(rows_done)
+
+            try:
+                job.summary = run_batch(job.input_path, job.out_path, self.workers, retry_errors, on_result=progress)
+                tmp_path = summary_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(job.summary, f)
+                os.replace(tmp_path, summary_path)
+                job.status = "done"
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+
+
+def _is_locked(path: str) -> bool:
+    """Whether a batch run (in any process) holds the flock on `path`."""
+    try:
+        with open(path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(f, fcntl.LOCK_UN)
+            return False
+    except OSError:
+        return False
+
+
+batch_jobs = BatchJobs()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Onboard a file of applicants without the chat agent")
+    parser.add_argument("input", help="CSV (with header) or JSONL: country, national_id, residence_permit, confirmation")
+    parser.add_argument("--out", required=True, help="Per-row results (JSONL); an existing file is resumed")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--retry-errors", action="store_true", help="Run rows whose earlier result was an error again")
+    args = parser.parse_args()
+
+    summary = run_batch(args.input, args.out, args.workers, args.retry_errors)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Request body size limits enforced before the body is buffered
+"""
+
+import os
+import re
+from typing import Optional, Sequence, Tuple
+
+# ---------------------------
+# LIMITS
+# ---------------------------
+# Bodies of routes without their own limit (e.g. /chat JSON)
+MAX_REQUEST_BODY_BYTES = int(os.getenv("MAX_REQUEST_BODY_BYTES", str(1024 * 1024)))
+# Multipart boundaries and part headers around an uploaded file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class BodySizeLimitMiddleware:
+    """
+    Answers 413 when a request body is larger than the limit of its path.
+    Starlette reads a whole multipart body (spooling it to memory/disk)
+    before the endpoint runs, so the limit has to be applied here: first on
+    Content-Length, then on the bytes actually received, for chunked bodies
+    or a Content-Length that lies. `limits` are (path regex, max bytes),
+    first match wins.
+    """
+
+    def __init__(self, app, limits: Sequence[Tuple[str, int]] = (), default: int = MAX_REQUEST_BODY_BYTES):
+        self.app = app
+        self.limits = [(re.compile(pattern), max_bytes) for pattern, max_bytes in limits]
+        self.default = default
+
+    def limit_for(self, path: str) -> int:
+        return next((max_bytes for pattern, max_bytes in self.limits if pattern.match(path)), self.default)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = self.limit_for(scope["path"])
+        length = _content_length(scope)
+        if length is not None and length > limit:
+            await _reject(send, limit)
+            return
+
+        received = 0
+        started = rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    rejected = True
+                    if not started:
+                        await _reject(send, limit)
+                    # The app sees a client that went away and stops reading
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if rejected:
+                return  # our 413 is the response
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+
+def _content_length(scope) -> Optional[int]:
+    for name, value in scope.get("headers", ()):
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def _reject(send, limit: int):
+    body = f'{{"detail":"Request body exceeds {limit // 1024} KB"}}'.encode()
+    await send({"type": "http.response.start", "status": 413,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                            (b"connection", b"close")]})
+    await send({"type": "http.response.body", "body": body})
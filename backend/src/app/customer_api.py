@@ -1,10 +1,17 @@
 import sqlite3
+import base64
 import json
+import logging
+import time
 import uuid
 import os
+from datetime import datetime, timezone
 from pydantic import BaseModel, Field, ValidationError
-from typing import List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
+from app.profiling import traced
+
+logger = logging.getLogger(__name__)
 
 # --------------------------
 # DTO DEFINITIONS
@@ -65,31 +72,134 @@ class CreateCustomerResponseDto(BaseModel):
 # --------------------------
 # DATABASE SETUP
 # --------------------------
+DB_PATH = "database/customers.db"
+
+# Queryable copies of fields inside the JSON blob (filled on insert)
+CUSTOMER_COLUMNS = {"country": "TEXT", "national_id": "TEXT", "created_at": "REAL"}
+
+# Absolute paths of the databases init_db() has set up in this process
+_READY_DBS = set()
+
+
+def ensure_db():
+    """init_db() once per database file; the query paths call this instead of migrating on every call."""
+    if os.path.abspath(DB_PATH) in _READY_DBS and os.path.exists(DB_PATH):
+        return
+    init_db()
+
+
 def init_db():
     os.makedirs("database", exist_ok=True)
-    conn = sqlite3.connect("database/customers.db")
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute("""CREATE TABLE IF NOT EXISTS customers
-                 (id TEXT PRIMARY KEY, data TEXT)""")
+                 (id TEXT PRIMARY KEY, data TEXT, country TEXT, national_id TEXT, created_at REAL)""")
+    _migrate_customers(c)
+    # created_at + implicit rowid is the keyset order used by iter_customer_rows
+    c.execute("CREATE INDEX IF NOT EXISTS idx_customers_created ON customers (created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_customers_country_created ON customers (country, created_at)")
+    _ensure_unique_national_id(c)
+    # Branch notifications are written here in the same transaction as the
+    # customer and delivered asynchronously by app.outbox.OutboxDispatcher
+    c.execute("""CREATE TABLE IF NOT EXISTS notification_outbox
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  customer_key TEXT NOT NULL,
+                  recipient TEXT NOT NULL,
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  next_attempt_at REAL NOT NULL,
+                  claimed_by TEXT,
+                  claimed_at REAL,
+                  last_error TEXT,
+                  created_at REAL NOT NULL,
+                  sent_at REAL)""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_outbox_status_next
+                 ON notification_outbox (status, next_attempt_at)""")
     conn.commit()
     conn.close()
+    _READY_DBS.add(os.path.abspath(DB_PATH))
+
+
+def _migrate_customers(c: sqlite3.Cursor):
+    """Add the queryable columns to databases created without them and backfill from the JSON blob."""
+    existing = {row[1] for row in c.execute("PRAGMA table_info(customers)")}
+    missing = [col for col in CUSTOMER_COLUMNS if col not in existing]
+    if not missing:
+        return
+    for col in missing:
+        try:
+            c.execute(f"ALTER TABLE customers ADD COLUMN {col} {CUSTOMER_COLUMNS[col]}")
+        except sqlite3.OperationalError as e:
+            if "duplicate column" not in str(e):  # another process migrated first
+                raise
+    # The creation time of older rows is unknown; 0 sorts them first
+    c.execute("""UPDATE customers SET
+                   country = COALESCE(country, json_extract(data, '$.identity.country')),
+                   national_id = COALESCE(national_id, json_extract(data, '$.identity.nationalId')),
+                   created_at = COALESCE(created_at, 0)
+                 WHERE country IS NULL OR national_id IS NULL OR created_at IS NULL""")
+
+
+def _ensure_unique_national_id(c: sqlite3.Cursor):
+    """
+    One customer per (country, national_id). Databases created before the
+    constraint may hold duplicates: the oldest row is kept and the others are
+    moved to customers_duplicates for manual review before the index is built.
+    """
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_customers_country_national_id'"
+                 ).fetchone():
+        return
+    c.execute("DROP INDEX IF EXISTS idx_customers_national_id")
+    c.execute("CREATE TABLE IF NOT EXISTS customers_duplicates AS SELECT * FROM customers WHERE 0")
+    duplicates = """SELECT rowid FROM customers c WHERE national_id IS NOT NULL AND EXISTS (
+                      SELECT 1 FROM customers o WHERE o.country IS c.country AND o.national_id = c.national_id
+                      AND o.rowid < c.rowid)"""
+    c.execute(f"INSERT INTO customers_duplicates SELECT * FROM customers WHERE rowid IN ({duplicates})")
+    if c.rowcount > 0:
+        logger.warning("moved %d duplicate customers to customers_duplicates", c.rowcount)
+        c.execute(f"DELETE FROM customers WHERE rowid IN ({duplicates})")
+    c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_customers_country_national_id
+                 ON customers (country, national_id)""")
+
+
+def _enqueue_notification(cursor: sqlite3.Cursor, customer_key: str, branch_email: str):
+    now = time.time()
+    cursor.execute(
+        "INSERT INTO notification_outbox (customer_key, recipient, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+        (customer_key, branch_email, now, now),
+    )
 
 
 # --------------------------
 # CREATE CUSTOMER (POST /customers/personal)
 # --------------------------
-def create_personal_customer(request: CreatePersonalCustomerRequestDto) -> CreateCustomerResponseDto:
-    init_db()
+class CustomerExistsError(ValueError):
+    """A customer with the same country and national ID already exists."""
+
+
+@traced("db.create_customer", "db")
+def create_personal_customer(request: CreatePersonalCustomerRequestDto,
+                             branch_email: Optional[str] = None) -> CreateCustomerResponseDto:
+    """Raises CustomerExistsError when (country, nationalId) is taken, also by a concurrent create."""
+    ensure_db()
 
     # --- emulate API returning 202 Accepted ---
     customer_key = str(uuid.uuid4())
 
     data = request.model_dump_json()
-    conn = sqlite3.connect("database/customers.db")
-    c = conn.cursor()
-    c.execute("INSERT INTO customers (id, data) VALUES (?, ?)", (customer_key, data))
-    conn.commit()
-    conn.close()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        c = conn.cursor()
+        c.execute("INSERT INTO customers (id, data, country, national_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                  (customer_key, data, request.identity.country, request.identity.nationalId, time.time()))
+        if branch_email:
+            _enqueue_notification(c, customer_key, branch_email)
+        conn.commit()
+    except sqlite3.IntegrityError as e:
+        raise CustomerExistsError(
+            f"Customer already exists with external key {request.identity.nationalId}") from e
+    finally:
+        conn.close()
 
     return CreateCustomerResponseDto(customerKey=customer_key)
 
@@ -98,24 +208,139 @@ def create_personal_customer(request: CreatePersonalCustomerRequestDto) -> Creat
 # --------------------------
 # FETCH CUSTOMER BY EXTERNAL KEY
 # --------------------------
-def get_customer_by_external_key(external_key: str) -> Optional[dict]:
-    init_db()
-    conn = sqlite3.connect("database/customers.db")
+@traced("db.get_customer_by_external_key", "db")
+def get_customer_by_external_key(country: str, external_key: str) -> Optional[dict]:
+    ensure_db()
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT data FROM customers")
-    rows = c.fetchall()
+    c.execute("SELECT data FROM customers WHERE country = ? AND national_id = ?", (country, external_key))
+    row = c.fetchone()
     conn.close()
+    return json.loads(row[0]) if row else None
 
-    for row in rows:
-        data = json.loads(row[0])
-        try:
-            key = data["identity"]["nationalId"]
-            if key == external_key:
-                return data
-        except KeyError:
-            continue
 
-    return None
+@traced("db.find_customer_key", "db")
+def find_customer_key(country: str, external_key: str) -> Optional[str]:
+    """customerKey of the customer with this national ID, without loading its data."""
+    ensure_db()
+    conn = sqlite3.connect(DB_PATH)
+    row = conn.execute("SELECT id FROM customers WHERE country = ? AND national_id = ?",
+                       (country, external_key)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+# --------------------------
+# LIST / EXPORT CUSTOMERS (keyset pagination)
+# --------------------------
+Keyset = Tuple[float, int]  # (created_at, rowid) of the last row returned
+
+
+def encode_cursor(key: Keyset) -> str:
+    return base64.urlsafe_b64encode(f"{key[0]!r}:{key[1]}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Keyset:
+    """Raises ValueError for a malformed cursor."""
+    try:
+        created_at, rowid = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return float(created_at), int(rowid)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds or an ISO 8601 date/datetime (UTC if no offset). Raises ValueError."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _customer_query(country: Optional[str], created_after: Optional[float], created_before: Optional[float],
+                    after: Optional[Keyset], limit: int) -> Tuple[str, list]:
+    where, params = [], []
+    if country:
+        where.append("country = ?")
+        params.append(country.upper())
+    if created_after is not None:
+        where.append("created_at >= ?")
+        params.append(created_after)
+    if created_before is not None:
+        where.append("created_at < ?")
+        params.append(created_before)
+    if after is not None:
+        where.append("(created_at, rowid) > (?, ?)")
+        params.extend(after)
+    sql = "SELECT created_at, rowid, id, country, national_id, data FROM customers"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at, rowid LIMIT ?"
+    params.append(limit)
+    return sql, params
+
+
+def iter_customer_rows(country: Optional[str] = None, created_after: Optional[float] = None,
+                       created_before: Optional[float] = None, after: Optional[Keyset] = None,
+                       page_size: int = 1000) -> Iterator[tuple]:
+    """
+    Yield customer rows in (created_at, rowid) order. Rows are read one keyset
+    page at a time, so memory is bounded by `page_size` and no read lock is
+    held while the caller (e.g. a slow HTTP client) consumes them.
+    """
+    ensure_db()
+    # A streaming response may resume the generator on a different threadpool thread
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    try:
+        while True:
+            rows = conn.execute(*_customer_query(country, created_after, created_before, after, page_size)).fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after = (rows[-1][0], rows[-1][1])
+    finally:
+        conn.close()
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+def customer_record(row: tuple) -> Dict:
+    created_at, _, key, country, national_id, data = row
+    return {"customerKey": key, "country": country, "nationalId": national_id,
+            "createdAt": _iso(created_at), "data": json.loads(data)}
+
+
+def customer_ndjson_line(row: tuple) -> str:
+    """Same shape as customer_record, but splices the stored JSON instead of re-encoding it."""
+    created_at, _, key, country, national_id, data = row
+    head = json.dumps({"customerKey": key, "country": country, "nationalId": national_id,
+                       "createdAt": _iso(created_at)}, ensure_ascii=False)
+    return f'{head[:-1]}, "data": {data}}}\n'
+
+
+def row_cursor(row: tuple) -> str:
+    return encode_cursor((row[0], row[1]))
+
+
+def list_customers(country: Optional[str] = None, created_after: Optional[float] = None,
+                   created_before: Optional[float] = None, cursor: Optional[str] = None,
+                   limit: int = 100) -> Tuple[List[Dict], Optional[str]]:
+    """One page of customers and the cursor for the next page (None on the last page)."""
+    after = decode_cursor(cursor) if cursor else None
+    ensure_db()
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute(*_customer_query(country, created_after, created_before, after, limit + 1)).fetchall()
+    conn.close()
+    next_cursor = row_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [customer_record(r) for r in rows[:limit]], next_cursor
 
 
 # --------------------------
@@ -0,0 +1,58 @@
+"""
+Export customers as NDJSON
+
+Streams customers in creation order through keyset pages, so memory use does
+not grow with the table. The cursor of the last exported row is printed to
+stderr; pass it as --cursor to continue an interrupted export.
+
+Run from backend/:
+    python -m app.customer_export --country DK --created-after 2026-01-01 --out customers_dk.ndjson
+"""
+
+import argparse
+import sys
+import time
+
+from app.customer_api import (customer_ndjson_line, decode_cursor, iter_customer_rows,
+                              parse_time, row_cursor)
+
+
+def export(out, country=None, created_after=None, created_before=None, cursor=None, page_size=1000):
+    """Write matching customers to `out`. Returns (rows written, cursor of the last row)."""
+    after = decode_cursor(cursor) if cursor else None
+    count, last = 0, None
+    for row in iter_customer_rows(country, created_after, created_before, after, page_size=page_size):
+        out.write(customer_ndjson_line(row))
+        count, last = count + 1, row
+    return count, (row_cursor(last) if last else cursor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export customers as NDJSON")
+    parser.add_argument("--country", help="DK, SE, NO or FI")
+    parser.add_argument("--created-after", help="Epoch seconds or ISO 8601 (inclusive)")
+    parser.add_argument("--created-before", help="Epoch seconds or ISO 8601 (exclusive)")
+    parser.add_argument("--cursor", help="Resume after this cursor")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--out", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        created_after, created_before = parse_time(args.created_after), parse_time(args.created_before)
+    except ValueError as e:
+        parser.error(str(e))
+
+    t0 = time.perf_counter()
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        count, last_cursor = export(out, args.country, created_after, created_before, args.cursor, args.page_size)
+    finally:
+        if args.out:
+            out.close()
+    elapsed = time.perf_counter() - t0
+    print(f"Exported {count} customers in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f}/s). "
+          f"Last cursor: {last_cursor}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ import re
 import os
 from typing import Tuple, List, Dict, Any
 
+from app.profiling import traced
+
 # ---------------------------
 # GLOBAL SINGLETONS
 # ---------------------------
@@ -12,8 +14,23 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FAISS_PATH = os.path.join(BASE_DIR, "..", "..", "database", "vector_store.faiss")
 METADATA_PATH = os.path.join(BASE_DIR, "..", "..", "database", "metadata.json")
 
+# FAISS_MMAP=1 maps the index file instead of reading it onto the heap, so
+# forked workers (see serve.py) share its pages through the page cache
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+
+
+def _read_faiss_index(path: str):
+    if not os.path.exists(path):
+        return None
+    if FAISS_MMAP:
+        # IO_FLAG_MMAP_IFC also maps flat (IndexFlat*) codes; older faiss only maps IVF lists
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        return faiss.read_index(path, flags)
+    return faiss.read_index(path)
+
+
 EMBED_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
-FAISS_INDEX = faiss.read_index(FAISS_PATH) if os.path.exists(FAISS_PATH) else None
+FAISS_INDEX = _read_faiss_index(FAISS_PATH)
 
 try:
     with open(METADATA_PATH, "r") as f:
@@ -27,42 +44,55 @@ SIMILARITY_THRESHOLD = 0.45
 # ---------------------------
 # HELPERS
 # ---------------------------
-def semantic_search(query: str, k: int = 5) -> Tuple[List[float], List[int]]:
+@traced("embed_query", "embedding")
+def embed_query(query: str):
+    """L2-normalized (1, dim) query embedding, reusable across indexes."""
+    q_emb = EMBED_MODEL.encode([query])
+    faiss.normalize_L2(q_emb)
+    return q_emb
+
+
+@traced("faiss.search", "vector_search")
+def semantic_search(query: str, k: int = 5, q_emb=None) -> Tuple[List[float], List[int]]:
     """Return (distances, indices) arrays for a query using global EMBED_MODEL and FAISS_INDEX."""
     if not FAISS_INDEX:
         raise RuntimeError("FAISS index not available.")
-    q_emb = EMBED_MODEL.encode([query])
-    faiss.normalize_L2(q_emb)
+    if q_emb is None:
+        q_emb = embed_query(query)
     distances, indices = FAISS_INDEX.search(q_emb, k)
     return distances[0].tolist(), indices[0].tolist()
 
 
-def top_matches_from_metadata(distances: List[float], indices: List[int], k: int = 5):
-    """Return list of metadata entries that meet similarity threshold, preserving order."""
+def scored_matches_from_metadata(distances: List[float], indices: List[int]) -> List[Tuple[float, Dict]]:
+    """(similarity, metadata entry) pairs that meet the similarity threshold, preserving order."""
     results = []
     for dist, idx in zip(distances, indices):
         if idx is None or idx < 0 or idx >= len(METADATA):
             continue
         # FAISS returns inner product (cosine) if vectors normalized
         if dist >= SIMILARITY_THRESHOLD:
-            results.append(METADATA[idx])
+            results.append((dist, METADATA[idx]))
     return results
 
 
+def top_matches_from_metadata(distances: List[float], indices: List[int], k: int = 5):
+    """Return list of metadata entries that meet similarity threshold, preserving order."""
+    return [entry for _, entry in scored_matches_from_metadata(distances, indices)]
+
+
 def safe_json_response(obj: Any) -> str:
     """Return compact JSON string for tool output (tools expect str)."""
     return json.dumps(obj, ensure_ascii=False)
 
 
-def auto_notify_branch(customer_key: str, address: str, country: str) -> str:
+def resolve_branch_email(address: str, country: str) -> str:
     """
-    Find responsible branch and notify it. Uses metadata.email if available.
-    Returns email used or empty string.
+    Find the responsible branch's email for an address. Uses metadata.email if available.
+    Returns email or empty string.
     """
-    from app.customer_api import notify_branch  # Import here to avoid circular
     from app.registry_api import get_postal_code
     try:
-        postal_code = get_postal_code(address)
+        postal_code = get_postal_code(address or "")
         # Prefer structured metadata with country/region/email fields
         query = f"{country} branch {postal_code}"
         distances, indices = semantic_search(query, k=3)
@@ -72,7 +102,6 @@ def auto_notify_branch(customer_key: str, address: str, country: str) -> str:
         for h in hits:
             email = h.get("email") or extract_email(h.get("text", ""))
             if email:
-                notify_branch(customer_key, email)
                 return email
 
         # Fallback: attempt a broader search by country only
@@ -81,7 +110,6 @@ def auto_notify_branch(customer_key: str, address: str, country: str) -> str:
         for h in hits:
             email = h.get("email") or extract_email(h.get("text", ""))
             if email:
-                notify_branch(customer_key, email)
                 return email
 
         return ""
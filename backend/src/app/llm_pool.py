@@ -0,0 +1,318 @@
+"""
+Pool of Ollama backends with least-loaded routing, health checks and keep-alive warm-up
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import BaseLLM
+from langchain_core.outputs import LLMResult
+from langchain_ollama import ChatOllama, OllamaLLM
+
+DEFAULT_MODEL = "gpt-oss:120b-cloud"
+DEFAULT_BASE_URL = "http://localhost:11434"
+DEFAULT_KEEP_ALIVE = "30m"
+
+KEEP_ALIVE_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+def keep_alive_seconds(keep_alive: str) -> float:
+    """Ollama keep_alive ("30m", "1h", "300s", "300", "-1") in seconds; negative means forever."""
+    value = str(keep_alive).strip()
+    if value and value[-1] in KEEP_ALIVE_UNITS:
+        return float(value[:-1]) * KEEP_ALIVE_UNITS[value[-1]]
+    return float(value)
+
+
+# ---------------------------
+# BACKEND
+# ---------------------------
+class LLMBackend:
+    """One Ollama endpoint + model, with its own concurrency limit and health state."""
+
+    def __init__(self, base_url: str, model: str, max_concurrency: int = 4,
+                 keep_alive: str = DEFAULT_KEEP_ALIVE, temperature: float = 0):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.keep_alive = keep_alive
+        self.keep_alive_seconds = keep_alive_seconds(keep_alive)
+        self.llm = OllamaLLM(model=model, base_url=self.base_url, temperature=temperature, keep_alive=keep_alive)
+
+        self.outstanding = 0
+        self.failures = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.last_used = 0.0
+        self.last_warmed = 0.0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.probe_failures_total = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.base_url}/{self.model}"
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until and self.outstanding < self.max_concurrency
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "failures": self.failures,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "probe_failures_total": self.probe_failures_total,
+        }
+
+
+# ---------------------------
+# POOL
+# ---------------------------
+class LLMPool:
+    """
+    Routes each LLM call to the healthy backend with the fewest outstanding requests.
+    Backends that fail `eject_after` times in a row are ejected for `eject_seconds`
+    and re-admitted by the first successful health check after that.
+    """
+
+    def __init__(self, backends: List[LLMBackend], health_interval: float = 10.0,
+                 eject_after: int = 3, eject_seconds: float = 30.0, acquire_timeout: float = 60.0):
+        if not backends:
+            raise ValueError("LLMPool needs at least one backend")
+        self.backends = backends
+        self.health_interval = health_interval
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- routing ---
+    def acquire(self, timeout: Optional[float] = None) -> LLMBackend:
+        """Block until a backend has a free slot and return the least loaded one."""
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                candidates = [b for b in self.backends if b.available(now)]
+                if candidates:
+                    backend = min(candidates, key=lambda b: (b.outstanding / b.max_concurrency, b.last_used))
+                    backend.outstanding += 1
+                    backend.requests_total += 1
+                    backend.last_used = now
+                    return backend
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise RuntimeError("No healthy LLM backend available")
+                self._cond.wait(timeout=min(remaining, 1.0))
+
+    def release(self, backend: LLMBackend, ok: bool = True):
+        with self._cond:
+            backend.outstanding -= 1
+            if ok:
+                backend.failures = 0
+            else:
+                self._record_failure(backend)
+            self._cond.notify_all()
+
+    def _record_failure(self, backend: LLMBackend, probe: bool = False):
+        backend.failures += 1
+        if probe:
+            backend.probe_failures_total += 1
+        else:
+            backend.errors_total += 1
+        if backend.failures >= self.eject_after:
+            backend.healthy = False
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+
+    # --- health + keep-alive ---
+    def check_health(self, backend: LLMBackend) -> bool:
+        """A backend is healthy if Ollama answers /api/tags."""
+        try:
+            resp = requests.get(f"{backend.base_url}/api/tags", timeout=2)
+            resp.raise_for_status()
+            return True
+        except Exception:
+            return False
+
+    def warm_up(self, backend: LLMBackend) -> bool:
+        """Load the model into memory and keep it resident for `keep_alive`."""
+        try:
+            resp = requests.post(
+                f"{backend.base_url}/api/generate",
+                json={"model": backend.model, "prompt": "", "keep_alive": backend.keep_alive, "stream": False},
+                timeout=120,
+            )
+            resp.raise_for_status()
+            backend.last_warmed = time.monotonic()
+            return True
+        except Exception:
+            return False
+
+    def needs_warm_up(self, backend: LLMBackend, now: float) -> bool:
+        """
+        True when Ollama is about to unload the model: nothing (request or
+        warm-up) reached the backend for its keep_alive window, less two health
+        intervals of margin.
+        """
+        if backend.keep_alive_seconds <= 0:  # kept forever (<0), or never kept (0)
+            return False
+        idle = now - max(backend.last_used, backend.last_warmed)
+        return idle > backend.keep_alive_seconds - 2 * self.health_interval
+
+    def run_health_checks(self):
+        for backend in self.backends:
+            ok = self.check_health(backend)
+            now = time.monotonic()
+            with self._cond:
+                was_down = False
+                if not ok:
+                    self._record_failure(backend, probe=True)
+                elif now >= backend.ejected_until:
+                    # /api/tags answering says nothing about generations, so an
+                    # ejected backend serves its full eject_seconds first
+                    was_down = not backend.healthy
+                    backend.failures = 0
+                    backend.healthy = True
+                    backend.ejected_until = 0.0
+                self._cond.notify_all()
+            # Re-warm backends that just came back, or whose model is about to unload
+            if ok and backend.healthy and (was_down or self.needs_warm_up(backend, now)):
+                self.warm_up(backend)
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.run_health_checks()
+
+    def start(self):
+        """Warm up all backends and start the background health checker."""
+        for backend in self.backends:
+            if not self.warm_up(backend):
+                with self._cond:
+                    self._record_failure(backend, probe=True)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._health_loop, name="llm-pool-health", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [b.stats() for b in self.backends]
+
+
+# ---------------------------
+# LANGCHAIN ADAPTER
+# ---------------------------
+class PooledOllamaLLM(BaseLLM):
+    """LangChain LLM that dispatches every generation to a backend of an LLMPool."""
+
+    pool: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> LLMResult:
+        backend = self.pool.acquire()
+        try:
+            result = backend.llm._generate(prompts, stop=stop, run_manager=run_manager, **kwargs)
+        except Exception:
+            self.pool.release(backend, ok=False)
+            raise
+        self.pool.release(backend, ok=True)
+        result.llm_output = {**(result.llm_output or {}), "backend": backend.name}
+        return result
+
+    async def _agenerate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> LLMResult:
+        backend = await asyncio.to_thread(self.pool.acquire)
+        try:
+            result = await backend.llm._agenerate(prompts, stop=stop, run_manager=run_manager, **kwargs)
+        except Exception:
+            self.pool.release(backend, ok=False)
+            raise
+        self.pool.release(backend, ok=True)
+        result.llm_output = {**(result.llm_output or {}), "backend": backend.name}
+        return result
+
+
+# ---------------------------
+# CONFIG
+# ---------------------------
+def load_backends_from_env() -> List[LLMBackend]:
+    """
+    Read OLLAMA_BACKENDS, a JSON list such as:
+      [{"base_url": "http://gpu1:11434", "model": "gpt-oss:20b", "max_concurrency": 4},
+       {"base_url": "http://gpu2:11434", "model": "gpt-oss:20b", "max_concurrency": 2}]
+    """
+    raw = os.getenv("OLLAMA_BACKENDS", "").strip()
+    if not raw:
+        return []
+    keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE)
+    backends = []
+    for entry in json.loads(raw):
+        backends.append(LLMBackend(
+            base_url=entry.get("base_url", DEFAULT_BASE_URL),
+            model=entry.get("model", DEFAULT_MODEL),
+            max_concurrency=int(entry.get("max_concurrency", 4)),
+            keep_alive=entry.get("keep_alive", keep_alive),
+        ))
+    return backends
+
+
+# Pools created by get_llm(), started by start_pools()
+_POOLS: List[LLMPool] = []
+
+
+def get_llm():
+    """Return a pooled LLM when OLLAMA_BACKENDS is set, otherwise the single default Ollama model."""
+    backends = load_backends_from_env()
+    if not backends:
+        return OllamaLLM(model=os.getenv("OLLAMA_MODEL", DEFAULT_MODEL), temperature=0)
+    pool = LLMPool(
+        backends,
+        health_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10")),
+        eject_after=int(os.getenv("OLLAMA_EJECT_AFTER", "3")),
+        eject_seconds=float(os.getenv("OLLAMA_EJECT_SECONDS", "30")),
+    )
+    # Warm-up and health checks begin in start_pools(), called from the app lifespan,
+    # so importing the agent does not block on model loads
+    _POOLS.append(pool)
+    return PooledOllamaLLM(pool=pool)
+
+
+def start_pools():
+    """Warm up and start health checks for the pools created by get_llm()."""
+    for pool in _POOLS:
+        pool.start()
+
+
+def stop_pools():
+    for pool in _POOLS:
+        pool.stop()
+
+
+def get_chat_llm():
+    """
+    Chat model for the native tool-calling agent. Uses the first backend of
+    OLLAMA_BACKENDS when set (tool-calling mode is not pooled), otherwise OLLAMA_MODEL.
+    """
+    backends = load_backends_from_env()
+    if backends:
+        b = backends[0]
+        return ChatOllama(model=b.model, base_url=b.base_url, temperature=0, keep_alive=b.keep_alive)
+    return ChatOllama(model=os.getenv("OLLAMA_MODEL", DEFAULT_MODEL), temperature=0)
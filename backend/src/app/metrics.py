@@ -0,0 +1,358 @@
+"""
+Prometheus-style metrics for the API and the agent loop
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+REQUEST_TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+# Prefix of the observation returned when a typed tool call has invalid arguments
+TOOL_ARGS_ERROR_PREFIX = "Invalid tool arguments:"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ---------------------------
+# METRIC TYPES
+# ---------------------------
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _fmt_labels(self, key: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = [f'{k}="{_escape(v)}"' for k, v in pairs]
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._fmt_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], float]):
+        """Compute the (unlabelled) value at scrape time."""
+        self._function = fn
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {float(self._function())}"]
+        with self._lock:
+            return [f"{self.name}{self._fmt_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    lines.append(f"{self.name}_bucket{self._fmt_labels(key, {'le': repr(float(bound))})} {cumulative}")
+                cumulative += counts[-1]
+                lines.append(f"{self.name}_bucket{self._fmt_labels(key, {'le': '+Inf'})} {cumulative}")
+                lines.append(f"{self.name}_sum{self._fmt_labels(key)} {self._sums[key]}")
+                lines.append(f"{self.name}_count{self._fmt_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---------------------------
+# METRICS
+# ---------------------------
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "path", "status"]))
+HTTP_REQUESTS_IN_PROGRESS = REGISTRY.register(Gauge(
+    "http_requests_in_progress", "HTTP requests currently being served"))
+
+LLM_CALL_SECONDS = REGISTRY.register(Histogram(
+    "agent_llm_call_duration_seconds", "Duration of a single LLM call"))
+LLM_CALLS_PER_REQUEST = REGISTRY.register(Histogram(
+    "agent_llm_calls_per_request", "LLM calls made while serving one /chat request",
+    ["mode"], buckets=COUNT_BUCKETS))
+PROMPT_TOKENS_PER_REQUEST = REGISTRY.register(Histogram(
+    "agent_prompt_tokens_per_request", "Prompt tokens of all LLM calls made while serving one /chat request",
+    ["mode"], buckets=REQUEST_TOKEN_BUCKETS))
+COMPLETION_TOKENS_PER_REQUEST = REGISTRY.register(Histogram(
+    "agent_completion_tokens_per_request", "Completion tokens of all LLM calls made while serving one /chat request",
+    ["mode"], buckets=REQUEST_TOKEN_BUCKETS))
+LLM_SECONDS_PER_REQUEST = REGISTRY.register(Histogram(
+    "agent_llm_seconds_per_request", "Total LLM time spent serving one /chat request"))
+LLM_ERRORS = REGISTRY.register(Counter(
+    "agent_llm_errors_total", "LLM calls that raised an error"))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "agent_llm_tokens_total", "Tokens processed by the LLM", ["kind"]))
+PROMPT_TOKENS_PER_CALL = REGISTRY.register(Histogram(
+    "agent_llm_prompt_tokens", "Prompt tokens per LLM call", buckets=TOKEN_BUCKETS))
+
+SCRATCHPAD_TOKENS = REGISTRY.register(Histogram(
+    "agent_scratchpad_tokens", "Estimated scratchpad tokens per LLM call, before/after budgeting",
+    ["stage"], buckets=TOKEN_BUCKETS))
+TOOL_OUTPUT_TOKENS = REGISTRY.register(Histogram(
+    "agent_tool_output_tokens", "Estimated tool output tokens, before/after budgeting",
+    ["tool", "stage"], buckets=TOKEN_BUCKETS))
+
+TOOL_SECONDS = REGISTRY.register(Histogram(
+    "agent_tool_duration_seconds", "Tool execution latency", ["tool"]))
+TOOL_ERRORS = REGISTRY.register(Counter(
+    "agent_tool_errors_total", "Tool executions that raised an error", ["tool"]))
+
+AGENT_ITERATIONS = REGISTRY.register(Histogram(
+    "agent_iterations_per_request", "Agent iterations (actions + final answer) per /chat request",
+    ["mode"], buckets=COUNT_BUCKETS))
+AGENT_PARSE_ERRORS = REGISTRY.register(Counter(
+    "agent_parse_errors_total", "LLM outputs (or typed tool arguments) that could not be parsed and were retried",
+    ["mode"]))
+
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "agent_active_sessions", "Conversation sessions held in memory"))
+CHAT_COALESCED = REGISTRY.register(Counter(
+    "chat_coalesced_total", "Duplicate /chat submits answered with the result of an identical in-flight request"))
+CHAT_REJECTED = REGISTRY.register(Counter(
+    "chat_session_rejected_total", "/chat requests rejected because the session queue was full"))
+SESSION_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "chat_session_queue_wait_seconds", "Time a /chat request waited for earlier requests of its session"))
+
+ADMISSION_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "admission_queue_wait_seconds", "Time an agent turn waited for an execution slot", ["priority"]))
+ADMISSION_QUEUED = REGISTRY.register(Gauge(
+    "admission_queued", "Agent turns waiting for an execution slot", ["priority"]))
+ADMISSION_ACTIVE = REGISTRY.register(Gauge(
+    "admission_active", "Agent turns currently executing"))
+SESSION_DOCS_BYTES = REGISTRY.register(Gauge(
+    "session_documents_bytes", "Memory held by per-session uploaded document indexes (embeddings + text)"))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "admission_rejected_total", "/chat requests rejected by rate limits or queue timeout", ["reason"]))
+BATCH_ROWS = REGISTRY.register(Counter(
+    "batch_onboarding_rows_total", "Applicant rows processed by batch onboarding, by outcome", ["status"]))
+BATCH_ROW_SECONDS = REGISTRY.register(Histogram(
+    "batch_onboarding_row_seconds", "Time to onboard one applicant row in batch mode"))
+
+OUTBOX_BACKLOG = REGISTRY.register(Gauge(
+    "outbox_backlog", "Branch notifications waiting for delivery"))
+OUTBOX_DELIVERIES = REGISTRY.register(Counter(
+    "outbox_deliveries_total", "Branch notification delivery attempts", ["result"]))
+OUTBOX_DISPATCH_ERRORS = REGISTRY.register(Counter(
+    "outbox_dispatch_errors_total", "Outbox dispatch rounds that failed (e.g. database errors)"))
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+# ---------------------------
+# LANGCHAIN CALLBACK HANDLER
+# ---------------------------
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Per-request callback handler. Records LLM, tool and iteration metrics
+    while the agent runs; call `finish()` once the request is done.
+    """
+
+    # handle_parsing_errors=True turns bad LLM output into this pseudo tool call
+    PARSE_ERROR_TOOL = "_Exception"
+
+    def __init__(self, mode: str = "react"):
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._llm_started: Dict[UUID, float] = {}
+        self._tool_started: Dict[UUID, Tuple[str, float]] = {}
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.iterations = 0
+        self.parse_errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    # --- LLM ---
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            self._llm_started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            self._llm_started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        elapsed = self._pop_llm(run_id)
+        LLM_CALL_SECONDS.observe(elapsed)
+        prompt_tokens, completion_tokens = _token_counts(response)
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+            PROMPT_TOKENS_PER_CALL.observe(prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, kind="completion")
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += elapsed
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._pop_llm(run_id)
+        LLM_ERRORS.inc()
+
+    def _pop_llm(self, run_id: UUID) -> float:
+        with self._lock:
+            started = self._llm_started.pop(run_id, None)
+        return time.perf_counter() - started if started is not None else 0.0
+
+    # --- tools ---
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        with self._lock:
+            self._tool_started[run_id] = (name, time.perf_counter())
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        name, elapsed = self._pop_tool(run_id)
+        TOOL_SECONDS.observe(elapsed, tool=name)
+        content = getattr(output, "content", output)
+        if isinstance(content, str) and content.startswith(TOOL_ARGS_ERROR_PREFIX):
+            with self._lock:
+                self.parse_errors += 1
+            AGENT_PARSE_ERRORS.inc(mode=self.mode)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        name, elapsed = self._pop_tool(run_id)
+        TOOL_SECONDS.observe(elapsed, tool=name)
+        TOOL_ERRORS.inc(tool=name)
+
+    def _pop_tool(self, run_id: UUID) -> Tuple[str, float]:
+        with self._lock:
+            name, started = self._tool_started.pop(run_id, ("unknown", time.perf_counter()))
+        return name, time.perf_counter() - started
+
+    # --- agent ---
+    def on_agent_action(self, action: Any, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            self.iterations += 1
+            if getattr(action, "tool", None) == self.PARSE_ERROR_TOOL:
+                self.parse_errors += 1
+                AGENT_PARSE_ERRORS.inc(mode=self.mode)
+
+    def on_agent_finish(self, finish: Any, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            self.iterations += 1
+
+    def finish(self):
+        """Record the per-request aggregates."""
+        LLM_CALLS_PER_REQUEST.observe(self.llm_calls, mode=self.mode)
+        PROMPT_TOKENS_PER_REQUEST.observe(self.prompt_tokens, mode=self.mode)
+        COMPLETION_TOKENS_PER_REQUEST.observe(self.completion_tokens, mode=self.mode)
+        LLM_SECONDS_PER_REQUEST.observe(self.llm_seconds)
+        AGENT_ITERATIONS.observe(self.iterations, mode=self.mode)
+
+
+def _token_counts(response: LLMResult) -> Tuple[int, int]:
+    """Ollama reports prompt_eval_count / eval_count in the final generation_info."""
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for gen in generations:
+            info = gen.generation_info or {}
+            if not info and getattr(gen, "message", None) is not None:
+                info = getattr(gen.message, "response_metadata", {}) or {}
+            prompt_tokens += int(info.get("prompt_eval_count") or 0)
+            completion_tokens += int(info.get("eval_count") or 0)
+    return prompt_tokens, completion_tokens
@@ -0,0 +1,220 @@
+"""
+Asynchronous delivery of branch notifications from the notification_outbox table
+"""
+
+import logging
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+from typing import List, Optional, Tuple
+
+from app.customer_api import DB_PATH, init_db, notify_branch
+from app.metrics import OUTBOX_DELIVERIES, OUTBOX_DISPATCH_ERRORS
+
+logger = logging.getLogger(__name__)
+
+OutboxRow = Tuple[int, str, str, int]  # (id, customer_key, recipient, attempts)
+
+
+# ---------------------------
+# SENDERS
+# ---------------------------
+class MockSender:
+    """Default sender: the mock notification service in customer_api."""
+
+    def send_batch(self, rows: List[OutboxRow]) -> List[Optional[str]]:
+        results = []
+        for _, customer_key, recipient, _ in rows:
+            try:
+                notify_branch(customer_key, recipient)
+                results.append(None)
+            except Exception as e:
+                results.append(str(e))
+        return results
+
+
+class SmtpSender:
+    """Delivers a whole batch over a single SMTP connection."""
+
+    def __init__(self, host: str, port: int = 25, from_addr: str = "onboarding@cloudaibank.com", timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.from_addr = from_addr
+        self.timeout = timeout
+
+    def send_batch(self, rows: List[OutboxRow]) -> List[Optional[str]]:
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        except Exception as e:
+            return [f"connect failed: {e}"] * len(rows)
+        results = []
+        with smtp:
+            for _, customer_key, recipient, _ in rows:
+                try:
+                    # Built inside the try: a malformed address fails this message only
+                    msg = EmailMessage()
+                    msg["From"] = self.from_addr
+                    msg["To"] = recipient
+                    msg["Subject"] = f"New customer assigned to your branch: {customer_key}"
+                    msg.set_content(f"A new personal customer ({customer_key}) has been onboarded and assigned to your branch.")
+                    smtp.send_message(msg)
+                    results.append(None)
+                except Exception as e:
+                    results.append(str(e))
+        return results
+
+
+def get_sender():
+    host = os.getenv("OUTBOX_SMTP_HOST")
+    if host:
+        return SmtpSender(host, int(os.getenv("OUTBOX_SMTP_PORT", "25")))
+    return MockSender()
+
+
+# ---------------------------
+# DISPATCHER
+# ---------------------------
+class OutboxDispatcher:
+    """
+    Background thread that claims due outbox rows in batches, delivers them and
+    reschedules failures with exponential backoff. Rows that fail `max_attempts`
+    times are marked 'dead' and left for inspection.
+    """
+
+    def __init__(self, sender=None, batch_size: int = 50, poll_interval: float = 1.0,
+                 max_attempts: int = 8, base_backoff: float = 2.0, max_backoff: float = 600.0,
+                 claim_timeout: float = 120.0):
+        self.sender = sender or get_sender()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.claim_timeout = claim_timeout
+        self.worker_id = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(DB_PATH, timeout=30)
+
+    def claim_batch(self) -> List[OutboxRow]:
+        """
+        Atomically claim due rows (and rows whose previous claim went stale).
+        A stale claim counts as a failed attempt, so a row whose delivery keeps
+        killing its dispatcher ends up 'dead' instead of being retried forever.
+        """
+        now = time.time()
+        stale_before = now - self.claim_timeout
+        conn = self._connect()
+        try:
+            dead = conn.execute(
+                """UPDATE notification_outbox SET status = 'dead', attempts = attempts + 1,
+                   last_error = 'claim expired', claimed_by = NULL, claimed_at = NULL
+                   WHERE status = 'sending' AND claimed_at < ? AND attempts + 1 >= ?""",
+                (stale_before, self.max_attempts),
+            ).rowcount
+            conn.execute(
+                """UPDATE notification_outbox SET status = 'sending', claimed_by = ?, claimed_at = ?,
+                   attempts = attempts + (CASE WHEN status = 'sending' THEN 1 ELSE 0 END)
+                   WHERE id IN (SELECT id FROM notification_outbox
+                                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                                   OR (status = 'sending' AND claimed_at < ?)
+                                ORDER BY id LIMIT ?)""",
+                (self.worker_id, now, now, stale_before, self.batch_size),
+            )
+            conn.commit()
+            if dead:
+                OUTBOX_DELIVERIES.inc(dead, result="dead")
+            return conn.execute(
+                """SELECT id, customer_key, recipient, attempts FROM notification_outbox
+                   WHERE status = 'sending' AND claimed_by = ? AND claimed_at = ? ORDER BY id""",
+                (self.worker_id, now),
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def dispatch_once(self) -> int:
+        """Deliver one batch. Returns the number of rows processed."""
+        rows = self.claim_batch()
+        if not rows:
+            return 0
+        try:
+            results = self.sender.send_batch(rows)
+        except Exception as e:
+            results = [f"sender failed: {e}"] * len(rows)
+
+        now = time.time()
+        conn = self._connect()
+        try:
+            for (row_id, _, _, attempts), error in zip(rows, results):
+                # Only while the claim is still ours: after claim_timeout another
+                # dispatcher may have re-claimed the row, and its outcome wins
+                if error is None:
+                    conn.execute("""UPDATE notification_outbox SET status = 'sent', sent_at = ?, attempts = ?,
+                                    claimed_by = NULL, claimed_at = NULL
+                                    WHERE id = ? AND status = 'sending' AND claimed_by = ?""",
+                                 (now, attempts + 1, row_id, self.worker_id))
+                    OUTBOX_DELIVERIES.inc(result="sent")
+                    continue
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    OUTBOX_DELIVERIES.inc(result="dead")
+                    status, next_at = "dead", now
+                else:
+                    OUTBOX_DELIVERIES.inc(result="retry")
+                    status, next_at = "pending", now + min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+                conn.execute(
+                    """UPDATE notification_outbox SET status = ?, attempts = ?, next_attempt_at = ?,
+                       last_error = ?, claimed_by = NULL, claimed_at = NULL
+                       WHERE id = ? AND status = 'sending' AND claimed_by = ?""",
+                    (status, attempts, next_at, str(error)[:500], row_id, self.worker_id),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.dispatch_once()
+            except Exception:  # keep the dispatcher alive; unfinished claims expire and are retried
+                logger.exception("outbox dispatch failed")
+                OUTBOX_DISPATCH_ERRORS.inc()
+                processed = 0
+            # Drain quickly while there is a backlog, otherwise poll
+            if processed < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        init_db()
+        self._stop.clear()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def backlog_depth(include_dead: bool = False) -> int:
+    """Number of notifications not yet delivered."""
+    statuses = ("pending", "sending", "dead") if include_dead else ("pending", "sending")
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        try:
+            placeholders = ",".join("?" * len(statuses))
+            return conn.execute(f"SELECT COUNT(*) FROM notification_outbox WHERE status IN ({placeholders})",
+                                statuses).fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
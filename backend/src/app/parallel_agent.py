@@ -0,0 +1,157 @@
+"""
+Multi-action ReAct: several independent tool calls per LLM step, run concurrently
+"""
+
+import os
+import re
+from typing import Iterator, List, Optional, Union
+
+from langchain_classic.agents.agent import AgentExecutor, ExceptionTool
+from langchain_classic.agents.output_parsers import ReActSingleInputOutputParser
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from langchain_core.callbacks import CallbackManagerForChainRun
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+# Upper bound on tools running at the same time within one agent step
+MAX_PARALLEL_TOOLS = int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", "4"))
+# Tools with side effects: never run alongside other actions of the same step.
+# They run one at a time, after the rest of the step has finished.
+SEQUENTIAL_TOOLS = frozenset({"customer_create"})
+
+ACTION_HEADER = re.compile(r"Action\s*\d*\s*:[ \t]*(.*?)\s*Action\s*\d*\s*Input\s*\d*\s*:[ \t]*", re.DOTALL)
+
+
+class BatchedAgentAction(AgentAction):
+    """An action emitted together with others in the same LLM step."""
+
+    batch_index: int = 0
+    batch_size: int = 1
+
+
+# ---------------------------
+# PARSER
+# ---------------------------
+class ReActMultiInputOutputParser(ReActSingleInputOutputParser):
+    """
+    Accepts one or more `Action:` / `Action Input:` pairs in a single output.
+    A single pair (or a Final Answer, or an error) is handled exactly like the
+    single-input parser; several pairs become a list of BatchedAgentActions in
+    the order the model wrote them.
+    """
+
+    def parse(self, text: str) -> Union[AgentAction, List[AgentAction], AgentFinish]:
+        headers = list(ACTION_HEADER.finditer(text))
+        if len(headers) <= 1 or "Final Answer:" in text:
+            return super().parse(text)
+
+        actions = []
+        for i, match in enumerate(headers):
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+            tool_input = text[match.end():end].strip().strip('"')
+            # The first action carries the Thought; later ones only their own Action lines
+            log = text[0 if i == 0 else match.start():end].rstrip()
+            actions.append(BatchedAgentAction(
+                tool=match.group(1).strip(), tool_input=tool_input, log=log,
+                batch_index=i, batch_size=len(headers),
+            ))
+        return actions
+
+    @property
+    def _type(self) -> str:
+        return "react-multi-input"
+
+
+# ---------------------------
+# EXECUTOR
+# ---------------------------
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor that runs all actions of one step on a thread pool (at most
+    `max_parallel_tools` at a time). Actions for SEQUENTIAL_TOOLS run one by one
+    after the others. Observations are returned in the order the actions were
+    emitted, so the scratchpad is deterministic regardless of which tool
+    finishes first.
+    """
+
+    max_parallel_tools: int = MAX_PARALLEL_TOOLS
+
+    def _iter_next_step(
+        self,
+        name_to_tool_map,
+        color_mapping,
+        inputs,
+        intermediate_steps,
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+        try:
+            intermediate_steps = self._prepare_intermediate_steps(intermediate_steps)
+            output = self._action_agent.plan(
+                intermediate_steps,
+                callbacks=run_manager.get_child() if run_manager else None,
+                **inputs,
+            )
+        except OutputParserException as e:
+            yield self._parse_error_step(e, run_manager)
+            return
+
+        if isinstance(output, AgentFinish):
+            yield output
+            return
+
+        actions = [output] if isinstance(output, AgentAction) else output
+        yield from actions
+        yield from self._perform_batch(name_to_tool_map, color_mapping, actions, run_manager)
+
+    def _perform_batch(self, name_to_tool_map, color_mapping, actions: List[AgentAction],
+                       run_manager: Optional[CallbackManagerForChainRun]) -> List[AgentStep]:
+        def perform(action):
+            return self._perform_agent_action(name_to_tool_map, color_mapping, action, run_manager)
+
+        parallel = [i for i, a in enumerate(actions) if a.tool not in SEQUENTIAL_TOOLS]
+        steps: List[Optional[AgentStep]] = [None] * len(actions)
+        workers = min(self.max_parallel_tools, len(parallel))
+        if workers <= 1:
+            for i in parallel:
+                steps[i] = perform(actions[i])
+        else:
+            # map() keeps emission order; the context copy keeps callbacks attached to this run
+            with ContextThreadPoolExecutor(max_workers=workers) as pool:
+                for i, step in zip(parallel, pool.map(perform, [actions[i] for i in parallel])):
+                    steps[i] = step
+        for i, action in enumerate(actions):
+            if steps[i] is None:
+                steps[i] = perform(action)
+        return steps
+
+    def _parse_error_step(self, e: OutputParserException,
+                          run_manager: Optional[CallbackManagerForChainRun]) -> AgentStep:
+        """Same handling of unparseable LLM output as AgentExecutor."""
+        if self.handle_parsing_errors is False:
+            raise ValueError(
+                "An output parsing error occurred. In order to pass this error back to the agent "
+                "and have it try again, pass `handle_parsing_errors=True` to the AgentExecutor. "
+                f"This is the error: {e!s}"
+            ) from e
+        text = str(e)
+        if self.handle_parsing_errors is True:
+            if e.send_to_llm:
+                observation, text = str(e.observation), str(e.llm_output)
+            else:
+                observation = "Invalid or incomplete response"
+        elif isinstance(self.handle_parsing_errors, str):
+            observation = self.handle_parsing_errors
+        else:
+            observation = self.handle_parsing_errors(e)
+
+        output = AgentAction("_Exception", observation, text)
+        if run_manager:
+            run_manager.on_agent_action(output, color="green")
+        observation = ExceptionTool().run(
+            output.tool_input,
+            verbose=self.verbose,
+            color=None,
+            callbacks=run_manager.get_child() if run_manager else None,
+            **self._action_agent.tool_run_logging_kwargs(),
+        )
+        return AgentStep(action=output, observation=observation)
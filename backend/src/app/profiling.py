@@ -0,0 +1,326 @@
+"""
+Opt-in per-request profiling: span timeline plus a sampling profile, kept in a ring buffer
+"""
+
+import functools
+import hashlib
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.metrics import _token_counts
+
+# ---------------------------
+# SETTINGS
+# ---------------------------
+# Fraction of /chat requests profiled without being asked (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Request header that turns profiling on for one request
+PROFILE_HEADER = "X-Profile"
+# Seconds between stack samples of the threads working on a profiled request
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# Finished profiles kept in memory (oldest dropped first)
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+# Required in X-Admin-Token by admin endpoints and by the X-Profile opt-in;
+# when unset, both are disabled. PROFILE_ADMIN_TOKEN is the former name
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or os.getenv("PROFILE_ADMIN_TOKEN", "")
+
+MAX_SPANS = 5000
+MAX_STACK_DEPTH = 128
+
+# Profile of the request being executed; copied into run_in_threadpool and
+# ContextThreadPoolExecutor threads along with the rest of the context
+CURRENT_PROFILE: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+
+# ---------------------------
+# PROFILE
+# ---------------------------
+class RequestProfile:
+    """
+    Timeline of spans (start/end in ms since the request started) and folded
+    stacks sampled every `interval` seconds from the threads that ran part of
+    the request.
+    """
+
+    def __init__(self, name: str, interval: float = PROFILE_INTERVAL, **attrs: Any):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Dict] = []
+        self.dropped_spans = 0
+        self.samples: Counter = Counter()
+        self._t0 = time.perf_counter()
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def ms(self, t: Optional[float] = None) -> float:
+        """perf_counter value (now by default) as ms since the request started."""
+        return ((time.perf_counter() if t is None else t) - self._t0) * 1000
+
+    def attach_current_thread(self):
+        """Include the calling thread in the sampling profile."""
+        ident = threading.get_ident()
+        if ident not in self._threads:
+            with self._lock:
+                self._threads[ident] = threading.current_thread().name
+
+    def add_span(self, name: str, kind: str, start_ms: float, end_ms: float, **attrs: Any):
+        span = {"name": name, "kind": kind, "start_ms": round(start_ms, 3),
+                "duration_ms": round(end_ms - start_ms, 3), "thread": threading.current_thread().name}
+        if attrs:
+            span["attrs"] = attrs
+        with self._lock:
+            if len(self.spans) >= MAX_SPANS:
+                self.dropped_spans += 1
+                return
+            self.spans.append(span)
+
+    # --- sampler ---
+    def start_sampler(self):
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.id}", daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = [t for t in self._threads if t != own]
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[_fold(frame)] += 1
+
+    def finish(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.duration_ms = round(self.ms(), 3)
+
+    # --- export ---
+    def summary(self) -> Dict:
+        by_kind: Dict[str, float] = {}
+        for s in self.spans:
+            by_kind[s["kind"]] = round(by_kind.get(s["kind"], 0.0) + s["duration_ms"], 3)
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "spans": len(self.spans),
+            "samples": sum(self.samples.values()),
+            "ms_by_kind": by_kind,
+            **self.attrs,
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            **self.summary(),
+            "sample_interval_ms": self.interval * 1000,
+            "dropped_spans": self.dropped_spans,
+            "timeline": sorted(self.spans, key=lambda s: s["start_ms"]),
+            "stacks": [{"stack": stack, "count": n} for stack, n in self.samples.most_common()],
+        }
+
+    def folded(self) -> str:
+        """Samples in folded-stack format (flamegraph.pl, speedscope)."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+# ---------------------------
+# RING BUFFER
+# ---------------------------
+class ProfileStore:
+    """The last `size` finished profiles of this process."""
+
+    def __init__(self, size: int = PROFILE_BUFFER_SIZE):
+        self._profiles: "deque[RequestProfile]" = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[Dict]:
+        """Summaries, newest first."""
+        with self._lock:
+            profiles = list(self._profiles)
+        return [p.summary() for p in reversed(profiles)]
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+
+profile_store = ProfileStore()
+
+
+# ---------------------------
+# RECORDING
+# ---------------------------
+def is_admin(token: Optional[str], admin_token: Optional[str] = None) -> bool:
+    """True for the configured ADMIN_TOKEN; always False while none is configured."""
+    expected = ADMIN_TOKEN if admin_token is None else admin_token
+    return bool(expected) and hmac.compare_digest(expected, token or "")
+
+
+def should_profile(header_value: Optional[str], header_allowed: bool = True) -> bool:
+    """
+    Profile when the request asks for it (and `header_allowed`, i.e. the caller
+    is an admin), otherwise for PROFILE_SAMPLE_RATE of requests.
+    """
+    if header_allowed and header_value is not None and header_value.strip().lower() in ("1", "true", "yes", "on"):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def pseudonym(value: str) -> str:
+    """Stable short hash, so profiles can be grouped by session without exposing its id."""
+    return hashlib.sha256(value.encode()).hexdigest()[:12]
+
+
+@contextmanager
+def profile_request(name: str, **attrs: Any):
+    """Profile everything run inside the block (and threads it hands work to)."""
+    profile = RequestProfile(name, **attrs)
+    token = CURRENT_PROFILE.set(profile)
+    profile.start_sampler()
+    try:
+        yield profile
+    finally:
+        CURRENT_PROFILE.reset(token)
+        profile.finish()
+        profile_store.add(profile)
+
+
+@contextmanager
+def span(name: str, kind: str = "code", **attrs: Any):
+    """Timeline span around the block; a no-op unless the request is profiled."""
+    profile = CURRENT_PROFILE.get()
+    if profile is None:
+        yield
+        return
+    profile.attach_current_thread()
+    start = profile.ms()
+    try:
+        yield
+    finally:
+        profile.add_span(name, kind, start, profile.ms(), **attrs)
+
+
+def traced(name: str, kind: str):
+    """Decorator form of `span`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if CURRENT_PROFILE.get() is None:
+                return fn(*args, **kwargs)
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_span(name: str, kind: str, started: float, **attrs: Any):
+    """Span from a perf_counter() value taken earlier until now (waits measured elsewhere)."""
+    profile = CURRENT_PROFILE.get()
+    if profile is not None:
+        profile.add_span(name, kind, profile.ms(started), profile.ms(), **attrs)
+
+
+class ProfilingCallbackHandler(BaseCallbackHandler):
+    """
+    Adds agent iterations, LLM calls and tool calls to a profile's timeline.
+    An iteration runs from one LLM call's start to the next (or to the final
+    answer), so it covers that step's tool calls.
+    """
+
+    def __init__(self, profile: RequestProfile):
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._open: Dict[UUID, Tuple[str, str, float, Dict]] = {}
+        self._iteration: Optional[Tuple[int, float]] = None
+        self._iterations = 0
+
+    def _start(self, run_id: UUID, name: str, kind: str, **attrs: Any):
+        self.profile.attach_current_thread()
+        with self._lock:
+            self._open[run_id] = (name, kind, self.profile.ms(), attrs)
+
+    def _end(self, run_id: UUID, **attrs: Any):
+        with self._lock:
+            opened = self._open.pop(run_id, None)
+        if opened is not None:
+            name, kind, start, start_attrs = opened
+            self.profile.add_span(name, kind, start, self.profile.ms(), **start_attrs, **attrs)
+
+    def _next_iteration(self, final: bool = False):
+        now = self.profile.ms()
+        with self._lock:
+            previous, self._iteration = self._iteration, None
+            if not final:
+                self._iterations += 1
+                self._iteration = (self._iterations, now)
+        if previous is not None:
+            self.profile.add_span(f"iteration {previous[0]}", "iteration", previous[1], now)
+
+    # --- LLM ---
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        self._next_iteration()
+        self._start(run_id, "llm", "llm")
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any):
+        self._next_iteration()
+        self._start(run_id, "llm", "llm")
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        prompt_tokens, completion_tokens = _token_counts(response)
+        self._end(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error=type(error).__name__)
+
+    # --- tools ---
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        self._start(run_id, f"tool:{name}", "tool")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error=type(error).__name__)
+
+    # --- agent ---
+    def on_agent_finish(self, finish: Any, *, run_id: UUID, **kwargs: Any):
+        self._next_iteration(final=True)
+
+    def finish(self):
+        """Close an iteration left open by an error."""
+        self._next_iteration(final=True)
@@ -0,0 +1,70 @@
+"""
+Session tokens: a chat session belongs to the client that started it
+"""
+
+import hmac
+import secrets
+import threading
+from typing import Dict, Optional
+
+# Request header carrying the token returned by a session's first /chat turn
+SESSION_TOKEN_HEADER = "X-Session-Token"
+
+
+class UnknownSession(Exception):
+    """No session with this id has been started (its first /chat turn issues the token)."""
+
+
+class NotSessionOwner(Exception):
+    """The request did not present the session's token."""
+
+
+class SessionTokens:
+    """
+    One random token per session, issued when the session starts with its
+    first /chat turn and required by every later request for the session
+    (chat, documents, delete). Tokens live as long as the chat history and are
+    revoked when the session is ended.
+    """
+
+    def __init__(self):
+        self._tokens: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def start_or_check(self, session_id: str, token: Optional[str]) -> Optional[str]:
+        """
+        Token of a session started by this call, or None when the session
+        already existed and `token` is its token. Raises NotSessionOwner otherwise.
+        """
+        with self._lock:
+            expected = self._tokens.get(session_id)
+            if expected is None:
+                self._tokens[session_id] = issued = secrets.token_urlsafe(24)
+                return issued
+        _compare(expected, token)
+        return None
+
+    def check(self, session_id: str, token: Optional[str]):
+        """Raises UnknownSession or NotSessionOwner unless `token` belongs to the session."""
+        with self._lock:
+            expected = self._tokens.get(session_id)
+        if expected is None:
+            raise UnknownSession(f"No session {session_id}; start it with /chat")
+        _compare(expected, token)
+
+    def revoke(self, session_id: str, token: Optional[str] = None):
+        """Forget the session's token (only `token` itself, when given)."""
+        with self._lock:
+            if token is None or self._tokens.get(session_id) == token:
+                self._tokens.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+
+def _compare(expected: str, token: Optional[str]):
+    if not hmac.compare_digest(expected, token or ""):
+        raise NotSessionOwner(f"This session requires its {SESSION_TOKEN_HEADER}")
+
+
+session_tokens = SessionTokens()
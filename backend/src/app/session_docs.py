@@ -0,0 +1,177 @@
+"""
+Documents uploaded during a conversation, indexed per session in memory
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+
+from app.profiling import span, traced
+
+# Session of the agent turn being executed; set around the agent call so
+# vector_rag can include that session's uploads
+CURRENT_SESSION: ContextVar[Optional[str]] = ContextVar("current_session", default=None)
+
+# ---------------------------
+# LIMITS
+# ---------------------------
+MAX_UPLOAD_BYTES = int(os.getenv("SESSION_DOCS_MAX_UPLOAD_BYTES", str(5 * 1024 * 1024)))
+MAX_PAGES = int(os.getenv("SESSION_DOCS_MAX_PAGES", "50"))
+MAX_CHUNKS_PER_SESSION = int(os.getenv("SESSION_DOCS_MAX_CHUNKS", "300"))
+MAX_SESSIONS = int(os.getenv("SESSION_DOCS_MAX_SESSIONS", "200"))
+TTL_SECONDS = float(os.getenv("SESSION_DOCS_TTL", "1800"))
+# PDFs parsed/embedded at the same time (CPU bound, shares cores with the agent)
+MAX_CONCURRENT_PARSES = int(os.getenv("SESSION_DOCS_MAX_CONCURRENT_PARSES", "2"))
+
+
+class InvalidDocument(ValueError):
+    """Not a readable PDF, or no extractable text."""
+
+
+class DocumentTooLarge(ValueError):
+    """Upload exceeds the size, page or per-session chunk limits."""
+
+
+class SessionIndex:
+    """Chunks of one session's uploads and their embeddings."""
+
+    def __init__(self, dim: int):
+        self.index = faiss.IndexFlatIP(dim)
+        self.chunks: List[Dict] = []
+        self.documents: List[Dict] = []
+        self.nbytes = 0
+        self.last_used = time.monotonic()
+
+
+class SessionDocumentStore:
+    """
+    Per-session FAISS indexes with bounded memory: at most `max_chunks`
+    chunks per session and `max_sessions` sessions (least recently used is
+    evicted first). Sessions unused for `ttl` seconds are dropped on the next
+    access to the store.
+    """
+
+    def __init__(self, max_chunks: int = MAX_CHUNKS_PER_SESSION, max_sessions: int = MAX_SESSIONS,
+                 ttl: float = TTL_SECONDS, max_upload_bytes: int = MAX_UPLOAD_BYTES, max_pages: int = MAX_PAGES):
+        self.max_chunks = max_chunks
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_upload_bytes = max_upload_bytes
+        self.max_pages = max_pages
+        self._sessions: "OrderedDict[str, SessionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._parse_slots = threading.BoundedSemaphore(MAX_CONCURRENT_PARSES)
+
+    # --- ingestion (blocking; call from a worker thread) ---
+    def add_pdf(self, session_id: str, filename: str, data: bytes) -> Dict:
+        """Extract, chunk and embed a PDF into the session's index."""
+        if len(data) > self.max_upload_bytes:
+            raise DocumentTooLarge(f"File exceeds {self.max_upload_bytes // 1024} KB")
+        with self._parse_slots:
+            chunks, pages = self._extract_chunks(filename, data)
+            with self._lock:
+                self._check_room(session_id, len(chunks))  # before spending CPU on embeddings
+            from app.helpers import EMBED_MODEL
+            with span("embed_chunks", "embedding", chunks=len(chunks)):
+                embeddings = EMBED_MODEL.encode(chunks)
+        faiss.normalize_L2(embeddings)
+
+        with self._lock:
+            self._sweep()
+            self._check_room(session_id, len(chunks))
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = SessionIndex(embeddings.shape[1])
+                self._sessions[session_id] = entry
+            source = f"upload:{filename}"
+            entry.index.add(embeddings)
+            entry.chunks.extend({"source": source, "text": ch} for ch in chunks)
+            entry.nbytes += embeddings.nbytes + sum(len(ch) for ch in chunks)
+            doc = {"document": filename, "chunks": len(chunks), "pages": pages}
+            entry.documents.append(doc)
+            self._touch(session_id, entry)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return {**doc, "session_chunks": len(entry.chunks)}
+
+    def _extract_chunks(self, filename: str, data: bytes) -> Tuple[List[str], int]:
+        import fitz
+        from app.data_ingestion import chunk_structured_document, extract_text_from_pdf
+
+        # extract_text_from_pdf works on a path, like the ingestion pipeline
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+            tmp.write(data)
+            tmp.flush()
+            try:
+                with fitz.open(tmp.name) as doc:
+                    pages = doc.page_count
+            except Exception as e:
+                raise InvalidDocument("Not a readable PDF") from e
+            if pages > self.max_pages:
+                raise DocumentTooLarge(f"PDF has {pages} pages, limit is {self.max_pages}")
+            text = extract_text_from_pdf(tmp.name)
+        # Unknown sources fall through to the generic recursive splitter
+        chunks = [c for c in chunk_structured_document(text, f"upload:{filename}") if c.strip()]
+        if not chunks:
+            raise InvalidDocument("No extractable text in PDF")
+        return chunks, pages
+
+    # --- retrieval ---
+    @traced("faiss.session_search", "vector_search")
+    def search(self, session_id: Optional[str], q_emb, k: int = 5, threshold: float = 0.0) -> List[Tuple[float, Dict]]:
+        """(similarity, chunk) pairs from the session's uploads, best first."""
+        if not session_id:
+            return []
+        with self._lock:
+            self._sweep()
+            entry = self._sessions.get(session_id)
+            if entry is None or not entry.chunks:
+                return []
+            self._touch(session_id, entry)
+            distances, indices = entry.index.search(q_emb, min(k, len(entry.chunks)))
+            return [(float(d), entry.chunks[i]) for d, i in zip(distances[0], indices[0])
+                    if i >= 0 and d >= threshold]
+
+    def documents(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return list(entry.documents) if entry else []
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"sessions": len(self._sessions),
+                    "chunks": sum(len(e.chunks) for e in self._sessions.values()),
+                    "bytes": sum(e.nbytes for e in self._sessions.values())}
+
+    # --- housekeeping (caller holds the lock) ---
+    def _check_room(self, session_id: str, new_chunks: int):
+        entry = self._sessions.get(session_id)
+        existing = len(entry.chunks) if entry else 0
+        if existing + new_chunks > self.max_chunks:
+            raise DocumentTooLarge(
+                f"Session document limit reached ({existing} + {new_chunks} > {self.max_chunks} chunks)")
+
+    def _touch(self, session_id: str, entry: SessionIndex):
+        entry.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+
+    def _sweep(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if oldest.last_used >= cutoff:
+                break
+            del self._sessions[oldest_id]
+
+
+session_documents = SessionDocumentStore()
@@ -0,0 +1,96 @@
+"""
+Per-session serialization of /chat requests with duplicate-submit coalescing
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from app.metrics import CHAT_COALESCED, CHAT_REJECTED, SESSION_QUEUE_WAIT_SECONDS
+from app.profiling import record_span
+
+# Requests of one session allowed to wait behind the running one
+SESSION_MAX_QUEUE = int(os.getenv("SESSION_MAX_QUEUE", "8"))
+
+
+class SessionBusyError(Exception):
+    """Raised when a session already has SESSION_MAX_QUEUE requests waiting."""
+
+
+class SessionGate:
+    """
+    Runs at most one agent turn per session at a time; later requests of the
+    same session queue in arrival order (asyncio.Lock is FIFO). A request whose
+    message is identical to one already running or queued for the session does
+    not start a new turn, it waits for that request's result instead; if that
+    request is cancelled, the waiters run the message themselves.
+
+    Must be used from a single event loop (one per worker process).
+    """
+
+    def __init__(self, max_queue: int = SESSION_MAX_QUEUE):
+        self.max_queue = max_queue
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Dict[str, int] = {}  # session -> requests running or queued
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def run(self, session_id: str, message: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        key = (session_id, " ".join(message.split()))
+        while (first := self._inflight.get(key)) is not None:
+            CHAT_COALESCED.inc()
+            try:
+                return await asyncio.shield(first)
+            except asyncio.CancelledError:
+                # Our own cancellation propagates; if only the request we
+                # joined was cancelled (its client went away), run it ourselves
+                if not first.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        if self._pending.get(session_id, 0) > self.max_queue:
+            CHAT_REJECTED.inc()
+            raise SessionBusyError(f"Too many pending requests for session {session_id}")
+
+        result = asyncio.get_running_loop().create_future()
+        self._inflight[key] = result
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        try:
+            queued = time.perf_counter()
+            async with lock:
+                SESSION_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued)
+                record_span("session.wait", "queue", queued)
+                value = await fn()
+            result.set_result(value)
+            return value
+        except BaseException as e:
+            if not result.done():
+                if isinstance(e, asyncio.CancelledError):
+                    result.cancel()
+                else:
+                    result.set_exception(e)
+                    result.exception()  # retrieved here; waiters re-raise it
+            raise
+        finally:
+            del self._inflight[key]
+            self._pending[session_id] -= 1
+            if not self._pending[session_id]:
+                del self._pending[session_id]
+                del self._locks[session_id]
+
+
+async def run_to_completion(fn: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Await fn() even if the caller is cancelled (client went away). Used around
+    the agent turn, which runs on a worker thread that cannot be interrupted:
+    the session lock stays held until that turn has finished writing the
+    history, then the cancellation is re-raised.
+    """
+    task = asyncio.ensure_future(fn())
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        await asyncio.wait([task])
+        if not task.cancelled():
+            task.exception()  # mark retrieved; nobody is waiting for the result
+        raise
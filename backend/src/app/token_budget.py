@@ -0,0 +1,181 @@
+"""
+Token budgeting for tool outputs and the ReAct scratchpad
+"""
+
+import json
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.agents import AgentAction
+
+from app.metrics import SCRATCHPAD_TOKENS, TOOL_OUTPUT_TOKENS
+
+# ---------------------------
+# BUDGETS
+# ---------------------------
+# Approximate tokens a tool's hits may contribute to the scratchpad
+TOOL_BUDGETS = {
+    "vector_rag": 800,
+    "branch_lookup": 400,
+}
+
+# Fields the agent actually uses from each tool's hits
+TOOL_FIELDS = {
+    "vector_rag": ("source", "text"),
+    "branch_lookup": ("text", "email", "branch", "region"),
+}
+
+# Most recent LLM steps kept verbatim; older observations are compressed.
+# An onboarding turn takes 3-4 steps, so compression has to start within them
+KEEP_RECENT_STEPS = 1
+COMPRESSED_OBSERVATION_TOKENS = 80
+# The compressed/verbatim boundary only moves in multiples of this many LLM steps, so
+# between moves the scratchpad grows append-only and the cached prompt prefix holds
+# (with 1 and 2: steps 1-2 are compressed from step 3 on and step 4 only appends)
+COMPRESSION_STRIDE = 2
+
+# Shrinking limits tried in order when compressing JSON: (max string chars, max list items)
+JSON_CLIP_LIMITS = ((200, 10), (120, 5), (80, 3), (40, 2), (16, 1))
+
+TRUNCATION_MARKER = " …[truncated]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return math.ceil(len(text or "") / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    # Prefer cutting at a line or word boundary
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    if boundary > max_chars // 2:
+        cut = cut[:boundary]
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+def _clip_json(value: Any, max_chars: int, max_items: int) -> Any:
+    if isinstance(value, str):
+        return truncate_to_tokens(value, max(1, max_chars // 4))
+    if isinstance(value, dict):
+        return {k: _clip_json(v, max_chars, max_items) for k, v in value.items()}
+    if isinstance(value, list):
+        clipped = [_clip_json(v, max_chars, max_items) for v in value[:max_items]]
+        if len(value) > max_items:
+            clipped.append(f"…[{len(value) - max_items} more]")
+        return clipped
+    return value
+
+
+def compress_observation(text: str, max_tokens: int) -> str:
+    """
+    Shrink a tool observation to about `max_tokens`. JSON observations stay valid
+    JSON: long strings are cut and long lists shortened, each with a marker.
+    Other text is cut like truncate_to_tokens. The result only depends on the
+    input, so a compressed step renders the same on every iteration.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    stripped = text.lstrip()
+    if not stripped.startswith(("{", "[")):
+        return truncate_to_tokens(text, max_tokens)
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return truncate_to_tokens(text, max_tokens)
+    compact = text
+    for max_chars, max_items in JSON_CLIP_LIMITS:
+        compact = json.dumps(_clip_json(value, max_chars, max_items), ensure_ascii=False)
+        if estimate_tokens(compact) <= max_tokens:
+            break
+    return compact
+
+
+# ---------------------------
+# TOOL OUTPUTS
+# ---------------------------
+def budget_hits(tool: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Project hits down to the fields in TOOL_FIELDS, drop duplicate texts and keep
+    hits (in rank order) until TOOL_BUDGETS[tool] is used up; the last hit that
+    does not fit is truncated.
+    """
+    fields = TOOL_FIELDS.get(tool)
+    budget = TOOL_BUDGETS.get(tool)
+    raw_tokens = estimate_tokens(json.dumps(hits, ensure_ascii=False))
+
+    seen = set()
+    out = []
+    remaining = budget if budget is not None else float("inf")
+    for h in hits:
+        projected = {k: h.get(k) for k in (fields or h.keys()) if h.get(k) is not None}
+        key = " ".join(str(projected.get("text", "")).split())
+        if key in seen:
+            continue
+        seen.add(key)
+
+        cost = estimate_tokens(json.dumps(projected, ensure_ascii=False))
+        if cost > remaining:
+            text = projected.get("text")
+            overhead = cost - estimate_tokens(json.dumps(text or "", ensure_ascii=False))
+            if not text or remaining - overhead < 32:
+                break
+            projected["text"] = truncate_to_tokens(text, int(remaining - overhead))
+            out.append(projected)
+            break
+        out.append(projected)
+        remaining -= cost
+
+    TOOL_OUTPUT_TOKENS.observe(raw_tokens, tool=tool, stage="raw")
+    TOOL_OUTPUT_TOKENS.observe(estimate_tokens(json.dumps(out, ensure_ascii=False)), tool=tool, stage="budgeted")
+    return out
+
+
+# ---------------------------
+# SCRATCHPAD
+# ---------------------------
+def _format_step(action: AgentAction, observation: Any, max_observation_tokens: Optional[int] = None,
+                 next_action: Optional[AgentAction] = None) -> str:
+    obs = str(observation)
+    if max_observation_tokens is not None:
+        obs = compress_observation(obs, max_observation_tokens)
+    # Actions emitted in the same step (parallel_agent) share one Thought
+    if next_action is not None and getattr(next_action, "batch_index", 0) > 0:
+        return f"{action.log}\nObservation: {obs}\n"
+    return f"{action.log}\nObservation: {obs}\nThought: "
+
+
+def format_scratchpad(intermediate_steps: Sequence[Tuple[AgentAction, Any]],
+                      keep_recent: int = KEEP_RECENT_STEPS,
+                      compressed_tokens: int = COMPRESSED_OBSERVATION_TOKENS,
+                      stride: int = COMPRESSION_STRIDE) -> str:
+    """
+    Same layout as langchain's format_log_to_str, but observations older than
+    the `keep_recent` most recent LLM steps are compressed to `compressed_tokens`,
+    so the scratchpad does not re-send every full tool output on each iteration.
+    Actions emitted by one LLM call (parallel_agent) count as one step and are
+    compressed together. The boundary advances `stride` steps at a time, so most
+    iterations only append to the previous scratchpad.
+    """
+    steps = list(intermediate_steps)
+    # Index of the LLM step each action belongs to
+    llm_step, n = [], 0
+    for action, _ in steps:
+        if getattr(action, "batch_index", 0) == 0:
+            n += 1
+        llm_step.append(n)
+    cutoff = max(0, n - keep_recent) // stride * stride
+    following = [a for a, _ in steps[1:]] + [None]
+    parts = []
+    for (action, observation), next_action, k in zip(steps, following, llm_step):
+        parts.append(_format_step(action, observation, compressed_tokens if k <= cutoff else None, next_action))
+    scratchpad = "".join(parts)
+
+    if steps:
+        raw = "".join(_format_step(a, o, None, n) for (a, o), n in zip(steps, following))
+        SCRATCHPAD_TOKENS.observe(estimate_tokens(raw), stage="raw")
+        SCRATCHPAD_TOKENS.observe(estimate_tokens(scratchpad), stage="budgeted")
+    return scratchpad
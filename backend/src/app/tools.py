@@ -1,5 +1,9 @@
-from langchain_core.tools import tool
-from app.helpers import semantic_search, top_matches_from_metadata, safe_json_response, extract_email
+from langchain_core.tools import tool, StructuredTool
+from pydantic import BaseModel, Field
+from app.helpers import (semantic_search, top_matches_from_metadata, safe_json_response, extract_email,
+    resolve_branch_email, embed_query, scored_matches_from_metadata, SIMILARITY_THRESHOLD)
+from app.session_docs import CURRENT_SESSION, session_documents
+from app.token_budget import budget_hits
 from app.registry_api import lookup_registry, get_postal_code
 from app.customer_api import (create_personal_customer, CreatePersonalCustomerRequestDto,
     PersonalIdentityDto,
@@ -8,62 +12,45 @@ from app.customer_api import (create_personal_customer, CreatePersonalCustomerRe
     CountryDto,
     LanguageDto,
     notify_branch,
-    get_customer_by_external_key)
+    find_customer_key,
+    CustomerExistsError)
 
 import json
 import re
-import sqlite3
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Literal, Optional, Union
+
+from app.metrics import TOOL_ARGS_ERROR_PREFIX
 
 
 @tool
 def vector_rag(query: str) -> str:
     """
-    Retrieve business rules / policies from the knowledge base.
+    Retrieve business rules / policies from the knowledge base and from documents the user uploaded in this conversation.
     Returns structured JSON: {"status":"ok","hits":[{...},...]} or {"status":"error", "message":...}
     """
     try:
-        distances, indices = semantic_search(query, k=5)
-        hits = top_matches_from_metadata(distances, indices, k=5)
+        q_emb = embed_query(query)
+        index_error = None
+        try:
+            scored = scored_matches_from_metadata(*semantic_search(query, k=5, q_emb=q_emb))
+        except RuntimeError as e:  # no knowledge base index; session uploads can still match
+            scored, index_error = [], e
+        # Documents the user uploaded in this conversation, ranked together with the knowledge base
+        scored += session_documents.search(CURRENT_SESSION.get(), q_emb, k=5, threshold=SIMILARITY_THRESHOLD)
+        if not scored and index_error:
+            raise index_error
+        hits = [entry for _, entry in sorted(scored, key=lambda pair: -pair[0])]
         if not hits:
             return safe_json_response({"status": "ok", "hits": [], "message": "No relevant rules found."})
-        # Return the textual snippets + source
-        out = [{"chunk_id": h.get("chunk_id"), "source": h.get("source"), "text": h.get("text")} for h in hits]
-        return safe_json_response({"status": "ok", "hits": out})
+        # Return the textual snippets + source, deduplicated and within the tool's token budget
+        return safe_json_response({"status": "ok", "hits": budget_hits("vector_rag", hits)})
     except Exception as e:
         return safe_json_response({"status": "error", "message": str(e)})
 
 
-@tool
-def registry_lookup(inp: str) -> str:
-    """
-    Look up a person in the national registry.
-    Input: "COUNTRY ID" (e.g., "DK 0101901234")
-
-    Returns:
-      {
-        "status": "ok",
-        "customer_status": "new" | "existing",
-        "registry": { ... , "country": "...", "nationalId": "...", "externalKeyType": "..." }
-      }
-    """
+def _registry_lookup(country: str, id_number: str) -> str:
+    """Registry lookup for an already parsed country code and national ID."""
     try:
-        inp = inp.strip().strip('"').strip("'")
-        if len(inp) < 4:
-            return safe_json_response({"status": "error", "message": "Input too short for COUNTRY ID"})
-
-        parts = inp.split(maxsplit=1)
-        if len(parts) == 2:
-            country, id_number = parts
-        else:
-            # Assume 2-letter country code
-            country = inp[:2]
-            id_number = inp[2:]
-        country = country.upper()
-        id_number = id_number.replace(" ", "").replace("-", "")
-        match = re.search(r'\d+', id_number)
-        id_number = match.group(0) if match else id_number
-
         if country not in ["DK", "SE", "NO", "FI"]:
             return safe_json_response({"status": "error", "message": f"Invalid country '{country}'. Allowed: DK, SE, NO, FI"})
 
@@ -80,27 +67,10 @@ def registry_lookup(inp: str) -> str:
         result = lookup_registry(country, id_number)
 
         # Check if we already created this customer in DB
-        existing = get_customer_by_external_key(id_number)
-        customer_key = None
-        if existing:
-            # Extract customer key from DB
-            conn = sqlite3.connect("database/customers.db")
-            c = conn.cursor()
-            c.execute("SELECT id, data FROM customers")
-            rows = c.fetchall()
-            conn.close()
-
-            for row in rows:
-                data = json.loads(row[1])
-                try:
-                    if data["identity"]["nationalId"] == id_number:
-                        customer_key = row[0]
-                        break
-                except (json.JSONDecodeError, KeyError, TypeError):
-                    continue
+        customer_key = find_customer_key(country, id_number)
         return safe_json_response({
             "status": "ok",
-            "customer_status": "existing" if existing else "new",
+            "customer_status": "existing" if customer_key else "new",
             "customerKey": customer_key,
             "registry": {
                 "firstName": result.firstName,
@@ -121,6 +91,51 @@ def registry_lookup(inp: str) -> str:
         return safe_json_response({"status": "error", "message": str(e)})
 
 
+def _national_id(text: str) -> str:
+    """
+    National ID from free text: the alphanumeric run starting at the first
+    digit, upper-cased ("cpr 1304802151" -> "1304802151"; FI IDs keep their
+    letters, "020589a000x" -> "020589A000X").
+    """
+    text = text.replace(" ", "").replace("-", "")
+    match = re.search(r"\d[0-9A-Za-z]*", text)
+    return match.group(0).upper() if match else text
+
+
+@tool
+def registry_lookup(inp: str) -> str:
+    """
+    Look up a person in the national registry.
+    Input: "COUNTRY ID" (e.g., "DK 0101901234")
+
+    Returns:
+      {
+        "status": "ok",
+        "customer_status": "new" | "existing",
+        "registry": { ... , "country": "...", "nationalId": "...", "externalKeyType": "..." }
+      }
+    """
+    try:
+        inp = inp.strip().strip('"').strip("'")
+        if len(inp) < 4:
+            return safe_json_response({"status": "error", "message": "Input too short for COUNTRY ID"})
+
+        parts = inp.split(maxsplit=1)
+        if len(parts) == 2:
+            country, id_number = parts
+        else:
+            # Assume 2-letter country code
+            country = inp[:2]
+            id_number = inp[2:]
+        country = country.upper()
+        id_number = _national_id(id_number)
+
+        return _registry_lookup(country, id_number)
+
+    except Exception as e:
+        return safe_json_response({"status": "error", "message": str(e)})
+
+
 @tool
 def verify_residence_permit(data: str) -> str:
     """
@@ -129,19 +144,23 @@ def verify_residence_permit(data: str) -> str:
     """
     try:
         payload = json.loads(data)
-        user_input = payload.get("user_input", "").strip()
-        expected_rp = payload.get("expected_rp", "").strip()
-
-        verified = (user_input == expected_rp)
-
-        return json.dumps({
-            "verified": verified,
-            "user_input": user_input,
-            "expected_rp": expected_rp
-        })
+        return _verify_residence_permit(payload.get("user_input", ""), payload.get("expected_rp", ""))
     except Exception as e:
         return json.dumps({"verified": False, "error": str(e)})
 
+
+def _verify_residence_permit(user_input: str, expected_rp: str) -> str:
+    user_input = (user_input or "").strip()
+    expected_rp = (expected_rp or "").strip()
+
+    verified = (user_input == expected_rp)
+
+    return json.dumps({
+        "verified": verified,
+        "user_input": user_input,
+        "expected_rp": expected_rp
+    })
+
 @tool
 def customer_create(data: str) -> str:
     """
@@ -153,7 +172,11 @@ def customer_create(data: str) -> str:
         payload = json.loads(data)
     except Exception as e:
         return safe_json_response({"status": "error", "message": f"invalid json: {e}"})
+    return _create_customer(payload)
+
 
+def _create_customer(payload: dict) -> str:
+    """Validate, normalize and create a customer from an already parsed payload."""
     missing = []
     identity = payload.get("identity")
     if not identity:
@@ -169,7 +192,7 @@ def customer_create(data: str) -> str:
     ext_key = identity["nationalId"]
 
     # Duplicate check
-    if get_customer_by_external_key(ext_key):
+    if find_customer_key(identity["country"], ext_key):
         return safe_json_response({"status": "conflict", "message": f"Customer already exists with external key {ext_key}"})
 
     # Build PersonalIdentityDto (only allowed fields will be passed)
@@ -267,15 +290,30 @@ def customer_create(data: str) -> str:
     except Exception as e:
         return safe_json_response({"status": "error", "message": f"request DTO error: {e}"})
 
+    # Resolve the branch up front so its notification is queued in the outbox
+    # in the same transaction as the customer insert
+    branch_email = resolve_branch_email(_primary_address(request), identity_dto.country)
+
     # Create the customer (calls app.customer_api.create_personal_customer)
     try:
-        result = create_personal_customer(request)
-        return safe_json_response({"status": "created", "customerKey": result.customerKey})
+        result = create_personal_customer(request, branch_email=branch_email or None)
+        return safe_json_response({"status": "created", "customerKey": result.customerKey,
+                                    "branchEmail": branch_email or None})
+    except CustomerExistsError as e:
+        # Created concurrently since the duplicate check above
+        return safe_json_response({"status": "conflict", "message": str(e)})
     except Exception as e:
         return safe_json_response({"status": "error", "message": str(e)})
 
 
 
+def _primary_address(request: CreatePersonalCustomerRequestDto) -> str:
+    """Single-line "Street Nr, Postal City" address used for branch routing."""
+    if request.contactInformation and request.contactInformation.address:
+        a = request.contactInformation.address[0]
+        return f"{a.streetName} {a.houseNumber}, {a.postalZone} {a.cityName}".strip()
+    return request.identity.address or ""
+
 
 @tool
 def branch_lookup(inp: str) -> str:
@@ -288,17 +326,7 @@ def branch_lookup(inp: str) -> str:
         hits = top_matches_from_metadata(distances, indices, k=5)
         if not hits:
             return safe_json_response({"status": "ok", "hits": [], "message": "Branch information not found."})
-        out = []
-        for h in hits:
-            out.append({
-                "chunk_id": h.get("chunk_id"),
-                "source": h.get("source"),
-                "text": h.get("text"),
-                "email": h.get("email"),
-                "region": h.get("region"),
-                "branch": h.get("branch")
-            })
-        return safe_json_response({"status": "ok", "hits": out})
+        return safe_json_response({"status": "ok", "hits": budget_hits("branch_lookup", hits)})
     except Exception as e:
         return safe_json_response({"status": "error", "message": str(e)})
 
@@ -311,3 +339,81 @@ def get_tools():
     customer_create,
     branch_lookup,
             ]
+
+
+# ---------------------------
+# TYPED TOOLS (native tool-calling mode)
+# ---------------------------
+# Same tools with JSON-schema arguments derived from the customer_api DTOs,
+# so the model emits structured arguments instead of JSON-in-a-string.
+
+class RegistryLookupInput(BaseModel):
+    country: Literal["DK", "SE", "NO", "FI"] = Field(..., description="Country of residence")
+    nationalId: str = Field(..., description="National ID as given; spaces/dashes are removed, letters kept (FI)")
+
+
+class VerifyResidencePermitInput(BaseModel):
+    user_input: str = Field(..., description="Residence permit number given by the user")
+    expected_rp: str = Field(..., description="residencePermitNumber from the registry lookup")
+
+
+class CustomerContactInformationInput(BaseModel):
+    address: List[Union[AddressDto, str]] = Field(
+        ..., description='Structured addresses, or single-line strings like "Tokkerupvej 35, 2730 Herlev"')
+
+
+class CustomerCreateInput(BaseModel):
+    identity: PersonalIdentityDto
+    contactInformation: Optional[CustomerContactInformationInput] = None
+
+
+def _as_dict(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, list):
+        return [_as_dict(v) for v in value]
+    return value
+
+
+def _handle_args_error(error: Exception) -> str:
+    """Return validation errors to the model as an observation so it can retry."""
+    return f"{TOOL_ARGS_ERROR_PREFIX} {error}"
+
+
+def _typed_registry_lookup(country: str, nationalId: str) -> str:
+    return _registry_lookup(country, _national_id(nationalId))
+
+
+def _typed_customer_create(identity: Any, contactInformation: Any = None) -> str:
+    payload = {"identity": _as_dict(identity)}
+    if contactInformation is not None:
+        payload["contactInformation"] = {"address": _as_dict(_as_dict(contactInformation)["address"])}
+    return _create_customer(payload)
+
+
+def get_structured_tools():
+    return [
+        vector_rag,
+        StructuredTool.from_function(
+            func=_typed_registry_lookup,
+            name="registry_lookup",
+            description="Look up a person in the national registry by country and national ID.",
+            args_schema=RegistryLookupInput,
+            handle_validation_error=_handle_args_error,
+        ),
+        StructuredTool.from_function(
+            func=_verify_residence_permit,
+            name="verify_residence_permit",
+            description="Verify the residence permit number given by the user against the registry value.",
+            args_schema=VerifyResidencePermitInput,
+            handle_validation_error=_handle_args_error,
+        ),
+        StructuredTool.from_function(
+            func=_typed_customer_create,
+            name="customer_create",
+            description="Create a new personal customer. Returns status and customerKey.",
+            args_schema=CustomerCreateInput,
+            handle_validation_error=_handle_args_error,
+        ),
+        branch_lookup,
+    ]
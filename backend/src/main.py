@@ -2,23 +2,67 @@
 FastAPI Backend for Cloud AI Bank Onboarding
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import sys
 import os
+import math
+import time
+from contextlib import asynccontextmanager, nullcontext
 
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from app.agent import conv_agent
+from app.agent import conv_agent, store, AGENT_MODE
+from app.llm_pool import start_pools, stop_pools
+from app.metrics import (MetricsCallbackHandler, render_metrics, ACTIVE_SESSIONS,
+    HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_PROGRESS, OUTBOX_BACKLOG, SESSION_DOCS_BYTES, ADMISSION_ACTIVE)
+from app.outbox import OutboxDispatcher, backlog_depth
+from app.session_gate import SessionBusyError, SessionGate, run_to_completion
+from app.admission import AdmissionScheduler, AdmissionTimeout, RateLimited, classify_session
+from app.session_docs import CURRENT_SESSION, DocumentTooLarge, InvalidDocument, session_documents
+from app.session_auth import SESSION_TOKEN_HEADER, NotSessionOwner, UnknownSession, session_tokens
+from app.body_limit import MULTIPART_OVERHEAD_BYTES, BodySizeLimitMiddleware
+from app.customer_api import (customer_ndjson_line, decode_cursor, iter_customer_rows,
+    list_customers, parse_time)
+from app.batch_onboarding import BATCH_MAX_UPLOAD_BYTES, batch_jobs
+from app.profiling import (CURRENT_PROFILE, PROFILE_HEADER, ProfilingCallbackHandler, is_admin,
+    profile_request, profile_store, pseudonym, should_profile, span)
+
+outbox_dispatcher = OutboxDispatcher()
+session_gate = SessionGate()
+admission = AdmissionScheduler()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers (LLM pool warm-up and health checks, branch notification outbox)"""
+    await run_in_threadpool(start_pools)
+    outbox_dispatcher.start()
+    yield
+    outbox_dispatcher.stop()
+    stop_pools()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Cloud AI Bank Onboarding API",
     description="API for banking customer onboarding with AI agent",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
+)
+
+# Oversized uploads are refused before Starlette buffers the multipart body
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits=[
+        (r"^/sessions/[^/]+/documents$", session_documents.max_upload_bytes + MULTIPART_OVERHEAD_BYTES),
+        (r"^/onboarding/batches$", BATCH_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES),
+    ],
 )
 
 # Configure CORS
@@ -30,6 +74,32 @@ app.add_middleware(
     allow_headers=["*"], # Contorls which requests headers are allowed
 )
 
+ACTIVE_SESSIONS.set_function(lambda: len(store))
+OUTBOX_BACKLOG.set_function(backlog_depth)
+SESSION_DOCS_BYTES.set_function(lambda: session_documents.stats()["bytes"])
+ADMISSION_ACTIVE.set_function(lambda: admission.active)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Record latency per route (route template, not raw path, to bound label cardinality)"""
+    HTTP_REQUESTS_IN_PROGRESS.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUESTS_IN_PROGRESS.dec()
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            path=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -40,6 +110,8 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     response: str
     session_id: str
+    # Only in the response to a session's first turn; send it as X-Session-Token from then on
+    session_token: Optional[str] = None
 
 
 class HealthResponse(BaseModel):
@@ -47,6 +119,18 @@ class HealthResponse(BaseModel):
     message: str
 
 
+class CustomerPage(BaseModel):
+    items: List[dict]
+    next_cursor: Optional[str] = None
+
+
+def _time_param(name: str, value: Optional[str]) -> Optional[float]:
+    try:
+        return parse_time(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: expected epoch seconds or ISO 8601")
+
+
 # Endpoints
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -58,33 +142,277 @@ async def health_check():
 
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, response: Response):
     """
     Chat endpoint for conversing with the onboarding agent
     
     - **session_id**: Unique identifier for the conversation session
     - **message**: User's message
+
+    Requests of one session are answered in order; resubmitting a message that
+    is still being processed returns that request's answer. The first turn of a
+    session returns a `session_token`; every later request for the session must
+    send it as `X-Session-Token`.
+
+    With `X-Profile: 1` and a valid `X-Admin-Token` (or when sampled by
+    PROFILE_SAMPLE_RATE) the turn is profiled; the `X-Profile-Id` response
+    header names it under /admin/profiles.
     """
+    client_ip = http_request.client.host if http_request.client else None
     try:
-        # Invoke agent with session management
-        response = conv_agent.invoke(
-            {"input": request.message},
-            config={"configurable": {"session_id": request.session_id}}
-        )
-        
-        # Extract output from agent response
-        agent_response = response.get("output", "")
-        
+        issued = session_tokens.start_or_check(request.session_id, http_request.headers.get(SESSION_TOKEN_HEADER))
+    except NotSessionOwner as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    profile_asked = http_request.headers.get(PROFILE_HEADER)
+    admin = profile_asked is not None and is_admin(http_request.headers.get("X-Admin-Token"))
+    profiling = (profile_request("chat", session=pseudonym(request.session_id))
+                 if should_profile(profile_asked, admin) else nullcontext())
+    try:
+        admission.check_rate(request.session_id, client_ip)
+        with profiling as profile:
+            if profile is not None:
+                response.headers["X-Profile-Id"] = profile.id
+            agent_response = await session_gate.run(
+                request.session_id, request.message,
+                lambda: run_admitted_turn(request.session_id, request.message),
+            )
+        if issued:
+            response.headers[SESSION_TOKEN_HEADER] = issued
         return ChatResponse(
             response=agent_response,
-            session_id=request.session_id
+            session_id=request.session_id,
+            session_token=issued,
         )
-        
+
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except SessionBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except AdmissionTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Agent error: {str(e)}"
         )
+    finally:
+        # A first turn that failed before any history was written did not start
+        # the session: its token never reached the client, so forget it
+        history = store.get(request.session_id)
+        if issued and not (history and history.messages):
+            session_tokens.revoke(request.session_id, issued)
+
+
+async def run_admitted_turn(session_id: str, message: str) -> str:
+    """Wait for an execution slot (ordered by the session's onboarding progress), then run the turn"""
+    history = store.get(session_id)
+    priority = classify_session(history.messages if history else [])
+    async with admission.slot(priority):
+        return await run_to_completion(lambda: run_in_threadpool(run_agent_turn, session_id, message))
+
+
+def run_agent_turn(session_id: str, message: str) -> str:
+    """One agent turn (blocking; runs on the threadpool so the event loop stays free)"""
+    metrics_handler = MetricsCallbackHandler(mode=AGENT_MODE)
+    callbacks = [metrics_handler]
+    profile = CURRENT_PROFILE.get()
+    profile_handler = ProfilingCallbackHandler(profile) if profile is not None else None
+    if profile_handler:
+        callbacks.append(profile_handler)
+    session_token = CURRENT_SESSION.set(session_id)  # lets vector_rag search this session's uploads
+    try:
+        # Invoke agent with session management
+        with span("agent.turn", "agent"):
+            response = conv_agent.invoke(
+                {"input": message},
+                config={
+                    "configurable": {"session_id": session_id},
+                    "callbacks": callbacks,
+                }
+            )
+        # Extract output from agent response
+        return response.get("output", "")
+    finally:
+        CURRENT_SESSION.reset(session_token)
+        metrics_handler.finish()
+        if profile_handler:
+            profile_handler.finish()
+
+
+def require_session(session_id: str, x_session_token: Optional[str] = Header(None)):
+    """Session endpoints need the token returned by the session's first /chat turn"""
+    try:
+        session_tokens.check(session_id, x_session_token)
+    except UnknownSession as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except NotSessionOwner as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+
+@app.post("/sessions/{session_id}/documents", dependencies=[Depends(require_session)])
+async def upload_document(session_id: str, file: UploadFile = File(...)):
+    """
+    Upload a PDF for this conversation. It is chunked and embedded off the event
+    loop into a per-session index that vector_rag searches with the knowledge base.
+    """
+    # BodySizeLimitMiddleware has already refused bodies far over the limit;
+    # one byte past it is enough for add_pdf to report the exact file size limit
+    data = await file.read(session_documents.max_upload_bytes + 1)
+    try:
+        return await run_in_threadpool(session_documents.add_pdf, session_id, file.filename or "document.pdf", data)
+    except DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidDocument as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/sessions/{session_id}/documents", dependencies=[Depends(require_session)])
+async def list_documents(session_id: str):
+    """Documents uploaded in this conversation"""
+    return {"session_id": session_id, "documents": session_documents.documents(session_id)}
+
+
+@app.delete("/sessions/{session_id}", dependencies=[Depends(require_session)])
+async def end_session(session_id: str):
+    """End a conversation: drop its chat history, uploaded documents and token"""
+    had_history = store.pop(session_id, None) is not None
+    had_documents = session_documents.drop(session_id)
+    session_tokens.revoke(session_id)
+    return {"session_id": session_id, "deleted": had_history or had_documents}
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need X-Admin-Token and are disabled while ADMIN_TOKEN is unset"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.post("/onboarding/batches", status_code=202, dependencies=[Depends(require_admin)])
+async def submit_batch(file: UploadFile = File(...)):
+    """
+    Onboard a file of applicants (CSV with header, or JSONL) without the chat agent
+
+    Columns: country, national_id, residence_permit, confirmation (yes/no).
+    Runs in the background; poll /onboarding/batches/{batch_id}.
+    """
+    # Bodies far over the limit never get here (BodySizeLimitMiddleware)
+    data = await file.read(BATCH_MAX_UPLOAD_BYTES + 1)
+    if len(data) > BATCH_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds {BATCH_MAX_UPLOAD_BYTES // 1024} KB")
+    try:
+        job = await run_in_threadpool(batch_jobs.submit, file.filename or "", data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict()
+
+
+def _batch_or_404(batch_id: str):
+    job = batch_jobs.get(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No batch {batch_id}")
+    return job
+
+
+@app.get("/onboarding/batches/{batch_id}", dependencies=[Depends(require_admin)])
+def batch_status(batch_id: str):
+    """Progress of a batch, and its throughput summary once done"""
+    return _batch_or_404(batch_id).to_dict()
+
+
+@app.post("/onboarding/batches/{batch_id}/resume", status_code=202, dependencies=[Depends(require_admin)])
+def resume_batch(batch_id: str, retry_errors: bool = False):
+    """Continue an interrupted or failed batch from its results file"""
+    _batch_or_404(batch_id)
+    return batch_jobs.resume(batch_id, retry_errors).to_dict()
+
+
+@app.get("/onboarding/batches/{batch_id}/results", dependencies=[Depends(require_admin)])
+def batch_results(batch_id: str):
+    """Per-row results so far (NDJSON, in completion order)"""
+    job = _batch_or_404(batch_id)
+    if not os.path.exists(job.out_path):
+        return StreamingResponse(iter(()), media_type="application/x-ndjson")
+
+    def lines():
+        with open(job.out_path, encoding="utf-8") as f:
+            yield from f
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/customers", response_model=CustomerPage, dependencies=[Depends(require_admin)])
+def customers(
+    country: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    One page of customers, oldest first
+
+    - **country**: DK, SE, NO or FI
+    - **created_after** / **created_before**: epoch seconds or ISO 8601 (after is inclusive)
+    - **cursor**: `next_cursor` of the previous page
+    """
+    try:
+        items, next_cursor = list_customers(
+            country, _time_param("created_after", created_after), _time_param("created_before", created_before),
+            cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return CustomerPage(items=items, next_cursor=next_cursor)
+
+
+@app.get("/customers/export", dependencies=[Depends(require_admin)])
+def export_customers(
+    country: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    cursor: Optional[str] = None,
+):
+    """Stream all matching customers as NDJSON (same filters as /customers)"""
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = iter_customer_rows(
+        country, _time_param("created_after", created_after), _time_param("created_before", created_before), after)
+    return StreamingResponse((customer_ndjson_line(r) for r in rows), media_type="application/x-ndjson")
+
+
+def _profile_or_404(profile_id: str):
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile {profile_id} (only the most recent are kept)")
+    return profile
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Profiled requests still in this worker's ring buffer, newest first"""
+    return {"profiles": profile_store.list()}
+
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str):
+    """Span timeline and sampled stacks of one request (JSON download)"""
+    profile = _profile_or_404(profile_id)
+    return JSONResponse(profile.to_dict(),
+                        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.json"'})
+
+
+@app.get("/admin/profiles/{profile_id}/folded", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def download_profile_folded(profile_id: str):
+    """Sampled stacks in folded format, for flamegraph.pl or speedscope"""
+    profile = _profile_or_404(profile_id)
+    return PlainTextResponse(profile.folded(),
+                             headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'})
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/")
@@ -96,6 +424,11 @@ async def root():
         "endpoints": {
             "health": "/health",
             "chat": "/chat (POST)",
+            "customers": "/customers, /customers/export (NDJSON)",
+            "documents": "/sessions/{session_id}/documents (POST PDF)",
+            "batches": "/onboarding/batches (POST CSV/JSONL)",
+            "metrics": "/metrics",
+            "profiles": "/admin/profiles",
             "docs": "/docs"
         }
     }
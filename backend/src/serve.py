@@ -0,0 +1,266 @@
+"""
+Preload-then-fork server for Cloud AI Bank Onboarding
+
+The master process loads the read-only assets once (SentenceTransformer,
+FAISS index, METADATA, registry mock data), freezes the GC and forks
+uvicorn workers that share those pages copy-on-write. Everything with
+threads or sockets (LLM pool health checker, outbox dispatcher, DB
+connections) is created in the workers after the fork.
+
+Every worker listens on its own port (port, port+1, ...) and a load
+balancer pins each session_id to one of them: sessions, session gates,
+admission state, uploaded documents, profiles, batch jobs and /metrics are
+per process. --shared-socket makes all workers accept on one socket, so
+consecutive requests of a session land on different workers; that is only
+safe for stateless endpoints.
+
+Run from backend/:
+    python src/serve.py --workers 4 --port 8000     # workers on 8000-8003
+    python src/serve.py --workers 4 --port 8000 --shared-socket
+    FAISS_MMAP=1 python src/serve.py --workers 4     # map the index file instead of reading it
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SRC_DIR)
+
+# Restart delay for a worker that crashed soon after starting: doubles per
+# consecutive crash up to the maximum, reset once a worker stays up long enough
+RESTART_BACKOFF_BASE = 1.0
+RESTART_BACKOFF_MAX = 60.0
+RESTART_HEALTHY_AFTER = 30.0
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+
+# ---------------------------
+# MASTER
+# ---------------------------
+def preload():
+    """Import the read-only assets in the master, then move them out of the GC's reach."""
+    # One tokenizer thread pool per worker is created after the fork, not inherited
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    gc.disable()
+    import app.helpers  # noqa: F401  EMBED_MODEL, FAISS_INDEX, METADATA
+    import app.registry_api  # noqa: F401  MOCK_DATA
+    # Library code too (torch, langchain, fastapi). app.agent and main are not
+    # imported here: building the agent opens HTTP clients to Ollama, which
+    # must not be shared across the fork
+    import app.tools, app.prompts, app.llm_pool, app.parallel_agent  # noqa: F401, E401
+    import fastapi, uvicorn  # noqa: F401, E401
+    try:
+        import torch  # noqa: F401
+    except ImportError:
+        pass
+    gc.collect()
+    # Frozen objects are never traversed by the collector, so a worker's GC
+    # pass does not write to (and un-share) the pages holding them
+    gc.freeze()
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """Listening socket created once in the master and inherited by the worker(s)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+# ---------------------------
+# WORKER
+# ---------------------------
+def configure_worker_threads(threads: int):
+    """
+    Intra-op thread pools are not fork-safe; size them in the child, before any
+    inference runs there, so every worker gets its own pool of `threads`.
+    """
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    import faiss
+    faiss.omp_set_num_threads(threads)
+
+
+def run_worker(sock: socket.socket, args):
+    # Drop the supervisor's handlers; uvicorn installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+    configure_worker_threads(args.threads_per_worker)
+    import uvicorn
+    config = uvicorn.Config("main:app", log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn_worker(sock: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, args)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+# ---------------------------
+# MEMORY REPORT
+# ---------------------------
+def smaps_rollup(pid: int, proc_dir: str = "/proc") -> Dict[str, int]:
+    """Memory totals (bytes) of a process from /proc/<pid>/smaps_rollup."""
+    out = {}
+    try:
+        with open(os.path.join(proc_dir, str(pid), "smaps_rollup")) as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in SMAPS_FIELDS:
+                    out[key] = int(rest.split()[0]) * 1024
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        pass
+    return out
+
+
+def memory_report(pids: Dict[int, str]) -> List[Dict]:
+    """
+    Per process: RSS, PSS (shared pages divided among the processes mapping
+    them), shared and private (unique) bytes. Summing PSS gives the real total.
+    """
+    rows = []
+    for pid, name in pids.items():
+        m = smaps_rollup(pid)
+        if not m:
+            continue
+        rows.append({
+            "pid": pid,
+            "name": name,
+            "rss": m.get("Rss", 0),
+            "pss": m.get("Pss", 0),
+            "shared": m.get("Shared_Clean", 0) + m.get("Shared_Dirty", 0),
+            "private": m.get("Private_Clean", 0) + m.get("Private_Dirty", 0),
+            "swap": m.get("Swap", 0),
+        })
+    return rows
+
+
+def format_report(rows: List[Dict]) -> str:
+    mb = lambda n: f"{n / 2**20:9.1f}"
+    lines = [f"{'process':<10}{'pid':>8}{'rss MB':>10}{'pss MB':>10}{'shared MB':>10}{'private MB':>11}"]
+    for r in rows:
+        lines.append(f"{r['name']:<10}{r['pid']:>8}{mb(r['rss'])} {mb(r['pss'])} {mb(r['shared'])}  {mb(r['private'])}")
+    lines.append(f"{'total':<10}{'':>8}{mb(sum(r['rss'] for r in rows))} {mb(sum(r['pss'] for r in rows))}"
+                 f" {'':>9}  {mb(sum(r['private'] for r in rows))}")
+    return "\n".join(lines)
+
+
+# ---------------------------
+# SUPERVISOR
+# ---------------------------
+def restart_delay(crashes: int) -> float:
+    """Seconds to wait before restarting a worker after `crashes` quick crashes in a row."""
+    if crashes <= 0:
+        return 0.0
+    return min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** (crashes - 1))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Preload-then-fork server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads-per-worker", type=int, default=1,
+                        help="torch/FAISS intra-op threads per worker (workers x threads <= cores)")
+    parser.add_argument("--shared-socket", action="store_true",
+                        help="All workers accept on one port instead of port+i; stateless endpoints only")
+    parser.add_argument("--no-preload", action="store_true", help="Load assets in each worker (for comparison)")
+    parser.add_argument("--report-interval", type=float, default=60.0,
+                        help="Seconds between memory reports (0 disables)")
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+
+    if not args.no_preload:
+        t0 = time.perf_counter()
+        preload()
+        print(f"[serve] preloaded assets in {time.perf_counter() - t0:.1f}s (pid {os.getpid()})", flush=True)
+
+    if args.shared_socket:
+        shared = bind_socket(args.host, args.port)
+        sockets = {i: shared for i in range(args.workers)}
+        where = f"port {args.port} (shared socket: stateless endpoints only)"
+    else:
+        sockets = {i: bind_socket(args.host, args.port + i) for i in range(args.workers)}
+        where = f"ports {args.port}-{args.port + args.workers - 1}"
+    workers = {spawn_worker(sockets[i], args): i for i in range(args.workers)}
+    started = {i: time.monotonic() for i in range(args.workers)}
+    crashes = {i: 0 for i in range(args.workers)}
+    pending: Dict[int, float] = {}  # slot -> monotonic time of its delayed restart
+    print(f"[serve] {args.workers} workers on http://{args.host}, {where}", flush=True)
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        pending.clear()
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    next_report = time.monotonic() + args.report_interval
+    while workers or pending:
+        now = time.monotonic()
+        for slot, at in list(pending.items()):
+            if now >= at and not stopping:
+                del pending[slot]
+                workers[spawn_worker(sockets[slot], args)] = slot
+                started[slot] = now
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid:
+            slot = workers.pop(pid)
+            if not stopping:
+                uptime = now - started[slot]
+                crashes[slot] = 0 if uptime >= RESTART_HEALTHY_AFTER else crashes[slot] + 1
+                delay = restart_delay(crashes[slot])
+                print(f"[serve] worker {pid} exited ({os.waitstatus_to_exitcode(status)}) after {uptime:.1f}s, "
+                      f"restarting in {delay:.0f}s", flush=True)
+                pending[slot] = now + delay
+            continue
+        if args.report_interval and now >= next_report:
+            names = {os.getpid(): "master", **{p: f"worker-{i}" for p, i in workers.items()}}
+            print("[serve] memory\n" + format_report(memory_report(names)), flush=True)
+            next_report = now + args.report_interval
+        time.sleep(0.2)
+    for sock in set(sockets.values()):
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
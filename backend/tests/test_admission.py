@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.admission import AdmissionScheduler, AdmissionTimeout, RateLimited, classify_session
+from app.prompts import ASK_CONFIRMATION, ASK_NATIONAL_ID, ASK_RESIDENCE_PERMIT, ONBOARDING_WORKFLOW
+
+
+def test_priority_follows_the_last_agent_question():
+    assert classify_session([]) == "new"
+    assert classify_session([HumanMessage("Hi"), AIMessage(ASK_NATIONAL_ID)]) == "in_progress"
+    assert classify_session([AIMessage(ASK_RESIDENCE_PERMIT)]) == "in_progress"
+    reply = f"Identity verified: Ann Lee\nCitizenship: Denmark\nAddress: Herlev\n{ASK_CONFIRMATION}"
+    assert classify_session([HumanMessage("DK 1304802151"), AIMessage(reply), HumanMessage("Yes")]) == "confirmation"
+
+
+def test_markers_appear_in_the_agent_prompt():
+    for question in (ASK_CONFIRMATION, ASK_NATIONAL_ID, ASK_RESIDENCE_PERMIT):
+        assert question in ONBOARDING_WORKFLOW
+
+
+def test_freed_slots_are_shared_by_weight():
+
+    async def main():
+        scheduler = AdmissionScheduler(max_concurrency=1, weights={"new": 1, "confirmation": 3}, queue_timeout=5)
+        order = []
+
+        async def turn(priority):
+            async with scheduler.slot(priority):
+                order.append(priority)
+                await asyncio.sleep(0)
+
+        await scheduler.acquire("new")  # hold the only slot while the queues fill
+        tasks = [asyncio.create_task(turn(p)) for p in ["new"] * 4 + ["confirmation"] * 12]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(main())
+    assert order[:8].count("confirmation") == 6  # 3:1 while both are backlogged
+
+
+def test_queue_timeout_and_rate_limit():
+
+    async def main():
+        scheduler = AdmissionScheduler(max_concurrency=1, queue_timeout=0.01, session_rate=1, session_burst=1)
+        await scheduler.acquire("new")
+        with pytest.raises(AdmissionTimeout):
+            await scheduler.acquire("new")
+        scheduler.release()
+        assert scheduler.active == 0
+        scheduler.check_rate("s", None)
+        with pytest.raises(RateLimited):
+            scheduler.check_rate("s", None)
+
+    asyncio.run(main())
@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from app import batch_onboarding
+from app.batch_onboarding import BatchJobs, run_batch
+
+# Mock registry: adult, adult with a residence permit, minor
+REGISTRY = {
+    ("DK", "0101901234"): {"dateOfBirth": "1990-01-01", "residencePermitNumber": False},
+    ("NO", "01019012345"): {"dateOfBirth": "1990-01-01", "residencePermitNumber": "RP-1"},
+    ("SE", "201501011234"): {"dateOfBirth": date.today().replace(year=date.today().year - 10).isoformat(),
+                             "residencePermitNumber": False},
+}
+
+
+@pytest.fixture
+def tools(monkeypatch):
+    """app.tools replaced by the mock registry and an in-memory customer table."""
+    state = SimpleNamespace(customers={}, created=[], lookups=[], fail_lookup=set())
+
+    def registry_lookup(country, national_id):
+        state.lookups.append((country, national_id))
+        if (country, national_id) in state.fail_lookup:
+            return json.dumps({"status": "error", "message": "registry unavailable"})
+        if (country, national_id) not in REGISTRY:
+            return json.dumps({"status": "error", "message": "not found"})
+        key = state.customers.get((country, national_id))
+        registry = {**REGISTRY[(country, national_id)], "country": country, "nationalId": national_id,
+                    "externalKeyType": "NationalId", "firstName": "Ada", "lastName": "Test", "address": "Gade 1, 1000 By"}
+        return json.dumps({"status": "ok", "customer_status": "existing" if key else "new", "customerKey": key,
+                           "registry": registry})
+
+    def create_customer(payload):
+        identity = payload["identity"]
+        key = (identity["country"], identity["nationalId"])
+        time.sleep(0.02)  # a later row for the same person would overtake this one if not held back
+        if key in state.customers:
+            return json.dumps({"status": "conflict", "message": "exists"})
+        state.customers[key] = f"C{len(state.customers) + 1}"
+        state.created.append(key)
+        return json.dumps({"status": "created", "customerKey": state.customers[key], "branchEmail": "b@bank"})
+
+    def verify_residence_permit(user_input, expected_rp):
+        return json.dumps({"verified": user_input.strip() == expected_rp})
+
+    fake = SimpleNamespace(_registry_lookup=registry_lookup, _create_customer=create_customer,
+                           _verify_residence_permit=verify_residence_permit)
+    monkeypatch.setattr(batch_onboarding, "_tools", lambda: fake)
+    return state
+
+
+def write_csv(path, *rows):
+    path.write_text("country,national_id,residence_permit,confirmation\n" + "".join(r + "\n" for r in rows))
+    return str(path)
+
+
+def read_results(path):
+    return {r["row"]: r for r in map(json.loads, open(path, encoding="utf-8"))}
+
+
+def test_row_outcomes(tmp_path, tools):
+    in_path = write_csv(tmp_path / "in.csv",
+                        "DK,010190-1234,,yes",      # created (dash removed)
+                        "SE,201501011234,,yes",     # underage
+                        "NO,01019012345,,yes",      # residence permit missing
+                        "NO,01019012345,RP-2,yes",  # residence permit does not verify
+                        "FI,0101,,yes")             # registry error
+    out = str(tmp_path / "out.jsonl")
+    summary = run_batch(in_path, out, workers=2)
+
+    results = read_results(out)
+    assert results[1]["status"] == "created" and results[1]["nationalId"] == "0101901234"
+    assert results[2] == {**results[2], "status": "rejected", "reason": "applicants must be 18 or older"}
+    assert results[3]["reason"] == "residence permit required"
+    assert results[4]["reason"] == "residence permit verification failed"
+    assert results[5]["status"] == "error"
+    assert summary["by_status"] == {"created": 1, "rejected": 3, "error": 1}
+    assert tools.created == [("DK", "0101901234")]
+
+
+def test_duplicate_only_after_an_onboarded_row(tmp_path, tools):
+    in_path = write_csv(tmp_path / "in.csv",
+                        "DK,0101901234,,no",        # declined
+                        "DK,0101901234,,yes",       # so this one is onboarded, after the first finished
+                        "DK,0101 901234,,yes",      # same person again: duplicate
+                        "NO,01019012345,RP-1,yes",
+                        "NO,01019012345,RP-1,yes")
+    out = str(tmp_path / "out.jsonl")
+    run_batch(in_path, out, workers=4)
+
+    statuses = {row: r["status"] for row, r in read_results(out).items()}
+    assert statuses == {1: "declined", 2: "created", 3: "duplicate", 4: "created", 5: "duplicate"}
+    assert sorted(tools.created) == [("DK", "0101901234"), ("NO", "01019012345")]
+
+
+def test_existing_customer_and_checkpoint_skip(tmp_path, tools):
+    tools.customers[("DK", "0101901234")] = "C0"
+    in_path = write_csv(tmp_path / "in.csv", "DK,0101901234,,yes", "NO,01019012345,RP-1,yes")
+    out = str(tmp_path / "out.jsonl")
+    run_batch(in_path, out, workers=2)
+    assert read_results(out)[1]["customerKey"] == "C0"
+
+    lookups = len(tools.lookups)
+    summary = run_batch(in_path, out, workers=2)
+    assert len(tools.lookups) == lookups  # both rows already have a result
+    assert summary["skipped"] == 2 and summary["processed"] == 0
+    assert summary["by_status"] == {"existing": 1, "created": 1}
+
+
+def test_retry_errors(tmp_path, tools):
+    tools.fail_lookup.add(("NO", "01019012345"))
+    in_path = write_csv(tmp_path / "in.csv", "DK,0101901234,,yes", "NO,01019012345,RP-1,yes")
+    out = str(tmp_path / "out.jsonl")
+    run_batch(in_path, out, workers=2)
+    assert read_results(out)[2]["status"] == "error"
+
+    tools.fail_lookup.clear()
+    assert run_batch(in_path, out, workers=2)["processed"] == 0  # errors are final without retry_errors
+    summary = run_batch(in_path, out, workers=2, retry_errors=True)
+    assert summary["processed"] == 1
+    assert read_results(out)[2]["status"] == "created"  # the later line wins
+    assert summary["by_status"] == {"created": 2}
+
+
+def test_resume_from_partly_written_results(tmp_path, tools):
+    in_path = write_csv(tmp_path / "in.csv", "DK,0101901234,,yes", "NO,01019012345,RP-1,yes", "SE,201501011234,,yes")
+    out = tmp_path / "out.jsonl"
+    # Row 1 finished, row 3's line was cut short by a crash, row 2 never ran
+    out.write_text(json.dumps({"row": 1, "country": "DK", "nationalId": "0101901234", "status": "created",
+                               "seconds": 0.1}) + '\n{"row": 3, "sta')
+    summary = run_batch(in_path, str(out), workers=2)
+
+    assert summary["skipped"] == 1 and summary["processed"] == 2
+    assert ("DK", "0101901234") not in tools.lookups
+    results = batch_onboarding.load_checkpoint(str(out))
+    assert {row: r["status"] for row, r in results.items()} == {1: "created", 2: "created", 3: "rejected"}
+
+
+@pytest.fixture
+def fake_run(monkeypatch):
+    """run_batch replaced by one that waits for `release` and counts its calls."""
+    state = {"calls": 0, "release": threading.Event()}
+
+    def run_batch(in_path, out_path, workers, retry_errors, on_result=None):
+        state["calls"] += 1
+        state["release"].wait(5)
+        return {"rows": 1, "processed": 1}
+
+    monkeypatch.setattr(batch_onboarding, "run_batch", run_batch)
+    return state
+
+
+def wait_for(jobs, batch_id, status):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = jobs.get(batch_id)
+        if job.status == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"{batch_id} is {jobs.get(batch_id).status}, expected {status}")
+
+
+def test_other_process_sees_running_then_done(tmp_path, fake_run):
+    worker_a, worker_b = BatchJobs(str(tmp_path)), BatchJobs(str(tmp_path))
+    job = worker_a.submit("applicants.csv", b"country,national_id\nDK,0101901234\n")
+    wait_for(worker_a, job.id, "running")
+
+    assert worker_b.get(job.id).status == "running"
+    assert worker_b.resume(job.id).status == "running"  # refused while the lock is held
+    fake_run["release"].set()
+
+    done = wait_for(worker_b, job.id, "done")
+    assert done.summary == {"rows": 1, "processed": 1}
+    assert fake_run["calls"] == 1
+    assert BatchJobs(str(tmp_path)).get(job.id).status == "done"  # e.g. after a restart
+
+
+def test_unfinished_batch_without_lock_is_interrupted_and_resumable(tmp_path, fake_run):
+    batch_dir = tmp_path / "0123456789ab"
+    batch_dir.mkdir()
+    (batch_dir / "applicants.csv").write_text("country,national_id\nDK,0101901234\n")
+    (batch_dir / "running").touch()  # left behind by a crashed worker; its lock died with it
+
+    jobs = BatchJobs(str(tmp_path))
+    assert jobs.get("0123456789ab").status == "interrupted"
+    fake_run["release"].set()
+    jobs.resume("0123456789ab")
+    wait_for(jobs, "0123456789ab", "done")
+    assert (batch_dir / "summary.json").exists()
@@ -0,0 +1,44 @@
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.body_limit import BodySizeLimitMiddleware
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, limits=[(r"^/upload$", 2048)], default=256)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    @app.post("/echo")
+    async def echo(body: dict):
+        return body
+
+    return TestClient(app)
+
+
+def test_body_within_limit_passes():
+    client = make_client()
+    assert client.post("/upload", files={"file": ("a.pdf", b"x" * 1000)}).json() == {"size": 1000}
+    assert client.post("/echo", json={"a": 1}).json() == {"a": 1}
+
+
+def test_content_length_over_limit_is_refused():
+    client = make_client()
+    response = client.post("/upload", files={"file": ("a.pdf", b"x" * 5000)})
+    assert response.status_code == 413
+    assert client.post("/echo", json={"a": "x" * 300}).status_code == 413
+
+
+def test_streamed_body_over_limit_is_refused():
+    client = make_client()
+
+    def chunks():
+        for _ in range(10):
+            yield b"x" * 100
+
+    # No Content-Length: the middleware counts the bytes received
+    response = client.post("/echo", content=chunks(), headers={"content-type": "application/json"})
+    assert response.status_code == 413
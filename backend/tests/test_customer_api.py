@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app import customer_api
+from app.customer_api import (DB_PATH, CreatePersonalCustomerRequestDto, CustomerExistsError, PersonalIdentityDto,
+                              create_personal_customer, find_customer_key, get_customer_by_external_key, init_db,
+                              iter_customer_rows, list_customers)
+
+
+def request(country, national_id):
+    return CreatePersonalCustomerRequestDto(identity=PersonalIdentityDto(
+        country=country, nationalId=national_id, externalKeyType="NationalId", firstName="A", lastName="B"))
+
+
+def insert_rows(rows):
+    conn = sqlite3.connect(DB_PATH)
+    conn.executemany("INSERT INTO customers (id, data, country, national_id, created_at) VALUES (?, '{}', ?, ?, ?)",
+                     rows)
+    conn.commit()
+    conn.close()
+
+
+def test_keyset_pages_cover_every_row_once(workdir):
+    init_db()
+    # Many rows share created_at: rowid breaks the ties
+    insert_rows([(f"k{i}", "DK" if i % 3 else "SE", f"{i:010d}", float(i // 4)) for i in range(53)])
+    keys, cursor = [], None
+    while True:
+        items, cursor = list_customers(country="DK", cursor=cursor, limit=5)
+        keys += [c["customerKey"] for c in items]
+        if cursor is None:
+            break
+    expected = [f"k{i}" for i in range(53) if i % 3]
+    assert keys == expected
+    assert [r[2] for r in iter_customer_rows(country="DK", page_size=4)] == expected
+
+
+def test_duplicate_national_id_is_rejected(workdir):
+    key = create_personal_customer(request("DK", "0101901234")).customerKey
+    with pytest.raises(CustomerExistsError):
+        create_personal_customer(request("DK", "0101901234"))
+    create_personal_customer(request("SE", "0101901234"))  # unique per country
+    assert find_customer_key("DK", "0101901234") == key
+    assert get_customer_by_external_key("DK", "0101901234")["identity"]["country"] == "DK"
+    assert find_customer_key("NO", "0101901234") is None
+
+
+def test_concurrent_creates_yield_one_customer(workdir):
+    init_db()
+    results = []
+
+    def create():
+        try:
+            results.append(create_personal_customer(request("DK", "0202902345")).customerKey)
+        except CustomerExistsError:
+            results.append(None)
+
+    threads = [threading.Thread(target=create) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len([r for r in results if r]) == 1
+
+
+def test_existing_duplicates_are_moved_aside(workdir, caplog):
+    import os
+    os.makedirs("database")
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("CREATE TABLE customers (id TEXT PRIMARY KEY, data TEXT, country TEXT, national_id TEXT, "
+                 "created_at REAL)")
+    conn.execute("CREATE INDEX idx_customers_national_id ON customers (national_id)")
+    conn.commit()
+    conn.close()
+    insert_rows([("first", "DK", "1", 1.0), ("second", "DK", "1", 2.0), ("other", "SE", "1", 3.0)])
+
+    with caplog.at_level("WARNING", logger="app.customer_api"):
+        init_db()
+    assert "moved 1 duplicate customers" in caplog.text
+    conn = sqlite3.connect(DB_PATH)
+    assert [r[0] for r in conn.execute("SELECT id FROM customers ORDER BY rowid")] == ["first", "other"]
+    assert [r[0] for r in conn.execute("SELECT id FROM customers_duplicates")] == ["second"]
+    conn.close()
+
+
+def test_schema_is_set_up_once_per_database(workdir, monkeypatch):
+    calls = []
+    real_init_db = customer_api.init_db
+    monkeypatch.setattr(customer_api, "init_db", lambda: calls.append(1) or real_init_db())
+    create_personal_customer(request("DK", "0303903456"))
+    find_customer_key("DK", "0303903456")
+    list_customers(limit=5)
+    assert len(calls) == 1
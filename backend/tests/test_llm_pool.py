@@ -0,0 +1,84 @@
+from app.llm_pool import LLMBackend, LLMPool, keep_alive_seconds
+
+
+class ProbePool(LLMPool):
+    """Pool with scripted health probes and recorded warm-ups (no Ollama needed)."""
+
+    def __init__(self, backends, **kwargs):
+        super().__init__(backends, **kwargs)
+        self.tags_ok = True
+        self.warmed = []
+
+    def check_health(self, backend):
+        return self.tags_ok
+
+    def warm_up(self, backend):
+        self.warmed.append(backend.name)
+        return True
+
+
+def make_pool(**kwargs):
+    backend = LLMBackend("http://gpu1:11434", "m", max_concurrency=2, keep_alive="30m")
+    return ProbePool([backend], health_interval=10, eject_after=2, eject_seconds=30, **kwargs), backend
+
+
+def test_keep_alive_seconds():
+    assert keep_alive_seconds("30m") == 1800
+    assert keep_alive_seconds("1h") == 3600
+    assert keep_alive_seconds("45s") == 45
+    assert keep_alive_seconds("300") == 300
+    assert keep_alive_seconds("-1") < 0
+
+
+def test_passing_probe_does_not_cut_ejection_short(monkeypatch):
+    pool, backend = make_pool()
+    now = [1000.0]
+    monkeypatch.setattr("app.llm_pool.time.monotonic", lambda: now[0])
+    for _ in range(2):
+        backend.outstanding += 1
+        pool.release(backend, ok=False)
+    assert not backend.healthy and backend.ejected_until == 1030.0
+
+    pool.run_health_checks()  # /api/tags still answers while generations fail
+    assert not backend.healthy and backend.ejected_until == 1030.0
+
+    now[0] = 1031.0
+    pool.run_health_checks()
+    assert backend.healthy and backend.ejected_until == 0.0
+    assert pool.warmed == [backend.name]  # re-warmed once it came back
+
+
+def test_probe_failures_are_not_request_errors():
+    pool, backend = make_pool()
+    pool.tags_ok = False
+    pool.run_health_checks()
+    assert backend.probe_failures_total == 1
+    assert backend.errors_total == 0
+
+
+def test_rewarm_only_near_keep_alive_expiry(monkeypatch):
+    pool, backend = make_pool()
+    now = [10_000.0]
+    monkeypatch.setattr("app.llm_pool.time.monotonic", lambda: now[0])
+    backend.last_used = now[0]
+
+    now[0] += 60  # idle for a minute of a 30 minute window
+    pool.run_health_checks()
+    assert pool.warmed == []
+
+    now[0] = backend.last_used + 1800 - 15
+    pool.run_health_checks()
+    assert pool.warmed == [backend.name]
+
+
+def test_get_llm_does_not_warm_up_at_import(monkeypatch):
+    from app import llm_pool
+
+    monkeypatch.setenv("OLLAMA_BACKENDS", '[{"base_url": "http://127.0.0.1:9", "model": "m"}]')
+    monkeypatch.setattr(llm_pool, "_POOLS", [])
+    started = []
+    monkeypatch.setattr(LLMPool, "start", lambda self: started.append(self))
+    llm = llm_pool.get_llm()
+    assert started == []
+    llm_pool.start_pools()
+    assert started == [llm.pool]
@@ -0,0 +1,71 @@
+from uuid import uuid4
+
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.outputs import Generation, LLMResult
+
+from app.metrics import (AGENT_PARSE_ERRORS, COMPLETION_TOKENS_PER_REQUEST, LLM_CALLS_PER_REQUEST,
+                         PROMPT_TOKENS_PER_REQUEST, TOOL_ARGS_ERROR_PREFIX, Counter, Histogram,
+                         MetricsCallbackHandler)
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("latency_seconds", "Latency", ["path"], buckets=(0.1, 1, 0.5))
+    for value in (0.05, 0.1, 0.3, 0.7, 2):
+        h.observe(value, path="/chat")
+
+    assert h.render() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{path="/chat",le="0.1"} 2',  # bounds are inclusive, sorted
+        'latency_seconds_bucket{path="/chat",le="0.5"} 3',
+        'latency_seconds_bucket{path="/chat",le="1.0"} 4',
+        'latency_seconds_bucket{path="/chat",le="+Inf"} 5',
+        'latency_seconds_sum{path="/chat"} 3.15',
+        'latency_seconds_count{path="/chat"} 5',
+    ]
+
+
+def test_label_values_are_escaped():
+    c = Counter("errors_total", "Errors", ["tool"])
+    c.inc(tool='say "hi"\\\nbye')
+    assert c.render()[-1] == 'errors_total{tool="say \\"hi\\"\\\\\\nbye"} 1.0'
+
+
+def llm_end(handler, prompt_tokens, completion_tokens):
+    run_id = uuid4()
+    handler.on_llm_start({}, ["prompt"], run_id=run_id)
+    handler.on_llm_end(LLMResult(generations=[[Generation(
+        text="x", generation_info={"prompt_eval_count": prompt_tokens, "eval_count": completion_tokens})]]),
+        run_id=run_id)
+
+
+def tool_call(handler, output):
+    run_id = uuid4()
+    handler.on_tool_start({"name": "registry_lookup"}, "{}", run_id=run_id)
+    handler.on_tool_end(output, run_id=run_id)
+
+
+def samples(histogram, mode):
+    return [line for line in histogram.render() if f'mode="{mode}"' in line]
+
+
+def test_callback_handler_counts_one_request():
+    mode = "test-request"
+    handler = MetricsCallbackHandler(mode=mode)
+    llm_end(handler, 1000, 40)
+    handler.on_agent_action(AgentAction("_Exception", "Invalid Format", "garbled"), run_id=uuid4())
+    llm_end(handler, 1100, 30)
+    handler.on_agent_action(AgentAction("registry_lookup", {}, ""), run_id=uuid4())
+    tool_call(handler, f"{TOOL_ARGS_ERROR_PREFIX} nationalId: field required")
+    tool_call(handler, '{"status": "ok"}')
+    llm_end(handler, 1300, 25)
+    handler.on_agent_finish(AgentFinish({"output": "done"}, ""), run_id=uuid4())
+    handler.finish()
+
+    assert (handler.llm_calls, handler.iterations, handler.parse_errors) == (3, 3, 2)
+    assert (handler.prompt_tokens, handler.completion_tokens) == (3400, 95)
+    assert AGENT_PARSE_ERRORS.value(mode=mode) == 2
+    assert f'agent_llm_calls_per_request_sum{{mode="{mode}"}} 3.0' in samples(LLM_CALLS_PER_REQUEST, mode)
+    assert f'agent_prompt_tokens_per_request_sum{{mode="{mode}"}} 3400.0' in samples(PROMPT_TOKENS_PER_REQUEST, mode)
+    assert (f'agent_completion_tokens_per_request_bucket{{mode="{mode}",le="256.0"}} 1'
+            in samples(COMPLETION_TOKENS_PER_REQUEST, mode))
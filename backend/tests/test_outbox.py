@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.customer_api import DB_PATH, _enqueue_notification, init_db
+from app.outbox import OutboxDispatcher, SmtpSender
+from devtools.smtp_sink import SmtpSinkServer
+
+
+@pytest.fixture
+def sink():
+    server = SmtpSinkServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def db(workdir):
+    init_db()
+    return workdir
+
+
+def enqueue(*recipients):
+    conn = sqlite3.connect(DB_PATH)
+    for i, recipient in enumerate(recipients):
+        _enqueue_notification(conn.cursor(), f"customer-{i}", recipient)
+    conn.commit()
+    conn.close()
+
+
+def rows():
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return conn.execute("SELECT id, status, attempts, next_attempt_at, claimed_by, last_error "
+                            "FROM notification_outbox ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def dispatcher(sink, **kwargs) -> OutboxDispatcher:
+    return OutboxDispatcher(sender=SmtpSender("127.0.0.1", sink.server_address[1], timeout=5), **kwargs)
+
+
+def test_delivers_batch_over_smtp(db, sink):
+    enqueue("herlev@cloudaibank.com", "aarhus@cloudaibank.com")
+    assert dispatcher(sink).dispatch_once() == 2
+    assert [r[1] for r in rows()] == ["sent", "sent"]
+    assert sorted(m["to"][0] for m in sink.messages) == ["<aarhus@cloudaibank.com>", "<herlev@cloudaibank.com>"]
+
+
+def test_failed_delivery_is_retried_with_backoff_then_dead(db, sink):
+    sink.fail_rate = 1.0
+    enqueue("herlev@cloudaibank.com")
+    d = dispatcher(sink, base_backoff=2.0, max_attempts=2)
+
+    before = time.time()
+    d.dispatch_once()
+    _, status, attempts, next_at, claimed_by, error = rows()[0]
+    assert (status, attempts, claimed_by) == ("pending", 1, None)
+    assert next_at >= before + 2.0 and "451" in error
+    assert d.dispatch_once() == 0  # not due yet
+
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("UPDATE notification_outbox SET next_attempt_at = 0")
+    conn.commit()
+    conn.close()
+    d.dispatch_once()
+    assert rows()[0][1:3] == ("dead", 2)
+
+
+def test_expired_claim_is_reclaimed_and_late_result_ignored(db, sink):
+    enqueue("herlev@cloudaibank.com")
+    slow = dispatcher(sink, claim_timeout=0.0)
+    claimed = slow.claim_batch()
+    assert len(claimed) == 1
+
+    time.sleep(0.01)
+    fresh = dispatcher(sink, claim_timeout=0.0)
+    row_id, customer_key, recipient, attempts = claimed[0]
+    assert fresh.claim_batch() == [(row_id, customer_key, recipient, attempts + 1)]  # stale claim taken over
+    assert rows()[0][4] == fresh.worker_id
+
+    # The first dispatcher finishes late: its result must not touch the row
+    slow.claim_batch = lambda: claimed
+    slow.dispatch_once()
+    _, status, attempts, _, claimed_by, _ = rows()[0]
+    assert (status, attempts, claimed_by) == ("sending", 1, fresh.worker_id)
+
+
+def test_claim_that_keeps_expiring_ends_dead(db, sink):
+    enqueue("herlev@cloudaibank.com")
+    for _ in range(3):  # e.g. the dispatcher is killed while delivering this row, every time
+        assert len(dispatcher(sink, claim_timeout=0.0, max_attempts=3).claim_batch()) == 1
+        time.sleep(0.01)
+    assert rows()[0][1:3] == ("sending", 2)
+
+    assert dispatcher(sink, claim_timeout=0.0, max_attempts=3).claim_batch() == []
+    _, status, attempts, _, claimed_by, error = rows()[0]
+    assert (status, attempts, claimed_by, error) == ("dead", 3, None, "claim expired")
+
+
+def test_bad_message_does_not_stop_the_batch(db, sink):
+    enqueue("bad\naddress@x", "herlev@cloudaibank.com")
+    dispatcher(sink).dispatch_once()
+    statuses = [r[1] for r in rows()]
+    assert statuses == ["pending", "sent"]
+
+
+def test_sender_exception_reschedules_rows(db):
+    class Broken:
+        def send_batch(self, rows):
+            raise UnicodeEncodeError("ascii", "ø", 0, 1, "bad")
+
+    enqueue("herlev@cloudaibank.com")
+    OutboxDispatcher(sender=Broken()).dispatch_once()
+    assert rows()[0][1:3] == ("pending", 1)
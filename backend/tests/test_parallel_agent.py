@@ -0,0 +1,38 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from langchain_core.agents import AgentStep
+
+from app.parallel_agent import BatchedAgentAction, ParallelAgentExecutor
+
+
+def run_batch(tools):
+    running, log, lock = set(), [], threading.Lock()
+
+    def perform(name_to_tool_map, color_mapping, action, run_manager):
+        with lock:
+            log.append((action.tool_input, sorted(running)))
+            running.add(action.tool_input)
+        time.sleep(0.05)
+        with lock:
+            running.discard(action.tool_input)
+        return AgentStep(action=action, observation=action.tool_input)
+
+    actions = [BatchedAgentAction(tool=t, tool_input=f"{t}-{i}", log="", batch_index=i, batch_size=len(tools))
+               for i, t in enumerate(tools)]
+    executor = SimpleNamespace(max_parallel_tools=4, _perform_agent_action=perform)
+    steps = ParallelAgentExecutor._perform_batch(executor, {}, {}, actions, None)
+    return [s.observation for s in steps], dict(log)
+
+
+def test_independent_actions_run_concurrently():
+    observations, seen = run_batch(["registry_lookup", "vector_rag", "branch_lookup"])
+    assert observations == ["registry_lookup-0", "vector_rag-1", "branch_lookup-2"]
+    assert any(seen.values())
+
+
+def test_customer_create_runs_alone_after_the_others():
+    observations, seen = run_batch(["customer_create", "vector_rag", "customer_create", "registry_lookup"])
+    assert observations == ["customer_create-0", "vector_rag-1", "customer_create-2", "registry_lookup-3"]
+    assert seen["customer_create-0"] == [] and seen["customer_create-2"] == []
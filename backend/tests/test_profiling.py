@@ -0,0 +1,25 @@
+from app.profiling import is_admin, profile_request, profile_store, pseudonym, should_profile, span
+
+
+def test_admin_check_fails_closed():
+    assert not is_admin(None, admin_token="")
+    assert not is_admin("", admin_token="")
+    assert not is_admin("guess", admin_token="s3cret")
+    assert is_admin("s3cret", admin_token="s3cret")
+
+
+def test_profile_header_needs_admin():
+    assert should_profile("1", header_allowed=True)
+    assert not should_profile("1", header_allowed=False)
+    assert not should_profile(None)
+
+
+def test_profile_summary_hides_session_id():
+    with profile_request("chat", session=pseudonym("alice-session")) as profile:
+        with span("work", "code"):
+            pass
+    summary = profile_store.list()[0]
+    assert summary["id"] == profile.id
+    assert "alice-session" not in str(profile.to_dict())
+    assert summary["session"] == pseudonym("alice-session") and len(summary["session"]) == 12
+    assert summary["spans"] == 1
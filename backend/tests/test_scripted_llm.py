@@ -0,0 +1,33 @@
+from devtools.scripted_llm import ScriptedOnboardingLLM, is_terminal
+
+
+def prompt(history: str, user: str, scratchpad: str = "") -> str:
+    return f"TODAY: 2026-01-01\nHISTORY: {history}\nUSER: {user}\nTHOUGHTS: {scratchpad}"
+
+
+def test_yes_after_underage_answer_does_not_create_customer():
+    history = ("[HumanMessage(content='DK 1304802151'), "
+               "AIMessage(content='Sorry, applicants must be 18 or older')]")
+    text = ScriptedOnboardingLLM().respond(prompt(history, "Yes"))
+    assert "customer_create" not in text
+    assert "Final Answer:" in text
+
+
+def test_yes_in_open_journey_creates_customer():
+    history = ("[HumanMessage(content='SE 199001011234'), "
+               "AIMessage(content='Do you wish to proceed with registration? (Yes/No)')]")
+    text = ScriptedOnboardingLLM().respond(prompt(history, "Yes"))
+    assert "Action: customer_create" in text
+    assert '"nationalId": "199001011234"' in text
+
+
+def test_fi_id_with_letters_is_recognized():
+    text = ScriptedOnboardingLLM().respond(prompt("[]", "FI 020589A000X"))
+    assert "Action: registry_lookup" in text
+    assert "Action Input: FI 020589A000X" in text
+
+
+def test_is_terminal():
+    assert is_terminal("Account created successfully (Customer ID: x)")
+    assert is_terminal("Sorry, applicants must be 18 or older")
+    assert not is_terminal("In which country do you reside and what is your national ID number?")
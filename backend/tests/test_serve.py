@@ -0,0 +1,54 @@
+import serve
+from serve import RESTART_BACKOFF_MAX, format_report, memory_report, parse_args, restart_delay, smaps_rollup
+
+SMAPS = """55d0c8a00000-7ffd8b5f2000 ---p 00000000 00:00 0                          [rollup]
+Rss:              204800 kB
+Pss:              102400 kB
+Pss_Anon:          51200 kB
+Shared_Clean:     153600 kB
+Shared_Dirty:          0 kB
+Private_Clean:     10240 kB
+Private_Dirty:     40960 kB
+Swap:                  0 kB
+"""
+
+
+def test_restart_backoff_doubles_and_caps():
+    assert restart_delay(0) == 0
+    assert [restart_delay(n) for n in (1, 2, 3)] == [1, 2, 4]
+    assert restart_delay(50) == RESTART_BACKOFF_MAX
+
+
+def test_workers_get_their_own_port_unless_shared_socket_is_asked_for():
+    assert parse_args(["--workers", "4"]).shared_socket is False
+    assert parse_args(["--workers", "4", "--shared-socket"]).shared_socket is True
+
+
+def test_smaps_rollup(tmp_path):
+    (tmp_path / "42").mkdir()
+    (tmp_path / "42" / "smaps_rollup").write_text(SMAPS)
+    m = smaps_rollup(42, proc_dir=str(tmp_path))
+    assert m["Rss"] == 200 * 2**20 and m["Pss"] == 100 * 2**20
+    assert m["Private_Dirty"] == 40 * 2**20
+    assert "Pss_Anon" not in m
+    assert smaps_rollup(43, proc_dir=str(tmp_path)) == {}  # exited process
+
+
+def test_memory_report_and_format(monkeypatch):
+    mib = 2**20
+    totals = {
+        1: {"Rss": 300 * mib, "Pss": 120 * mib, "Shared_Clean": 250 * mib, "Private_Dirty": 50 * mib},
+        2: {"Rss": 280 * mib, "Pss": 100 * mib, "Shared_Clean": 240 * mib, "Shared_Dirty": 10 * mib,
+            "Private_Clean": 10 * mib, "Private_Dirty": 20 * mib},
+    }
+    monkeypatch.setattr(serve, "smaps_rollup", lambda pid: totals.get(pid, {}))
+    rows = memory_report({1: "master", 2: "worker-0", 3: "worker-1"})  # 3 has exited
+
+    assert [r["name"] for r in rows] == ["master", "worker-0"]
+    assert rows[1] == {"pid": 2, "name": "worker-0", "rss": 280 * mib, "pss": 100 * mib,
+                       "shared": 250 * mib, "private": 30 * mib, "swap": 0}
+
+    lines = format_report(rows).splitlines()
+    assert lines[0].split() == ["process", "pid", "rss", "MB", "pss", "MB", "shared", "MB", "private", "MB"]
+    assert lines[2].split() == ["worker-0", "2", "280.0", "100.0", "250.0", "30.0"]
+    assert lines[-1].split() == ["total", "580.0", "220.0", "80.0"]
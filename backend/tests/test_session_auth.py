@@ -0,0 +1,37 @@
+import pytest
+
+from app.session_auth import NotSessionOwner, SessionTokens, UnknownSession
+
+
+def test_first_turn_issues_the_token_and_later_requests_need_it():
+    tokens = SessionTokens()
+    token = tokens.start_or_check("s1", None)
+    assert token
+    assert tokens.start_or_check("s1", token) is None
+    with pytest.raises(NotSessionOwner):
+        tokens.start_or_check("s1", None)  # someone else reusing the session id
+    with pytest.raises(NotSessionOwner):
+        tokens.start_or_check("s1", "guess")
+
+
+def test_session_endpoints_need_a_started_session_and_its_token():
+    tokens = SessionTokens()
+    with pytest.raises(UnknownSession):
+        tokens.check("victim", None)  # no uploading (or deleting) before the owner's first turn
+    token = tokens.start_or_check("victim", None)
+    with pytest.raises(NotSessionOwner):
+        tokens.check("victim", None)
+    with pytest.raises(NotSessionOwner):
+        tokens.check("victim", "guess")
+    tokens.check("victim", token)
+
+
+def test_revoke():
+    tokens = SessionTokens()
+    token = tokens.start_or_check("s1", None)
+    tokens.revoke("s1", "other")  # only the issued token is revoked
+    tokens.check("s1", token)
+    tokens.revoke("s1")
+    with pytest.raises(UnknownSession):
+        tokens.check("s1", token)
+    assert tokens.start_or_check("s1", None) != token
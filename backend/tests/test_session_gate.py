@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from app.session_gate import SessionBusyError, SessionGate
+
+
+def test_turns_of_one_session_do_not_overlap():
+    async def main():
+        gate, running, overlaps = SessionGate(), set(), []
+
+        async def turn(n):
+            overlaps.append(bool(running))
+            running.add(n)
+            await asyncio.sleep(0.01)
+            running.discard(n)
+            return n
+
+        return await asyncio.gather(*(gate.run("s", f"msg {n}", lambda n=n: turn(n)) for n in range(4))), overlaps
+
+    results, overlaps = asyncio.run(main())
+    assert results == [0, 1, 2, 3] and not any(overlaps)
+
+
+def test_duplicate_message_is_coalesced():
+    async def main():
+        gate, calls = SessionGate(), []
+
+        async def turn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        return await asyncio.gather(gate.run("s", "Yes", turn), gate.run("s", "  Yes ", turn)), calls
+
+    results, calls = asyncio.run(main())
+    assert results == ["answer", "answer"] and len(calls) == 1
+
+
+def test_waiter_reruns_when_the_first_request_is_cancelled():
+    async def main():
+        gate, calls = SessionGate(), []
+
+        async def turn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return f"answer {len(calls)}"
+
+        first = asyncio.create_task(gate.run("s", "Yes", turn))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(gate.run("s", "Yes", turn))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, calls
+
+    result, calls = asyncio.run(main())
+    assert result == "answer 2" and len(calls) == 2
+
+
+def test_cancelled_waiter_does_not_rerun():
+    async def main():
+        gate = SessionGate()
+
+        async def turn():
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        first = asyncio.create_task(gate.run("s", "Yes", turn))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(gate.run("s", "Yes", turn))
+        await asyncio.sleep(0.01)
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        return await first
+
+    assert asyncio.run(main()) == "answer"
+
+
+def test_queue_limit():
+    async def main():
+        gate = SessionGate(max_queue=1)
+
+        async def turn():
+            await asyncio.sleep(0.02)
+
+        tasks = [asyncio.create_task(gate.run("s", f"m{n}", turn)) for n in range(3)]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert isinstance(results[2], SessionBusyError) and results[:2] == [None, None]
@@ -0,0 +1,88 @@
+import json
+
+from langchain_core.agents import AgentAction
+
+from app.token_budget import (COMPRESSED_OBSERVATION_TOKENS, TOOL_BUDGETS, compress_observation, estimate_tokens,
+                              format_scratchpad)
+
+
+def hits(n, query="q"):
+    return json.dumps({"query": query,
+                       "hits": [{"source": f"doc{i}.pdf", "text": "word " * 200} for i in range(n)]})
+
+
+def steps(n):
+    return [(AgentAction("vector_rag", f"q{i}", f"Thought: look up {i}\nAction: vector_rag\nAction Input: q{i}"), hits(5, f"q{i}"))
+            for i in range(n)]
+
+
+def test_compressed_json_stays_valid_with_markers():
+    out = compress_observation(hits(20), 80)
+    value = json.loads(out)
+    assert estimate_tokens(out) <= 80
+    assert value["query"] == "q"
+    assert value["hits"][-1].startswith("…[")
+    assert value["hits"][0]["text"].endswith("…[truncated]")
+
+
+def test_plain_text_is_cut_with_marker():
+    out = compress_observation("abc " * 500, 20)
+    assert out.endswith("…[truncated]") and estimate_tokens(out) <= 24
+
+
+def test_small_observation_untouched():
+    assert compress_observation('{"verified": false}', 80) == '{"verified": false}'
+
+
+def test_scratchpad_is_append_only_between_boundary_moves():
+    history = steps(12)
+    moves = 0
+    for n in range(1, len(history)):
+        before, after = format_scratchpad(history[:n]), format_scratchpad(history[:n + 1])
+        if not after.startswith(before):
+            moves += 1
+    assert moves == 5  # boundary moved at 3, 5, 7, 9 and 11 steps (stride 2, keep 1)
+
+
+def test_typical_onboarding_turn_stays_within_budget():
+    registry = json.dumps({"status": "ok", "customer_status": "new", "customerKey": None, "registry": {
+        "firstName": "Anna", "lastName": "Jensen", "dateOfBirth": "1990-01-01", "gender": "Female",
+        "address": "Tokkerupvej 35, 2730 Herlev", "maritalStatus": "Single", "citizenship": ["Denmark"],
+        "residencePermitNumber": False, "country": "DK", "nationalId": "0101901234",
+        "externalKeyType": "DanishNationalId"}})
+    rag = json.dumps({"status": "ok", "hits": [{"source": f"terms{i}.pdf", "text": "policy " * 210}
+                                                for i in range(2)]})  # ~ the vector_rag budget
+    branch = json.dumps({"status": "ok", "hits": [{"text": "Herlev branch " * 100, "email": "herlev@bank.dk"}]})
+    created = json.dumps({"status": "created", "customerKey": "c-1", "branchEmail": "herlev@bank.dk"})
+    turn = [(AgentAction(tool, tool_input, f"Thought: next\nAction: {tool}\nAction Input: {tool_input}"), obs)
+            for tool, tool_input, obs in [("vector_rag", "account terms", rag), ("registry_lookup", "DK 0101901234", registry),
+                                          ("branch_lookup", "DK 2730", branch), ("customer_create", "{...}", created)]]
+
+    # The largest tool budget verbatim, the rest compressed, plus the Thought/Action lines
+    budget = max(TOOL_BUDGETS.values()) + len(turn) * (COMPRESSED_OBSERVATION_TOKENS + 20)
+    for n in range(1, len(turn) + 1):
+        assert estimate_tokens(format_scratchpad(turn[:n])) <= budget, n
+    # steps 1-2 are compressed by the last step, which only appends to step 3's scratchpad
+    assert rag not in format_scratchpad(turn[:3])
+    assert format_scratchpad(turn).startswith(format_scratchpad(turn[:3]))
+
+
+def test_recent_steps_verbatim():
+    history = steps(3)
+    pad = format_scratchpad(history, keep_recent=1, stride=1)
+    assert pad.count(history[0][1]) == 0
+    assert pad.count(history[2][1]) == 1
+
+
+def test_actions_of_one_llm_call_are_kept_together():
+    from app.parallel_agent import BatchedAgentAction
+
+    history = []
+    for i in range(3):
+        for j in range(3):
+            action = BatchedAgentAction(tool="vector_rag", tool_input=f"q{i}{j}", log=f"Action: vector_rag {i}{j}",
+                                        batch_index=j, batch_size=3)
+            history.append((action, hits(5, f"q{i}{j}")))
+    pad = format_scratchpad(history, keep_recent=2, stride=1)
+    # first LLM call compressed as a whole, the last two verbatim
+    assert [pad.count(obs) for _, obs in history] == [0] * 3 + [1] * 6
@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+try:
+    from app.tools import get_structured_tools  # loads the embedding model
+except (ImportError, OSError) as e:
+    pytest.skip(f"embedding model unavailable: {e}", allow_module_level=True)
+
+from app.metrics import TOOL_ARGS_ERROR_PREFIX
+
+
+@pytest.fixture
+def registry_lookup(workdir):
+    return next(t for t in get_structured_tools() if t.name == "registry_lookup")
+
+
+def test_fi_id_keeps_its_letters_in_tool_calling_mode(registry_lookup):
+    result = json.loads(registry_lookup.invoke({"country": "FI", "nationalId": "020589-a000x"}))
+    assert result["status"] == "ok", result
+    assert result["registry"]["nationalId"] == "020589A000X"
+    assert result["registry"]["externalKeyType"] == "FinnishNationalId"
+    assert result["registry"]["firstName"] == "Matti"
+
+
+def test_invalid_arguments_are_returned_to_the_model(registry_lookup):
+    observation = registry_lookup.invoke({"country": "DE", "nationalId": "123"})
+    assert observation.startswith(TOOL_ARGS_ERROR_PREFIX)
@@ -8,6 +8,8 @@ function App() {
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
   const [sessionId] = useState(() => crypto.randomUUID());
+  // Returned by the session's first turn; required on every later request
+  const sessionToken = useRef(null);
   const messagesEndRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -31,7 +33,12 @@ function App() {
       const response = await axios.post(`${API_URL}/chat`, {
         session_id: sessionId,
         message: userMessage
+      }, {
+        headers: sessionToken.current ? { 'X-Session-Token': sessionToken.current } : {}
       });
+      if (response.data.session_token) {
+        sessionToken.current = response.data.session_token;
+      }
 
       setMessages(prev => [...prev, { 
         role: 'assistant', 